@@ -8,7 +8,7 @@ from user_profile.views import (ProfileView,
                                 UploadPhotoView, RequestPasswordResetEmail, UserReportCreateView
                                 )
 
-from task.views import (TaskCategoryListView, TaskListView, TaskViewSet, TaskReviewListView, 
+from task.views import (TaskCategoryListView, TaskListView, TaskViewSet, TaskReviewListView, RecommendedTaskListView,
                         TaskApplicantCreateView, TaskListApplicantView, PerformerTaskViewSet, TaskReviewViewSet)
 from chat.views import ChatMessageListView, ChatMessageRetrieveView, ChatSessionListCreateView, SearchChatUserListView
 
@@ -38,6 +38,9 @@ urlpatterns = [
      path('task/list',
          TaskListView.as_view(),
          name='task-list'),   
+     path('task/recommended',
+         RecommendedTaskListView.as_view(),
+         name='task-recommended'),
      path('', include(router.urls)),
      path('task/review/list',
          TaskReviewListView.as_view(),
@@ -1,16 +1,35 @@
+import asyncio
 import json
-from datetime import timedelta
+import time
+from collections import deque
 from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.utils import timezone
 from chat.models import ChatMessage, ChatSession
+from chat.notification import notifyChatMessage
 from user_profile.models import UserProfile
 
+# Identical messages from the same sender within this many seconds are dropped
+DUPLICATE_WINDOW_SECONDS = 2
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route'].get('kwargs', {}).get('room_name')
         if self.room_name:
             self.room_group_name = f"chat_{self.room_name}"
+            # Per-connection caches, so a message only costs its INSERT
+            self.sessions = {}
+            self.profiles = {}
+            self.recent_messages = deque()
+            self.push_tasks = set()
+
+            # sync_to_async, not database_sync_to_async: consumer calls share the process's one sync
+            # thread and its connection, close_old_connections would reopen it per call (CONN_MAX_AGE=0)
+            session = await sync_to_async(self.load_session)(room_name=self.room_name)
+            if session is not None:
+                self.cache_session(session)
+
             await self.channel_layer.group_add(self.room_group_name, self.channel_name)
             await self.accept()
         else:
@@ -19,6 +38,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         if hasattr(self, 'room_group_name'):
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if getattr(self, 'push_tasks', None):
+            await asyncio.gather(*self.push_tasks, return_exceptions=True)
 
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
@@ -27,24 +48,18 @@ class ChatConsumer(AsyncWebsocketConsumer):
         session_id = text_data_json["id"]
 
         if message and hasattr(self, 'room_group_name'):
-            # Fetch chat session and user profile
-            chat_session = await sync_to_async(ChatSession.objects.get)(pk=session_id)
-            user = await sync_to_async(UserProfile.objects.get)(user__username=username)
-
-            # Check for duplicates within a short time window
-            time_threshold = timezone.now() - timedelta(seconds=2)
-            duplicate_message_exists = await sync_to_async(
-                ChatMessage.objects.filter(
-                    chat_session=chat_session,
-                    user_profile=user,
-                    message=message,
-                    timestamp__gte=time_threshold  # Avoid duplicates within 2 seconds
-                ).exists
-            )()
-
-            if not duplicate_message_exists:
+            # Session and sender come from the connection cache, loaded at most once
+            chat_session = self.sessions.get(int(session_id))
+            if chat_session is None:
+                chat_session = self.cache_session(await sync_to_async(self.load_session)(pk=session_id))
+            user = self.profiles.get(username)
+            if user is None:
+                user = self.profiles[username] = await sync_to_async(UserProfile.objects.select_related('user').get)(user__username=username)
+
+            chat_message = None
+            if not self.is_duplicate(chat_session.pk, username, message):
                 # Save the message if it's not a duplicate
-                await sync_to_async(ChatMessage.objects.create)(
+                chat_message = await sync_to_async(ChatMessage.objects.create)(
                     chat_session=chat_session, user_profile=user, message=message
                 )
 
@@ -58,6 +73,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }
             )
 
+            # Queue the push for the other participant off the receive path, the outbox worker sends it
+            if chat_message is not None:
+                task = asyncio.ensure_future(sync_to_async(notifyChatMessage)(chat_message))
+                self.push_tasks.add(task)
+                task.add_done_callback(self.push_tasks.discard)
+
     async def sendMessage(self, event):
         message = event["message"]
         username = event["username"]
@@ -69,3 +90,27 @@ class ChatConsumer(AsyncWebsocketConsumer):
             "username": username,
             "time_stamp": time_stamp
         }))
+
+    @staticmethod
+    def load_session(**lookup):
+        return ChatSession.objects.select_related('provider__user', 'performer__user').filter(**lookup).first()
+
+    def cache_session(self, session):
+        if session is None:
+            raise ChatSession.DoesNotExist("Chat session does not exist.")
+        self.sessions[session.pk] = session
+        # Participants are the only expected senders
+        for profile in (session.provider, session.performer):
+            self.profiles.setdefault(profile.user.username, profile)
+        return session
+
+    def is_duplicate(self, session_id, username, message):
+        # Recent-message window for this connection, replaces the per-message EXISTS query
+        now = time.monotonic()
+        while self.recent_messages and now - self.recent_messages[0][0] > DUPLICATE_WINDOW_SECONDS:
+            self.recent_messages.popleft()
+        key = (session_id, username, message)
+        if any(recent == key for _, recent in self.recent_messages):
+            return True
+        self.recent_messages.append((now, key))
+        return False
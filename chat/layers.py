@@ -0,0 +1,71 @@
+import socket
+import threading
+
+
+class LocalRedisServer:
+    """
+    Redis stand-in for running the Redis channel layer on one machine.
+    Serves fakeredis over TCP from a background thread, so several worker
+    processes can share it exactly like a real Redis:
+
+        with LocalRedisServer() as redis_url:
+            ...  # point CHANNEL_LAYERS hosts at redis_url
+
+    Needs the fakeredis[lua] development package.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.address = (host, port)
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        from fakeredis import TcpFakeServer
+
+        class Server(TcpFakeServer):
+            def get_request(self):
+                # Replies are written in small pieces; without TCP_NODELAY every
+                # pipelined command waits out the peer's delayed ACK (~40ms)
+                request, address = super().get_request()
+                request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                return request, address
+
+        self.server = Server(self.address, server_type="redis")
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def redis_channel_layer(redis_url, **config):
+    # CHANNEL_LAYERS entry for the Redis layer with the project's capacity and expiry policy
+    return {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {**REDIS_LAYER_CONFIG, "hosts": [redis_url], **config},
+    }
+
+
+REDIS_LAYER_CONFIG = {
+    # Messages buffered per channel before sends raise ChannelFull
+    "capacity": 1500,
+    # Seconds an undelivered message is kept before it is dropped
+    "expiry": 10,
+    # Seconds a channel stays in a group without being re-added; must outlive
+    # the longest websocket connection (daphne's default timeout is a day)
+    "group_expiry": 86400,
+    "prefix": "etugal",
+}
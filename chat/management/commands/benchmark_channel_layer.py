@@ -0,0 +1,111 @@
+import asyncio
+import multiprocessing
+import queue
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.layers import LocalRedisServer, redis_channel_layer
+
+GROUP = "chat_benchmark"
+
+
+def make_layer(redis_url, prefix):
+    from channels_redis.core import RedisChannelLayer
+
+    # A prefix of its own, so the run never shares keys with the site's layer or caches
+    return RedisChannelLayer(**redis_channel_layer(redis_url, prefix=prefix)["CONFIG"])
+
+
+def run_worker(redis_url, prefix, ready, results, idle_timeout):
+    # One "daphne worker": joins the group and counts what reaches it
+    async def main():
+        layer = make_layer(redis_url, prefix)
+        channel = await layer.new_channel()
+        await layer.group_add(GROUP, channel)
+        ready.set()
+
+        received, last_received = 0, None
+        while True:
+            try:
+                await asyncio.wait_for(layer.receive(channel), idle_timeout)
+            except asyncio.TimeoutError:
+                break
+            received += 1
+            last_received = time.time()
+        await layer.group_discard(GROUP, channel)
+        await layer.close_pools()
+        results.put((received, last_received))
+
+    asyncio.run(main())
+
+
+class Command(BaseCommand):
+    help = "Measures chat group fan-out throughput (messages/second) across worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Receiving worker processes.")
+        parser.add_argument('--messages', type=int, default=1000, help="Group messages to send.")
+        parser.add_argument('--redis-url', default=None,
+                            help="Redis to benchmark against. Defaults to a local fakeredis stand-in, never REDIS_URL.")
+
+    def handle(self, *args, **options):
+        redis_url = options['redis_url']
+        local_server = None
+        if not redis_url:
+            try:
+                local_server = LocalRedisServer()
+                redis_url = local_server.start()
+            except ImportError:
+                raise CommandError("Pass --redis-url or install fakeredis[lua] for the local stand-in.")
+
+        try:
+            self.run_benchmark(redis_url, options['workers'], options['messages'])
+        finally:
+            if local_server is not None:
+                local_server.stop()
+
+    def run_benchmark(self, redis_url, workers, messages):
+        prefix = f"etugal-bench-{uuid.uuid4().hex}"
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        processes = []
+        for _ in range(workers):
+            ready = context.Event()
+            process = context.Process(target=run_worker, args=(redis_url, prefix, ready, results, 2.0))
+            process.start()
+            if not ready.wait(30):
+                raise CommandError("Worker did not join the group in time.")
+            processes.append(process)
+
+        async def send():
+            layer = make_layer(redis_url, prefix)
+            for i in range(messages):
+                await layer.group_send(GROUP, {"type": "sendMessage", "message": f"message {i}", "username": "benchmark"})
+            # Not flush(): that deletes every key under the prefix, undelivered messages included
+            await layer.close_pools()
+
+        started = time.time()
+        asyncio.run(send())
+        sent = time.time() - started
+
+        received, finished = 0, started
+        for _ in processes:
+            try:
+                count, last_received = results.get(timeout=60)
+            except queue.Empty:
+                raise CommandError("Worker did not report back.")
+            received += count
+            finished = max(finished, last_received or started)
+        for process in processes:
+            process.join()
+
+        elapsed = max(finished - started, 1e-9)
+        expected = messages * workers
+        self.stdout.write(f"Layer:       {redis_url}")
+        self.stdout.write(f"Workers:     {workers}")
+        self.stdout.write(f"Sent:        {messages} group messages in {sent:.3f}s ({messages / max(sent, 1e-9):.0f}/s)")
+        self.stdout.write(f"Delivered:   {received}/{expected} in {elapsed:.3f}s ({received / elapsed:.0f} messages/s across workers)")
+        if received < expected:
+            self.stdout.write(self.style.WARNING(f"Dropped:     {expected - received} (channel capacity or expiry reached)"))
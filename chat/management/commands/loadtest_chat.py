@@ -0,0 +1,85 @@
+import asyncio
+import json
+import time
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.models import ChatMessage, ChatSession
+from chat.routing import websocket_urlpatterns
+from core.benchmark import QueryCounter, throwaway_database
+from task.models import Task, TaskCategory
+from user_profile.models import UserProfile
+
+
+def seed_rooms(rooms):
+    category = TaskCategory.objects.create(title="Load test")
+    sessions = []
+    for i in range(rooms):
+        provider, performer = [
+            UserProfile.objects.create(
+                user=User.objects.create(username=f"{role}{i}", first_name=role.title(), last_name=str(i)),
+                address="Legazpi City", contact_number="09170000000",
+            )
+            for role in ("provider", "performer")
+        ]
+        task = Task.objects.create(
+            task_category=category, provider=provider, performer=performer, title="Load test",
+            description="Load test", address="Albay", latitude=13.1391, longitude=123.7438,
+        )
+        sessions.append(ChatSession.objects.create(task=task, room_name=f"load{i}", provider=provider, performer=performer))
+    return sessions
+
+
+class Command(BaseCommand):
+    help = "Load-tests the chat websocket over concurrent rooms and reports DB round-trips per message."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=20, help="Concurrent chat rooms.")
+        parser.add_argument('--messages', type=int, default=25, help="Messages sent per participant in each room.")
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            sessions = seed_rooms(options['rooms'])
+            asyncio.run(self.run_load(sessions, options['messages']))
+
+    async def run_load(self, sessions, messages):
+        application = URLRouter(websocket_urlpatterns)
+        clients = []
+        async with QueryCounter() as connect_queries:
+            for session in sessions:
+                for profile in (session.provider, session.performer):
+                    communicator = WebsocketCommunicator(application, f"/ws/chat/{session.room_name}/")
+                    if not (await communicator.connect())[0]:
+                        raise CommandError(f"Could not connect to {session.room_name}.")
+                    clients.append((communicator, session, profile.user.username))
+
+        async def chat(communicator, session, username):
+            for i in range(messages):
+                await communicator.send_to(text_data=json.dumps({
+                    "message": f"{username} says {i}", "username": username, "id": session.pk,
+                }))
+            # Both participants' messages are echoed to everyone in the room
+            for _ in range(messages * 2):
+                await communicator.receive_from(timeout=30)
+
+        async with QueryCounter() as queries:
+            started = time.time()
+            await asyncio.gather(*(chat(*client) for client in clients))
+            elapsed = time.time() - started
+            # Disconnecting waits for the queued push notifications
+            for communicator, _, _ in clients:
+                await communicator.disconnect()
+
+        sent = len(clients) * messages
+        saved = await ChatMessage.objects.acount()
+        # Everything outside the chat and profile tables is the outbox's transaction
+        message_queries = sum(any(table in sql for table in ('"chat_', '"user_profile_')) for sql in queries.sql)
+        push_queries = queries.count - message_queries
+        self.stdout.write(f"Rooms:       {len(sessions)} ({len(clients)} connections)")
+        self.stdout.write(f"Messages:    {saved}/{sent} saved in {elapsed:.3f}s ({sent / max(elapsed, 1e-9):.0f}/s)")
+        self.stdout.write(f"Connect:     {connect_queries.count / len(clients):.2f} queries per connection")
+        self.stdout.write(f"Receive:     {message_queries / sent:.2f} queries per message")
+        self.stdout.write(f"Push outbox: {push_queries / sent:.2f} queries per message (off the receive path)")
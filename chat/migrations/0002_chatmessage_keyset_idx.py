@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['chat_session', '-timestamp', '-id'], name='chat_msg_keyset_idx'),
+        ),
+    ]
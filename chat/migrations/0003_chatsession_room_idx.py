@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_chatmessage_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['room_name'], name='chat_session_room_idx'),
+        ),
+    ]
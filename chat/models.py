@@ -1,11 +1,27 @@
-import json
 from django.db import models
-from fcm_django.models import FCMDevice
-from firebase_admin.messaging import Message, Notification
 
-from core.base_models import BaseModel
-from task.models import Task
-from user_profile.models import UserProfile
+from core.base_models import BaseModel, model_fields
+from task.models import Task, task_applicants_prefetch, task_only_fields, task_select_related
+from user_profile.models import UserProfile, profile_fields
+
+
+class ChatSessionQuerySet(models.QuerySet):
+    def for_list(self):
+        # Query plan for ChatSessionSerializers, which nests both profiles and the full task
+        return self.select_related(
+            'provider__user', 'performer__user', *task_select_related('task__', detail=True)
+        ).only(
+            *model_fields(ChatSession), *profile_fields('provider__'), *profile_fields('performer__'),
+            *task_only_fields('task__', detail=True)
+        ).prefetch_related(task_applicants_prefetch('task__'))
+
+
+class ChatMessageQuerySet(models.QuerySet):
+    def for_list(self):
+        # Query plan for ChatMessageSerializers
+        return self.select_related('user_profile__user').only(
+            *model_fields(ChatMessage), *profile_fields('user_profile__')
+        )
 
 
 class ChatSession(BaseModel):
@@ -17,9 +33,15 @@ class ChatSession(BaseModel):
     performer = models.ForeignKey(
         UserProfile, on_delete=models.CASCADE, related_name='chat_sessions_performer')
 
+    objects = ChatSessionQuerySet.as_manager()
+
     class Meta:
         unique_together = ['task', 'provider', 'performer']
         ordering = ["-updated_at"]
+        indexes = [
+            # Websocket connect and ChatMessageRetrieveView look rooms up by name
+            models.Index(fields=['room_name'], name='chat_session_room_idx'),
+        ]
 
 
 class ChatMessage(BaseModel):
@@ -29,33 +51,14 @@ class ChatMessage(BaseModel):
     message = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    objects = ChatMessageQuerySet.as_manager()
+
     class Meta:
         ordering = ["-timestamp"]
+        indexes = [
+            # Keyset pages of one chat's history, newest first
+            models.Index(fields=['chat_session', '-timestamp', '-id'], name='chat_msg_keyset_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user_profile.user.username} - {self.timestamp}: {self.message}"
-    
-    def save(self, *args, **kwargs) -> None:
-        receiver = self.user_profile
-        sender = self.chat_session.provider if self.chat_session.provider.user.username != receiver.user.username else self.chat_session.performer
-
-        for device in FCMDevice.objects.all().filter(user=sender.user):
-            data = {
-                "title": "ETugal",
-                "body": self.message,
-                "full_name": sender.user.get_full_name(),
-            }
-            device.send_message(
-                Message(
-                    notification=Notification(
-                        title="Someone message you", body=self.message
-                    ),
-                    data={
-                        "json": json.dumps(data)
-                    },
-                )
-            )
-
-        
-        super(ChatMessage, self).save(*args, **kwargs)
-
@@ -0,0 +1,78 @@
+import json
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from task.models import PushNotification
+from task.notification import PUSH_SETTINGS
+
+
+def notifyChatMessage(chat_message):
+    """
+    Queues a push for the other participant of the chat. Messages that arrive
+    while a push for the same chat is still pending are folded into it, and a
+    new push is held back until the window after the last one has passed, so
+    a burst becomes a single "N new messages" notification per recipient.
+    """
+    session = chat_message.chat_session
+    author = chat_message.user_profile
+    recipient_user_id = session.performer.user_id if author.pk == session.provider_id else session.provider.user_id
+    collapse_key = f"chat:{session.pk}:{recipient_user_id}"
+    window = timedelta(seconds=PUSH_SETTINGS["CHAT_COALESCE_SECONDS"])
+    now = timezone.now()
+
+    # Untried pushes for this chat; rows claimed by the worker already count an attempt
+    pending = PushNotification.objects.filter(collapse_key=collapse_key, status=PushNotification.PENDING, attempts=0)
+
+    def queue():
+        return PushNotification.objects.create(
+            user_id=recipient_user_id,
+            title="Someone message you",
+            body=chat_message.message,
+            data=chat_push_data(author, chat_message.message, 1),
+            collapse_key=collapse_key,
+            next_attempt_at=hold_until(collapse_key, now, window),
+        )
+
+    with transaction.atomic():
+        # Never wait on a row another transaction holds, insert instead
+        push = pending.select_for_update(skip_locked=True).first()
+        if push is None:
+            try:
+                with transaction.atomic():
+                    return queue()
+            except IntegrityError:
+                # The key already has an untried push, locked by a short transaction
+                # (a message being folded in or the worker claiming it): wait for it
+                push = pending.select_for_update().first()
+                if push is None:
+                    # The worker took it, this message gets a push of its own
+                    return queue()
+
+        push.coalesced_count += 1
+        push.body = f"{push.coalesced_count} new messages"
+        push.data = chat_push_data(author, push.body, push.coalesced_count)
+        push.save(update_fields=['coalesced_count', 'body', 'data', 'updated_at'])
+        return push
+
+
+def hold_until(collapse_key, now, window):
+    # A new push waits out the window after the last one sent, or one still in flight
+    last_sent = PushNotification.objects.filter(
+        collapse_key=collapse_key, status=PushNotification.SENT, sent_at__gt=now - window
+    ).order_by('-sent_at').values_list('sent_at', flat=True).first()
+    if last_sent:
+        return last_sent + window
+    in_flight = PushNotification.objects.filter(collapse_key=collapse_key, status=PushNotification.PENDING, attempts__gt=0)
+    return now + window if in_flight.exists() else now
+
+
+def chat_push_data(author, body, count):
+    data = {
+        "title": "ETugal",
+        "body": body,
+        "full_name": author.user.get_full_name(),
+        "count": count,
+    }
+    return {"json": json.dumps(data)}
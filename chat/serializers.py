@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
 from .models import ChatSession, ChatMessage
+from user_profile.models import UserProfile
 from task.serializers import TaskSerializer, TaskProfileSerializer
 
 class ChatMessageSerializers(serializers.ModelSerializer):
@@ -18,4 +19,14 @@ class ChatSessionSerializers(serializers.ModelSerializer):
     class Meta:
         model = ChatSession
         fields = ['task', 'provider', 'performer', 'room_name', 'id', 'created_at', 'updated_at']
-    
\ No newline at end of file
+    
+
+class ChatUserSerializer(serializers.ModelSerializer):
+    # A name search result: the profile's pk and its user's name, nothing that identifies the account
+    first_name = serializers.CharField(source='user.first_name', read_only=True)
+    last_name = serializers.CharField(source='user.last_name', read_only=True)
+    get_full_name = serializers.CharField(source='user.get_full_name', read_only=True)
+
+    class Meta:
+        model = UserProfile
+        fields = ['pk', 'first_name', 'last_name', 'get_full_name']
@@ -1,3 +1,321 @@
-from django.test import TestCase
+import importlib.util
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from chat.consumers import ChatConsumer
+from chat.layers import LocalRedisServer, redis_channel_layer
+from chat.models import ChatMessage, ChatSession
+from chat.notification import notifyChatMessage
+from chat.routing import websocket_urlpatterns
+from core.benchmark import QueryCounter
+from task.models import PushNotification, Task, TaskCategory
+from task.notification import claim_notifications
+from user_profile.models import UserProfile
+from task.tests import build_marketplace, capture_queries, create_profile, create_task, sequential_scans
+
+
+def build_chats(me, tasks=4, applicants=3, messages=3):
+    build_marketplace(me, tasks=tasks, applicants=applicants)
+    for task in Task.objects.filter(performer=me):
+        session = ChatSession.objects.create(task=task, room_name=f"room{task.pk}", provider=task.provider, performer=me)
+        for who in (task.provider, me) * messages:
+            ChatMessage.objects.create(chat_session=session, user_profile=who, message="Hello")
+    return ChatSession.objects.filter(performer=me).first()
+
+
+class ChatQueryTests(TestCase):
+    def query_counts(self, username, **kwargs):
+        me = create_profile(username)
+        session = build_chats(me, **kwargs)
+        client = APIClient()
+        client.force_authenticate(me.user)
+        return {
+            'sessions': capture_queries(client, reverse('api:chat-sessions')),
+            'messages': capture_queries(client, reverse('api:chat-messages'), {'session_id': session.pk}),
+        }
+
+    def test_reports_are_loaded_once_per_list(self):
+        for name, queries in self.query_counts("me").items():
+            with self.subTest(endpoint=name):
+                report_queries = [sql for sql in queries if 'FROM "user_profile_userreport"' in sql]
+                self.assertEqual(len(report_queries), 1, report_queries)
+
+    def test_no_sequential_scans(self):
+        for name, queries in self.query_counts("me").items():
+            with self.subTest(endpoint=name):
+                self.assertEqual(sequential_scans(queries), [])
+
+    def test_query_count_is_constant(self):
+        small = self.query_counts("small", tasks=1, applicants=1, messages=1)
+        large = self.query_counts("large", tasks=12, applicants=4, messages=6)
+        for name in small:
+            with self.subTest(endpoint=name):
+                self.assertEqual(len(small[name]), len(large[name]), large[name])
+
+
+class NameSearchTests(TestCase):
+    def setUp(self):
+        self.me = create_profile("me")
+        self.client = APIClient()
+        self.client.force_authenticate(self.me.user)
+        self.url = reverse('api:chat-sessions-search')
+        self.usernames = {}
+        for username, first, last in [("maria", "María Clara", "dela Cruz"), ("mario", "Mario", "Peña"), ("jose", "Jose", "Rizal")]:
+            profile = create_profile(username)
+            profile.user.first_name, profile.user.last_name = first, last
+            profile.user.save()
+            self.usernames[profile.pk] = username
+
+    def names(self, q):
+        res = self.client.get(self.url, {'q': q})
+        self.assertEqual(res.status_code, 200)
+        return [self.usernames[row['pk']] for row in res.data['results']]
+
+    def test_matches_name_word_prefixes(self):
+        self.assertEqual(sorted(self.names("mar")), ["maria", "mario"])
+        self.assertEqual(self.names("clara"), ["maria"])
+        self.assertEqual(self.names("MAR cr"), ["maria"])
+        # Accents don't matter either way
+        self.assertEqual(self.names("pena"), ["mario"])
+        self.assertEqual(self.names("maría"), ["maria"])
+        self.assertEqual(self.names("rizal jo"), ["jose"])
+
+    def test_results_carry_only_the_users_name(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(self.url, {'q': "jose"})
+        jose = UserProfile.objects.get(user__username="jose")
+        self.assertEqual(res.data['results'], [{
+            'pk': jose.pk, 'first_name': "Jose", 'last_name': "Rizal", 'get_full_name': "Jose Rizal",
+        }])
+        # Emails and usernames aren't even read
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if '"email"' in q['sql'] or '"username"' in q['sql']])
+
+    def test_short_queries_find_nobody(self):
+        self.assertEqual(self.names(""), [])
+        self.assertEqual(self.names("m"), [])
+
+    def test_pages_are_capped(self):
+        for i in range(15):
+            create_profile(f"marco{i}")
+        res = self.client.get(self.url, {'q': "marco", 'page_size': 100})
+        self.assertEqual(res.data['count'], 15)
+        self.assertEqual(len(res.data['results']), 10)
+
+    def test_renames_invalidate_cached_results(self):
+        self.assertEqual(self.names("rizal"), ["jose"])
+        user = UserProfile.objects.get(user__username="jose").user
+        user.last_name = "Mercado"
+        user.save()
+        self.assertEqual(self.names("rizal"), [])
+        self.assertEqual(self.names("merc"), ["jose"])
+
+    def test_repeated_prefix_is_served_from_cache(self):
+        self.names("mar")
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(self.url, {'q': "mar"})
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertIn('max-age=30', res['Cache-Control'])
+        self.assertEqual(self.client.get(self.url, {'q': "mar"}, HTTP_IF_NONE_MATCH=res['ETag']).status_code, 304)
+
+    def test_no_sequential_scans(self):
+        queries = capture_queries(self.client, self.url, {'q': "mar cr"})
+        self.assertEqual(sequential_scans(queries), [])
+
+
+class ChatHistoryKeysetTests(TestCase):
+    def setUp(self):
+        provider, self.me = create_profile("provider"), create_profile("me")
+        task = create_task(provider, TaskCategory.objects.create(title="Repair"))
+        self.session = ChatSession.objects.create(task=task, room_name="room", provider=provider, performer=self.me)
+        for i in range(25):
+            ChatMessage.objects.create(chat_session=self.session, user_profile=provider, message=f"Message {i}")
+        self.client = APIClient()
+        self.client.force_authenticate(self.me.user)
+        self.url = reverse('api:chat-messages')
+
+    def test_scrolls_back_through_history(self):
+        res = self.client.get(self.url, {'session_id': self.session.pk, 'before': ''})
+        messages = []
+        while True:
+            messages += [message['message'] for message in res.data['results']]
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+        self.assertEqual(messages, [f"Message {i}" for i in reversed(range(25))])
+
+    def test_after_returns_new_messages(self):
+        newest = self.client.get(self.url, {'session_id': self.session.pk, 'before': ''}).data
+        newer_url = self.client.get(newest['next']).data['previous']
+        res = self.client.get(newer_url).data
+        self.assertEqual([m['message'] for m in res['results']], [m['message'] for m in newest['results']])
+        self.assertIsNone(res['previous'])
+
+        ChatMessage.objects.create(chat_session=self.session, user_profile=self.me, message="Newer")
+        res = self.client.get(self.client.get(newer_url).data['previous']).data
+        self.assertEqual([m['message'] for m in res['results']], ["Newer"])
+
+
+class ChatPushTests(TestCase):
+    def setUp(self):
+        self.provider = create_profile("provider")
+        self.performer = create_profile("performer")
+        task = create_task(self.provider, TaskCategory.objects.create(title="Repair"))
+        self.session = ChatSession.objects.create(task=task, room_name="room", provider=self.provider, performer=self.performer)
+
+    def send(self, author, text="Hello"):
+        return notifyChatMessage(ChatMessage.objects.create(chat_session=self.session, user_profile=author, message=text))
+
+    def test_push_goes_to_the_other_participant(self):
+        push = self.send(self.provider)
+        self.assertEqual(push.user, self.performer.user)
+        self.assertEqual(push.body, "Hello")
+        self.assertEqual(json.loads(push.data['json'])['full_name'], self.provider.user.get_full_name())
+        self.assertLessEqual(push.next_attempt_at, timezone.now())
+
+    def test_burst_is_coalesced(self):
+        for _ in range(3):
+            self.send(self.provider)
+        self.send(self.performer)
+        push = PushNotification.objects.get(user=self.performer.user)
+        self.assertEqual(push.coalesced_count, 3)
+        self.assertEqual(push.body, "3 new messages")
+        self.assertEqual(json.loads(push.data['json'])['count'], 3)
+        self.assertEqual(PushNotification.objects.filter(user=self.provider.user).count(), 1)
+
+    def test_next_push_waits_for_the_window(self):
+        push = self.send(self.provider)
+        sent_at = timezone.now()
+        PushNotification.objects.filter(pk=push.pk).update(status=PushNotification.SENT, sent_at=sent_at)
+        later = self.send(self.provider)
+        self.assertNotEqual(later.pk, push.pk)
+        self.assertEqual(later.next_attempt_at, sent_at + timedelta(seconds=10))
+
+    def test_pushes_in_flight_are_left_alone(self):
+        push = self.send(self.provider)
+        PushNotification.objects.filter(pk=push.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(claim_notifications(), [push])
+        # The worker is sending it: the next message is queued behind it, not folded in
+        later = self.send(self.provider)
+        self.assertNotEqual(later.pk, push.pk)
+        self.assertGreater(later.next_attempt_at, timezone.now())
+        self.assertEqual(self.send(self.provider).pk, later.pk)
+
+    def test_one_untried_push_per_chat(self):
+        push = self.send(self.provider)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PushNotification.objects.create(user=push.user, title="Dup", body="Dup", collapse_key=push.collapse_key)
+
+    async def test_consumer_saves_broadcasts_and_queues(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/chat/room/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_to(text_data=json.dumps({
+            "message": "Hi there", "username": self.provider.user.username, "id": self.session.pk,
+        }))
+        response = json.loads(await communicator.receive_from())
+        self.assertEqual(response["message"], "Hi there")
+        await communicator.disconnect()
+
+        self.assertEqual(await ChatMessage.objects.filter(chat_session=self.session).acount(), 1)
+        push = await PushNotification.objects.aget(user_id=self.performer.user_id)
+        self.assertEqual(push.body, "Hi there")
+
+
+    async def test_consumer_writes_once_per_message(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/chat/room/")
+        self.assertTrue((await communicator.connect())[0])
+        async with QueryCounter() as queries:
+            for text in ("One", "Two", "Two"):
+                await communicator.send_to(text_data=json.dumps({
+                    "message": text, "username": self.performer.user.username, "id": self.session.pk,
+                }))
+                self.assertEqual(json.loads(await communicator.receive_from())["message"], text)
+        await communicator.disconnect()
+
+        # Session and sender were loaded at connect, the repeat is dropped without a query
+        chat_queries = [sql for sql in queries.sql if '"chat_' in sql or '"user_profile_' in sql]
+        self.assertEqual(len(chat_queries), 2, chat_queries)
+        self.assertTrue(all(sql.startswith('INSERT INTO "chat_chatmessage"') for sql in chat_queries))
+        self.assertEqual(await ChatMessage.objects.filter(chat_session=self.session).acount(), 2)
+
+
+class SecondWorkerConsumer(ChatConsumer):
+    # Same consumer bound to another layer connection, like a second daphne process
+    channel_layer_alias = "worker2"
+
+
+HAS_REDIS_STAND_IN = all(importlib.util.find_spec(name) for name in ("fakeredis", "lupa", "channels_redis"))
+
+
+@skipUnless(HAS_REDIS_STAND_IN, "fakeredis[lua] and channels_redis are required")
+class MultiWorkerChatTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.redis = LocalRedisServer()
+        redis_url = cls.redis.start()
+        cls.layers = override_settings(CHANNEL_LAYERS={
+            "default": redis_channel_layer(redis_url),
+            "worker2": redis_channel_layer(redis_url),
+        })
+        cls.layers.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.layers.disable()
+        cls.redis.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.provider = create_profile("provider")
+        self.performer = create_profile("performer")
+        task = create_task(self.provider, TaskCategory.objects.create(title="Repair"))
+        self.session = ChatSession.objects.create(task=task, room_name="room", provider=self.provider, performer=self.performer)
+
+    async def test_group_message_reaches_other_worker(self):
+        first = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/chat/room/")
+        second = WebsocketCommunicator(
+            URLRouter([path("ws/chat/<str:room_name>/", SecondWorkerConsumer.as_asgi())]), "/ws/chat/room/"
+        )
+        self.assertTrue((await first.connect())[0])
+        self.assertTrue((await second.connect())[0])
+
+        await first.send_to(text_data=json.dumps({
+            "message": "Across workers", "username": self.provider.user.username, "id": self.session.pk,
+        }))
+        for communicator in (first, second):
+            response = json.loads(await communicator.receive_from(timeout=5))
+            self.assertEqual(response["message"], "Across workers")
+        await first.disconnect()
+        await second.disconnect()
+
+    def test_benchmark_across_processes(self):
+        out = StringIO()
+        call_command("benchmark_channel_layer", workers=2, messages=20, redis_url=self.redis.url, stdout=out)
+        self.assertIn("Delivered:   40/40", out.getvalue())
+
+    def test_benchmark_leaves_other_keys_alone(self):
+        import redis
+
+        client = redis.Redis.from_url(self.redis.url)
+        client.set("etugal-cache:key", "kept")
+        client.set("etugal:group:room", "kept")
+        # REDIS_URL is never used by the benchmark, only an explicit --redis-url
+        with override_settings(REDIS_URL="redis://127.0.0.1:1/0"):
+            call_command("benchmark_channel_layer", workers=1, messages=5, stdout=StringIO())
+        call_command("benchmark_channel_layer", workers=1, messages=5, redis_url=self.redis.url, stdout=StringIO())
+        self.assertEqual(client.mget("etugal-cache:key", "etugal:group:room"), [b"kept", b"kept"])
+        client.delete("etugal-cache:key", "etugal:group:room")
+        client.close()
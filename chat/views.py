@@ -2,13 +2,17 @@ from django.shortcuts import render, redirect
 from rest_framework import generics, permissions, response, status, exceptions
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from user_profile.models import UserProfile
+from user_profile.models import UserProfile, suspended_q
 from task.models import Task
 from chat.models import ChatSession, ChatMessage
-from chat.serializers import ChatSessionSerializers, ChatMessageSerializers
-from core.paginate import ExtraSmallResultsSetPagination
-from user_profile.serializers import UserSerializer
+from chat.serializers import ChatSessionSerializers, ChatMessageSerializers, ChatUserSerializer
+from core.cache import CachedListMixin
+from core.paginate import ExtraSmallKeysetPagination, ExtraSmallResultsSetPagination
+from task.views import OpenReportsMixin
+from user_profile import search as name_search
 from django.db.models import Q
+from django.utils.cache import patch_cache_control
+from rest_framework.throttling import ScopedRateThrottle
 from django.utils import timezone
 from datetime import timedelta
 
@@ -17,10 +21,19 @@ def chatPage(request, *args, **kwargs):
     context = {}
     return render(request, "chat/chatPage.html", context)
 
-class SearchChatUserListView(generics.ListAPIView):
-    serializer_class = UserSerializer
-    queryset = UserProfile.objects.all()
+class SearchChatUserListView(CachedListMixin, generics.ListAPIView):
+    serializer_class = ChatUserSerializer
+    queryset = UserProfile.objects.select_related('user').only('user__first_name', 'user__last_name')
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ExtraSmallResultsSetPagination
+    # Typeahead sends a request per keystroke: cap them per user, and let
+    # clients reuse the answer for a prefix they've asked for recently
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'name-search'
+    # Invalidated when a name changes, see user_profile.search
+    cache_namespace = name_search.CACHE_NAMESPACE
+    cache_timeout = 60 * 5
+    client_max_age = 30
 
     @swagger_auto_schema(
         manual_parameters=[
@@ -34,18 +47,22 @@ class SearchChatUserListView(generics.ListAPIView):
         operation_id='list_performer'
     )
     def get_queryset(self):
-        q = self.request.GET.get('q', None)
-
-        user = self.request.user
-        if q:
-            return UserProfile.objects.filter(Q(Q(user__first_name__icontains=q) | Q(user__last_name__icontains=q))).order_by('user__last_name')
+        # Every word of q is a name prefix, shorter than two letters finds nobody
+        profiles = name_search.search_profiles(self.queryset, self.request.GET.get('q', ''))
+        return profiles.order_by('user__last_name', 'user__first_name', 'pk')
 
-        return []
+    def list(self, request, *args, **kwargs):
+        resp = super().list(request, *args, **kwargs)
+        patch_cache_control(resp, private=True, max_age=self.client_max_age)
+        return resp
 
 
-class ChatSessionListCreateView(generics.ListCreateAPIView):
+class ChatSessionListCreateView(OpenReportsMixin, generics.ListCreateAPIView):
     serializer_class = ChatSessionSerializers
     permission_classes = [permissions.IsAuthenticated]
+    report_profile_fields = ('provider', 'performer')
+    report_task_field = 'task'
+    report_task_applicants = True
 
     @swagger_auto_schema(
         manual_parameters=[
@@ -65,7 +82,7 @@ class ChatSessionListCreateView(generics.ListCreateAPIView):
         excluded_statuses = ['REJECTED', 'CANCELLED', 'COMPLETED']
 
         # Filter chat sessions based on task conditions
-        return ChatSession.objects.filter(
+        return ChatSession.objects.for_list().filter(
             # Exclude tasks with REJECTED, CANCELLED, or COMPLETED status
             ~Q(task__status__in=excluded_statuses),
 
@@ -78,7 +95,7 @@ class ChatSessionListCreateView(generics.ListCreateAPIView):
             Q(task__performer=user_profile) | Q(task__performer__isnull=True)
         ).exclude(
             # Exclude suspended providers and performers
-            Q(provider__is_suspended=True) | Q(performer__is_suspended=True)
+            suspended_q('provider__') | suspended_q('performer__')
         ).distinct()
 
     def post(self, request, *args, **kwargs):
@@ -104,11 +121,11 @@ class ChatSessionListCreateView(generics.ListCreateAPIView):
             return response.Response({"detail": str(e)}, status=status.HTTP_404_NOT_FOUND)
 
         # Validate user's status before creating TaskApplicant
-        if provider.is_suspended or provider.is_terminated:
+        if not provider.is_active():
             message = "terminated" if provider.is_terminated else "suspended"
             raise exceptions.ValidationError({"error_message": f"Your account is {message}."})
     
-        if performer.is_suspended or performer.is_terminated:
+        if not performer.is_active():
             message = "terminated" if performer.is_terminated else "suspended"
             raise exceptions.ValidationError({"error_message": f"Your account is {message}"})
 
@@ -131,17 +148,19 @@ class ChatSessionListCreateView(generics.ListCreateAPIView):
 
 
 
-class ChatMessageListView(generics.ListAPIView):
+class ChatMessageListView(OpenReportsMixin, generics.ListAPIView):
     serializer_class = ChatMessageSerializers
     queryset = ChatMessage.objects.all()
     permission_classes = [permissions.IsAuthenticated,]
-    pagination_class = ExtraSmallResultsSetPagination
+    pagination_class = ExtraSmallKeysetPagination
+    keyset_ordering = ('-timestamp', '-id')
+    report_profile_fields = ('user_profile',)
 
     def get_queryset(self):
         session_id = self.request.GET.get('session_id', None)
 
         if session_id:
-            return ChatMessage.objects.filter(chat_session__pk=session_id)
+            return ChatMessage.objects.for_list().filter(chat_session__pk=session_id)
         
         return []
 
@@ -7,4 +7,44 @@ class BaseModel(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+
+def model_fields(model, prefix='', exclude=()):
+    # Concrete field names of a model, prefixed for use in only() across relations
+    return [f'{prefix}{field.name}' for field in model._meta.concrete_fields if field.name not in exclude]
+
+
+class TrackedFieldsMixin:
+    """
+    Remembers `tracked_fields` as loaded from the database, so a save can
+    tell what changed without reading the row again. New instances count
+    every tracked field as changed.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_tracked_fields()
+        return instance
+
+    def remember_tracked_fields(self):
+        # Deferred fields aren't in __dict__ and aren't remembered
+        self._loaded_values = {name: self.__dict__[name] for name in self.tracked_fields if name in self.__dict__}
+
+    def loaded_value(self, name):
+        return getattr(self, '_loaded_values', {}).get(name)
+
+    def has_changed(self, name):
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        if name not in loaded:
+            # Deferred when loaded, so only an assignment could have changed it
+            return name in self.__dict__
+        return loaded[name] != self.__dict__.get(name)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.remember_tracked_fields()
@@ -0,0 +1,69 @@
+import threading
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import setup_databases, teardown_databases
+
+
+@contextmanager
+def throwaway_database():
+    # Benchmarks seed their own rows, so run them against a fresh test database
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+class QueryCounter:
+    """
+    Counts SQL statements on every connection, including the ones opened by
+    sync_to_async worker threads while the counter is active.
+
+        with QueryCounter() as queries:
+            ...
+        queries.count, queries.sql
+
+    Use ``async with`` from async code, so connections already open in the
+    sync_to_async thread are hooked as well.
+    """
+
+    def __init__(self):
+        self.sql = []
+        self.lock = threading.Lock()
+        self.wrapped = []
+
+    @property
+    def count(self):
+        return len(self.sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.sql.append(sql)
+        return execute(sql, params, many, context)
+
+    def wrap(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+            self.wrapped.append(connection)
+
+    def __enter__(self):
+        connection_created.connect(self.wrap)
+        for connection in connections.all(initialized_only=True):
+            self.wrap(connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.wrap)
+        for connection in self.wrapped:
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+        self.wrapped = []
+
+    async def __aenter__(self):
+        return await sync_to_async(self.__enter__)()
+
+    async def __aexit__(self, *exc_info):
+        await sync_to_async(self.__exit__)(*exc_info)
@@ -0,0 +1,118 @@
+"""
+Versioned response cache for read-mostly payloads.
+
+Every namespace has a version: the time (ms) it was last invalidated.
+Cached entries are keyed by that version, so invalidating is one write that
+orphans the old entries, and it holds across processes when the cache is
+Redis. The version doubles as Last-Modified and each entry carries an ETag
+of its content, so clients can revalidate and get 304s.
+"""
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import response
+from rest_framework.utils.encoders import JSONEncoder
+
+DEFAULT_TIMEOUT = 60 * 60 * 24
+
+
+def get_version(namespace):
+    key = f"version:{namespace}"
+    version = cache.get(key)
+    if version is None:
+        # Cold or evicted: start a new version, older entries are never read again
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    key = f"version:{namespace}"
+    version = max(int(time.time() * 1000), (cache.get(key) or 0) + 1)
+    cache.set(key, version, None)
+    return version
+
+
+def invalidate_on_change(namespace, *models):
+    # Any save or delete of these models bumps the namespace's version
+    def invalidate(sender, **kwargs):
+        bump_version(namespace)
+
+    for model in models:
+        uid = f"cache:{namespace}:{model._meta.label}"
+        post_save.connect(invalidate, sender=model, weak=False, dispatch_uid=uid)
+        post_delete.connect(invalidate, sender=model, weak=False, dispatch_uid=uid)
+
+
+class CachedEntry:
+    # Cache slot for one URL at the namespace's current version
+    def __init__(self, namespace, request):
+        self.version = get_version(namespace)
+        url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        self.key = f"response:{namespace}:{self.version}:{url}"
+        self.request = request
+
+    def get(self):
+        return cache.get(self.key)
+
+    def set(self, content, timeout):
+        body = content if isinstance(content, str) else json.dumps(content, cls=JSONEncoder)
+        entry = {
+            'content': content if isinstance(content, str) else json.loads(body),
+            'etag': f'"{hashlib.md5(body.encode()).hexdigest()}"',
+            'last_modified': self.version // 1000,
+        }
+        cache.set(self.key, entry, timeout)
+        return entry
+
+    def respond(self, entry, resp):
+        resp['ETag'] = entry['etag']
+        resp['Last-Modified'] = http_date(entry['last_modified'])
+        # 304 when If-None-Match / If-Modified-Since still match
+        return get_conditional_response(
+            self.request, etag=entry['etag'], last_modified=entry['last_modified'], response=resp
+        )
+
+
+class CachedListMixin:
+    """
+    Caches a list view's payload per URL (query string and page included)
+    under `cache_namespace`. Permissions still run on every request, the
+    payload itself must be the same for every user.
+    """
+    cache_namespace = None
+    cache_timeout = DEFAULT_TIMEOUT
+
+    def list(self, request, *args, **kwargs):
+        slot = CachedEntry(self.cache_namespace, request)
+        entry = slot.get()
+        if entry is None:
+            resp = super().list(request, *args, **kwargs)
+            if resp.status_code != 200:
+                return resp
+            entry = slot.set(resp.data, self.cache_timeout)
+        return slot.respond(entry, response.Response(entry['content']))
+
+
+def cached_page(namespace, timeout=DEFAULT_TIMEOUT):
+    # CachedListMixin for plain Django views that render the same page for everyone
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            slot = CachedEntry(namespace, request)
+            entry = slot.get()
+            if entry is None:
+                resp = view(request, *args, **kwargs)
+                if resp.status_code != 200:
+                    return resp
+                entry = slot.set(resp.content.decode(), timeout)
+            return slot.respond(entry, HttpResponse(entry['content']))
+        return wrapper
+    return decorator
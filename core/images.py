@@ -0,0 +1,86 @@
+"""
+Uploaded photos: re-encoded without their metadata (EXIF carries GPS and
+device details) and resized into fixed-size variants, so list payloads can
+point at a small image instead of the full upload.
+
+Variants are saved next to the original as <name>_<size>.webp and their
+storage names returned for the model to keep.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+IMAGE_SETTINGS = {
+    # Longest side of each variant, in pixels
+    "SIZES": {"thumb": 96, "small": 320, "medium": 960},
+    "VARIANT_FORMAT": "WEBP",
+    "VARIANT_QUALITY": 80,
+    # The original is kept as a JPEG no larger than this
+    "MAX_ORIGINAL_SIZE": 2048,
+    "ORIGINAL_QUALITY": 90,
+}
+IMAGE_SETTINGS.update(getattr(settings, "IMAGE_PIPELINE", {}))
+
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg", "PNG": "png"}
+
+
+def load_image(file):
+    file.seek(0)
+    image = Image.open(file)
+    # Phones store rotation in EXIF, apply it before the EXIF is dropped
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def encode(image, image_format, quality):
+    # A fresh save only writes the pixels: no EXIF, XMP or ICC comments
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, quality=quality, optimize=image_format == "JPEG")
+    return ContentFile(buffer.getvalue())
+
+
+def resized(image, size):
+    image = image.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    return image
+
+
+def process_upload(photo):
+    """
+    Saves an uncommitted upload on FieldFile `photo` as a clean JPEG and
+    writes its variants. Returns {size: storage name}.
+    """
+    image = load_image(photo)
+    stem = os.path.splitext(os.path.basename(photo.name))[0]
+    original = resized(image, IMAGE_SETTINGS["MAX_ORIGINAL_SIZE"])
+    photo.save(f"{stem}.jpg", encode(original, "JPEG", IMAGE_SETTINGS["ORIGINAL_QUALITY"]), save=False)
+    return build_variants(photo, image)
+
+
+def build_variants(photo, image=None):
+    # Variants of a committed photo, opened from storage unless given
+    if image is None:
+        with photo.storage.open(photo.name) as file:
+            image = load_image(file)
+    image_format = IMAGE_SETTINGS["VARIANT_FORMAT"]
+    base = os.path.splitext(photo.name)[0]
+    return {
+        size: photo.storage.save(
+            f"{base}_{size}.{EXTENSIONS[image_format]}",
+            encode(resized(image, pixels), image_format, IMAGE_SETTINGS["VARIANT_QUALITY"]),
+        )
+        for size, pixels in IMAGE_SETTINGS["SIZES"].items()
+    }
+
+
+def delete_variants(storage, variants):
+    for name in variants.values():
+        storage.delete(name)
@@ -1,7 +1,134 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models
+from django.db.models import Q
+from rest_framework import exceptions, response
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class ExtraSmallResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
-    max_page_size = 10
\ No newline at end of file
+    max_page_size = 10
+
+
+class ExtraSmallKeysetPagination(ExtraSmallResultsSetPagination):
+    """
+    Page-number pagination with an opt-in keyset mode for feeds that grow at
+    the top. Sending ?before= (empty for the newest page) or ?after= with a
+    cursor from a previous response pages on the view's keyset_ordering
+    instead, with no COUNT(*) and no OFFSET scan:
+
+        ?before=<cursor>  older items, for infinite scroll
+        ?after=<cursor>   newer items, e.g. messages that arrived since
+
+    keyset_ordering must end in a unique field so every row has one position.
+    """
+    before_query_param = 'before'
+    after_query_param = 'after'
+    keyset_ordering = ('-updated_at', '-id')
+
+    def uses_keyset(self, request):
+        return self.before_query_param in request.query_params or self.after_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if not self.uses_keyset(request) or not isinstance(queryset, models.QuerySet):
+            return super().paginate_queryset(queryset, request, view)
+
+        before = request.query_params.get(self.before_query_param)
+        after = request.query_params.get(self.after_query_param)
+        if before is not None and after is not None:
+            raise exceptions.ValidationError({"error_message": "Use either before or after, not both."})
+
+        self.request = request
+        self.newer = after is not None
+        self.ordering = getattr(view, 'keyset_ordering', self.keyset_ordering)
+        page_size = self.get_page_size(request)
+
+        # Newer items are read nearest-first in reverse, then flipped back
+        ordering = [flip(name) for name in self.ordering] if self.newer else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        self.cursor = after if self.newer else before
+        if self.cursor:
+            queryset = queryset.filter(keyset_filter(queryset.model, ordering, self.decode_cursor(self.cursor)))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if self.newer:
+            rows.reverse()
+        self.keyset = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        return response.Response({
+            'next': self.get_keyset_link(older=True),
+            'previous': self.get_keyset_link(older=False),
+            'results': data,
+        })
+
+    def get_keyset_link(self, older):
+        rows = self.keyset
+        if older:
+            # Going back in time ends once a before-page comes up short
+            if not self.newer and not self.has_more:
+                return None
+            cursor = self.encode_cursor(rows[-1]) if rows else self.cursor
+            param, other = self.before_query_param, self.after_query_param
+        else:
+            # The newest page has nothing above it, neither does a short after-page
+            if (self.newer and not self.has_more) or (not self.newer and not self.cursor):
+                return None
+            cursor = self.encode_cursor(rows[0]) if rows else self.cursor
+            param, other = self.after_query_param, self.before_query_param
+
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(remove_query_param(url, other), self.page_query_param)
+        return replace_query_param(url, param, cursor)
+
+    def encode_cursor(self, obj):
+        values = []
+        for name in self.ordering:
+            value = getattr(obj, name.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            values = None
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise exceptions.ValidationError({"error_message": "Invalid cursor."})
+        return values
+
+
+def flip(name):
+    return name[1:] if name.startswith('-') else f'-{name}'
+
+
+def keyset_filter(model, ordering, values):
+    # (a, b) past (x, y) in the given ordering: a past x, or a = x and b past y
+    condition = Q()
+    equal = {}
+    for name, value in zip(ordering, values):
+        field = name.lstrip('-')
+        try:
+            # Cursors hold scalars only, null can't be compared with lt/gt
+            if not isinstance(value, (str, int, float)):
+                raise TypeError(value)
+            value = model._meta.get_field(field).to_python(value)
+        except (DjangoValidationError, TypeError, ValueError):
+            raise exceptions.ValidationError({"error_message": "Invalid cursor."})
+        if value is None:
+            raise exceptions.ValidationError({"error_message": "Invalid cursor."})
+        lookup = 'lt' if name.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{field}__{lookup}': value})
+        equal[field] = value
+    return condition
@@ -0,0 +1,133 @@
+"""
+Streaming image uploads.
+
+ImageUploadHandler replaces Django's upload handlers on the views that take
+photos: every file is hashed and checked chunk by chunk as the body is read,
+kept in memory up to FILE_UPLOAD_MAX_MEMORY_SIZE and spooled to a temporary
+file past that. A file that doesn't start like a supported image, or grows
+past MAX_IMAGE_UPLOAD_SIZE, is dropped at that chunk instead of being
+stored whole first.
+"""
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+from rest_framework import exceptions
+
+# Enough of the file to recognize every format below
+HEADER_SIZE = 12
+CONTENT_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+def sniff_image(header):
+    # The format named by a file's first bytes, or None
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """
+    Takes every file of the request: checks its header on the first chunk,
+    hashes it as it goes, and returns it with `image_format` and `sha256`.
+    Rejected files are skipped and listed in request.rejected_uploads.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header, self.size, self.image_format = b'', 0, None
+        self.digest = hashlib.sha256()
+        # Django closes handler.file when it skips a file
+        self.file, self.on_disk = BytesIO(), False
+
+    def note_rejection(self, message):
+        rejected = getattr(self.request, 'rejected_uploads', [])
+        rejected.append(f"{self.file_name}: {message}")
+        self.request.rejected_uploads = rejected
+
+    def reject(self, message):
+        self.note_rejection(message)
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.MAX_IMAGE_UPLOAD_SIZE:
+            self.reject(f"larger than {filesizeformat(settings.MAX_IMAGE_UPLOAD_SIZE)}")
+        if self.image_format is None:
+            self.header += raw_data[:HEADER_SIZE - len(self.header)]
+            if len(self.header) >= HEADER_SIZE:
+                self.image_format = sniff_image(self.header)
+                if self.image_format is None:
+                    self.reject("not a JPEG, PNG, GIF or WebP image")
+
+        self.digest.update(raw_data)
+        if not self.on_disk and self.size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            # Past the memory limit: move what we have to disk and keep writing there
+            spooled = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+            spooled.write(self.file.getvalue())
+            self.file, self.on_disk = spooled, True
+        self.file.write(raw_data)
+        # Handled here, the handlers after this one get nothing
+        return None
+
+    def file_complete(self, file_size):
+        if self.image_format is None:
+            self.image_format = sniff_image(self.header)
+            if self.image_format is None:
+                # Too late to skip, returning nothing drops the file
+                self.note_rejection("not a JPEG, PNG, GIF or WebP image")
+                self.file.close()
+                return None
+
+        content_type = CONTENT_TYPES[self.image_format]
+        if self.on_disk:
+            upload = self.file
+            upload.flush()
+            upload.content_type = content_type
+        else:
+            upload = InMemoryUploadedFile(
+                self.file, self.field_name, self.file_name, content_type, file_size, self.charset, self.content_type_extra
+            )
+        upload.seek(0)
+        upload.size = file_size
+        upload.image_format, upload.sha256 = self.image_format, self.digest.hexdigest()
+        return upload
+
+
+class StreamingUploadMixin:
+    """
+    For views that take images: installs ImageUploadHandler before the body is
+    parsed. Serializers call check_uploads() or uploaded_images(), which
+    raise a ValidationError for any rejected file.
+    """
+    upload_handler_classes = [ImageUploadHandler]
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [handler(request) for handler in self.upload_handler_classes]
+        return super().initialize_request(request, *args, **kwargs)
+
+
+def check_uploads(request):
+    # Reading FILES parses the body, which fills rejected_uploads
+    request.FILES
+    rejected = getattr(request, 'rejected_uploads', None)
+    if rejected:
+        raise exceptions.ValidationError({"error_message": "; ".join(rejected)})
+
+
+def uploaded_images(request, field, limit=None):
+    check_uploads(request)
+    files = request.FILES.getlist(field)
+    if limit is not None and len(files) > limit:
+        raise exceptions.ValidationError({"error_message": f"Upload at most {limit} images"})
+    return files
@@ -0,0 +1,49 @@
+from contextvars import ContextVar
+
+from oauth2_provider import oauth2_backends
+from oauth2_provider.oauth2_validators import OAuth2Validator
+
+# The (token dict, AccessToken) pair created by the current token request
+_issued_token = ContextVar("issued_token", default=None)
+
+
+class LoginOAuth2Validator(OAuth2Validator):
+    """
+    Remembers the access token it creates, so the login view can answer from
+    the saved objects instead of parsing oauthlib's body and looking it up again.
+    """
+
+    def _create_access_token(self, expires, request, token, source_refresh_token=None):
+        access_token = super()._create_access_token(expires, request, token, source_refresh_token)
+        # token is the dict oauthlib serializes, it gets the refresh token next
+        _issued_token.set((token, access_token))
+        return access_token
+
+
+def clear_issued_token():
+    _issued_token.set(None)
+
+
+def pop_issued_token():
+    """
+    The token dict and AccessToken saved since clear_issued_token, or None
+    when no new token was created (e.g. a refresh within the grace period).
+    """
+    issued = _issued_token.get()
+    _issued_token.set(None)
+    return issued
+
+
+class JSONOAuthLibCore(oauth2_backends.JSONOAuthLibCore):
+    """
+    Reads multipart bodies through request.POST, never request.body: that
+    would load a whole upload into memory (or refuse it past
+    DATA_UPLOAD_MAX_MEMORY_SIZE). Parsing goes through the upload handlers
+    the view installed, and DRF reuses the parsed POST and FILES.
+    """
+
+    def extract_body(self, request):
+        if request.META.get('CONTENT_TYPE', '').startswith('multipart/'):
+            # Form fields only, files stay with the upload handlers
+            return request.POST.items()
+        return super().extract_body(request)
@@ -13,6 +13,7 @@ import os
 from firebase_admin import initialize_app, App
 from pathlib import Path
 import dj_database_url
+from chat.layers import redis_channel_layer
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -97,15 +98,66 @@ TEMPLATES = [
 
 ASGI_APPLICATION = 'etugal_core.asgi.application'
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+# Channel layer: Redis when REDIS_URL is set, so group messages reach sockets held
+# by any daphne process. The in-memory layer only works with a single process.
+# Capacity/expiry policy lives in chat.layers.REDIS_LAYER_CONFIG.
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        "default": redis_channel_layer(REDIS_URL)
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        }
+    }
+
+# Response cache (core.cache): shared through Redis when REDIS_URL is set, so a
+# TaskCategory change invalidates every process; otherwise per-process memory.
+# Policy pages are only invalidated by restarts or core.cache.bump_version("pages").
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "etugal-cache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Validated access tokens (user_profile.authentication): an in-process LRU by
+# default, or Redis with AUTH_TOKEN_CACHE_SHARED=1 so every worker skips the
+# lookup. Entries never outlive the token; revokes and user/profile changes
+# invalidate them through a per-user version in the default cache.
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.environ.get('AUTH_TOKEN_CACHE_TIMEOUT') or 300)
+# The versions live in the default cache, so without Redis a revoke in one worker
+# would go unseen by the others: every request looks its token up then
+AUTH_TOKEN_CACHE_ENABLED = bool(REDIS_URL)
+if REDIS_URL and os.environ.get('AUTH_TOKEN_CACHE_SHARED'):
+    CACHES["auth_tokens"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "etugal-auth",
+    }
+else:
+    CACHES["auth_tokens"] = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "auth-tokens",
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get('AUTH_TOKEN_CACHE_SIZE') or 10000)},
     }
-}
 
 # REST CONFIG
 OAUTH2_PROVIDER = {
-    'OAUTH2_BACKEND_CLASS': 'oauth2_provider.oauth2_backends.JSONOAuthLibCore',
+    'OAUTH2_BACKEND_CLASS': 'etugal_core.oauth.JSONOAuthLibCore',
+    # Hands the created token to the login view (etugal_core.views.TokenViewWithUserId)
+    'OAUTH2_VALIDATOR_CLASS': 'etugal_core.oauth.LoginOAuth2Validator',
     # this is the list of available scopes
     'SCOPES': {'read': 'Read scope', 'write': 'Write scope', 'groups': 'Access to your groups'},
     'ACCESS_TOKEN_EXPIRE_SECONDS': 600,
@@ -113,7 +165,7 @@ OAUTH2_PROVIDER = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'user_profile.authentication.CachedOAuth2Authentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ),
@@ -124,7 +176,11 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # Views with a throttle_scope; the chat name search is typeahead, a few per second is typing
+    'DEFAULT_THROTTLE_RATES': {
+        'name-search': os.environ.get('NAME_SEARCH_RATE', '120/min'),
+    },
 }
 
 # Optional ONLY IF you have initialized a firebase app already:
@@ -157,6 +213,17 @@ FCM_DJANGO_SETTINGS = {
     "UPDATE_ON_DUPLICATE_REG_ID": True,
 }
 
+# Push notification outbox, drained by `python manage.py send_notifications`
+PUSH_NOTIFICATIONS = {
+    # class used to reach FCM, "task.notification.LocalTransport" records pushes in-process
+    "TRANSPORT": os.environ.get("PUSH_TRANSPORT", "task.notification.FirebaseTransport"),
+    # messages per FCM send_each request (500 is the FCM maximum)
+    "BATCH_SIZE": 500,
+    # failed pushes are retried with exponential backoff, then marked FAILED
+    "MAX_ATTEMPTS": 5,
+    "RETRY_BACKOFF_SECONDS": 30,
+}
+
 JAZZMIN_SETTINGS = {
     # title of the window (Will default to current_admin_site.site_title if absent or None)
     "site_title": "E-Tugal Admin",
@@ -343,8 +410,25 @@ WSGI_APPLICATION = 'etugal_core.wsgi.application'
 #     }
 # }
 
+# Connections are closed after every request by default: daphne (run.sh) runs each
+# sync view in a fresh thread, so a persistent connection is never reused and is
+# only dropped when the thread is collected (Django #33497). ChatConsumer keeps
+# one connection per process regardless (see chat/consumers.py).
+# DB_POOL_MODE=pgbouncer only makes these settings safe behind PgBouncer's
+# transaction pooling (server-side cursors can't outlive a transaction); the
+# pooling is PgBouncer's, and benchmark_db_connections doesn't measure it.
+# DB_CONN_MAX_AGE only pays off under WSGI or in the single-threaded workers.
+# Connections are pinged before reuse, so a dropped one is replaced instead of
+# failing the request.
+DB_POOL_MODE = os.environ.get("DB_POOL_MODE", "")
+
 DATABASES = {
-    'default': dj_database_url.parse(os.environ.get("DATABASE_URL"))
+    'default': dj_database_url.parse(
+        os.environ.get("DATABASE_URL"),
+        conn_max_age=int(os.environ.get("DB_CONN_MAX_AGE", 0)),
+        conn_health_checks=True,
+        disable_server_side_cursors=DB_POOL_MODE == "pgbouncer",
+    )
 }
 
 
@@ -390,9 +474,30 @@ STATICFILES_DIRS = [
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = 'media/'
 
+# Media serving (etugal_core.views.serve_media): set MEDIA_ACCEL_REDIRECT to an
+# nginx internal location aliased to MEDIA_ROOT, e.g.
+#   location /protected-media/ { internal; alias /srv/etugal/media/; }
+# with MEDIA_ACCEL_REDIRECT=/protected-media/, and nginx sends the files itself.
+# Left empty, the app streams them with DEBUG on and answers 404 otherwise.
+# Only profile photos are public; ID and face photos go to their owner and
+# staff, report images to signed-in users, all with Cache-Control: private.
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', '')
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE') or 60 * 60 * 24 * 30)
+
+# Photo variants (core.images): longest side in pixels per size; uploads are
+# re-encoded without EXIF. Defaults live in core.images.IMAGE_SETTINGS.
+IMAGE_PIPELINE = {
+    "VARIANT_FORMAT": os.environ.get("IMAGE_VARIANT_FORMAT", "WEBP"),
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880
+# Image uploads (core.uploads) are checked and hashed as they stream in, kept
+# in memory up to FILE_UPLOAD_MAX_MEMORY_SIZE and spooled to disk past it.
+# DATA_UPLOAD_MAX_MEMORY_SIZE above only bounds the non-file fields.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
+MAX_IMAGE_UPLOAD_SIZE = int(os.environ.get('MAX_IMAGE_UPLOAD_SIZE') or 10 * 1024 * 1024)
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -400,4 +505,20 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
-EMAIL_USE_SSL = False
\ No newline at end of file
+EMAIL_USE_SSL = False
+
+# Outgoing mail queue, drained by `python manage.py send_emails` over one SMTP session
+EMAIL_QUEUE = {
+    # messages per second, Gmail throttles bursts
+    "RATE_LIMIT": float(os.environ.get("EMAIL_RATE_LIMIT") or 5),
+    # failed sends are retried with exponential backoff, then marked FAILED
+    "MAX_ATTEMPTS": 5,
+    "RETRY_BACKOFF_SECONDS": 60,
+}
+
+# Task recommendations, refreshed by `python manage.py refresh_recommendations`.
+# Web processes load what it publishes to the cache, and refresh their own copy
+# when nothing newer than this many seconds was published (e.g. without Redis).
+RECOMMENDATIONS = {
+    "MAX_STALENESS_SECONDS": int(os.environ.get("RECOMMEND_MAX_STALENESS") or 300),
+}
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from drf_yasg import openapi
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf.urls.static import static
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
@@ -11,7 +11,7 @@ from django.conf import settings
 from django.views.generic import RedirectView
 from fcm_django.api.rest_framework import FCMDeviceAuthorizedViewSet
 from chat.views import chatPage
-from .views import TokenViewWithUserId, privacy_policy, terms_condition, safety_guide
+from .views import TokenViewWithUserId, privacy_policy, serve_media, terms_condition, safety_guide
 
 
 
@@ -51,4 +51,7 @@ urlpatterns = [
 
 urlpatterns += router.urls
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Not static(): that only works with DEBUG, and media goes through nginx in production
+urlpatterns += [
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', serve_media, name='media'),
+]
\ No newline at end of file
@@ -1,5 +1,13 @@
 import json
-from django.http import HttpResponse, JsonResponse
+import mimetypes
+import os
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.views import static
 from django.utils.decorators import method_decorator
 from django.views.decorators.debug import sensitive_post_parameters
 from oauth2_provider.models import get_access_token_model
@@ -7,16 +15,106 @@ from oauth2_provider.signals import app_authorized
 from oauth2_provider.views.base import TokenView
 from django.core.exceptions import ObjectDoesNotExist
 from django.shortcuts import render
+from rest_framework import permissions
+from rest_framework.views import APIView
+from core.cache import cached_page
+from etugal_core.oauth import clear_issued_token, pop_issued_token
+from user_profile.models import UserProfile, ReportImage
+from user_profile.payload import get_profile_payload, profile_response
 
 
+# Public: profile photos and their variants, shown to anyone who sees the profile
+PUBLIC_MEDIA = (UserProfile._meta.get_field('profile_photo').upload_to,)
+# Private: {prefix: photo field}, served to the profile's owner and to staff only
+OWNER_MEDIA = {
+    UserProfile._meta.get_field(field).upload_to: field for field in ('id_photo', 'face_photo')
+}
+# Report evidence, shown with open reports to any signed-in user
+SIGNED_IN_MEDIA = (ReportImage._meta.get_field('image').upload_to,)
+
+
+def media_path(path):
+    # Path of the file relative to MEDIA_ROOT, normalized so a prefix check can't be climbed out of
+    try:
+        # Rejects paths that climb out of MEDIA_ROOT
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    return os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+
+
+def media_response(request, relative, **cache_control):
+    """
+    With MEDIA_ACCEL_REDIRECT set, nginx sends the file from its internal
+    location and the app only checks the path; otherwise it's streamed from
+    MEDIA_ROOT here, with DEBUG on only.
+    """
+    if settings.MEDIA_ACCEL_REDIRECT:
+        content_type, encoding = mimetypes.guess_type(relative)
+        resp = HttpResponse(content_type=content_type or 'application/octet-stream')
+        resp['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT + quote(relative)
+    elif settings.DEBUG:
+        resp = static.serve(request, relative, document_root=settings.MEDIA_ROOT)
+    else:
+        raise Http404
+    # Uploads are saved under new names, a name's content never changes
+    patch_cache_control(resp, max_age=settings.MEDIA_CACHE_MAX_AGE, **cache_control)
+    return resp
+
+
+def serve_media(request, path):
+    """
+    Uploaded profile photos, cacheable by anyone. Everything else under
+    MEDIA_URL goes through PrivateMediaView.
+    """
+    relative = media_path(path)
+    if not relative.startswith(PUBLIC_MEDIA):
+        return private_media(request, path=relative)
+    return media_response(request, relative, public=True)
+
+
+class PrivateMediaView(APIView):
+    """
+    ID and face photos for their owner and staff, report images for any
+    signed-in user; never stored by shared caches.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, path):
+        if not self.may_view(request.user, path):
+            # Same answer as a missing file, so other users' uploads can't be probed
+            raise Http404
+        return media_response(request, path, private=True)
+
+    def may_view(self, user, path):
+        if path.startswith(SIGNED_IN_MEDIA):
+            return True
+        field = next((field for prefix, field in OWNER_MEDIA.items() if path.startswith(prefix)), None)
+        if field is None:
+            return False
+        if user.is_staff:
+            return True
+        profile = UserProfile.objects.select_related(None).filter(user=user).only(field, 'photo_variants').first()
+        if profile is None:
+            return False
+        photo = getattr(profile, field)
+        return path == photo.name or path in (profile.photo_variants or {}).get(field, {}).values()
+
+
+private_media = PrivateMediaView.as_view()
+
+
+@cached_page('pages')
 def privacy_policy(request):
     
     return render(request, 'privacy_policy.html')
 
+@cached_page('pages')
 def terms_condition(request):
     
     return render(request, 'terms_condition.html')
 
+@cached_page('pages')
 def safety_guide(request):
     
     return render(request, 'safety_guide.html')
@@ -24,59 +122,35 @@ def safety_guide(request):
 class TokenViewWithUserId(TokenView):
     @method_decorator(sensitive_post_parameters("password"))
     def post(self, request, *args, **kwargs):
+        clear_issued_token()
         url, headers, body, status = self.create_token_response(request)
 
         if status == 200:
-            body = json.loads(body)
-            access_token = body.get("access_token")
-            if access_token is not None:
-                try:
-                    token = get_access_token_model().objects.get(
-                        token=access_token)
-                    
-                    # Check if the user has a profile
-                    profile = token.user.profile
-                    
-                    profile.is_active()
-                    
-                    if profile is None:
-                        raise ObjectDoesNotExist("User profile does not exist")
-
-                    app_authorized.send(
-                        sender=self, request=request,
-                        token=token)
-                    
-                    # Add user ID to the response body
-                    data = {
-                        "pk": str(token.user.pk),
-                        "profilePk": str(profile.pk),
-                        "username": token.user.username,
-                        "firstName": token.user.first_name,
-                        "lastName": token.user.last_name,
-                        "email": token.user.email,
-                        "contactNumber": profile.contact_number,
-                        "birthdate": str(profile.birthdate),
-                        "profilePhoto": request.build_absolute_uri(profile.profile_photo.url) if profile.profile_photo else None,
-                        "address": profile.address,
-                        "gender": profile.gender,
-                        "verificationStatus": profile.verification_status,
-                        "verificationRemarks": profile.verification_remarks,
-                        "access_token": access_token,
-                        "refresh_token": body.get("refresh_token"),
-                        "is_suspended": profile.is_suspended,
-                        "suspension_reason": profile.suspension_reason,
-                        "suspended_until": profile.suspended_until.isoformat() if profile.suspended_until else None,
-                        "is_terminated": profile.is_terminated,
-                        "termination_reason": profile.termination_reason,
-                    }
-                    
-                    body = json.dumps(data)
-                    
-                except ObjectDoesNotExist:
-                    # Handle case where user profile doesn't exist
-                    return JsonResponse({'error_description': 'User profile does not exist'}, status=400)
-   
+            issued = pop_issued_token()
+            if issued is not None:
+                # Answer from the objects oauthlib just saved, no lookup by token
+                token_data, token = issued
+            else:
+                # No new token was created (refresh within the grace period)
+                token_data = json.loads(body)
+                token = get_access_token_model().objects.get(token=token_data["access_token"])
+
+            try:
+                # One joined query when the payload isn't cached yet
+                payload = get_profile_payload(user_id=token.user_id)
+            except ObjectDoesNotExist:
+                # Handle case where user profile doesn't exist
+                return JsonResponse({'error_description': 'User profile does not exist'}, status=400)
+
+            app_authorized.send(sender=self, request=request, token=token)
+
+            data = profile_response(
+                request, payload,
+                access_token=token_data["access_token"], refresh_token=token_data.get("refresh_token"),
+            )
+            body = json.dumps(data)
+
         response = HttpResponse(content=body, status=status)
         for k, v in headers.items():
             response[k] = v
-        return response
\ No newline at end of file
+        return response
@@ -1 +1,5 @@
+python manage.py send_notifications &
+python manage.py expire_suspensions &
+python manage.py send_emails &
+python manage.py refresh_recommendations &
 daphne -b 192.168.1.21 -p 8000 etugal_core.asgi:application
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Task, TaskCategory, TaskApplicant, TaskReview
+from .models import Task, TaskCategory, TaskApplicant, TaskReview, PushNotification
 from django_admin_geomap import ModelAdmin
 
 
@@ -36,4 +36,12 @@ class TaskApplicantAdmin(admin.ModelAdmin):
 class TaskReviewAdmin(admin.ModelAdmin):
     list_display = ('id', 'task', 'provider_rate', 'performer_rate')
     ordering = ('task',)
-    search_fields = ('task__title',)
\ No newline at end of file
+    search_fields = ('task__title',)
+
+
+@admin.register(PushNotification)
+class PushNotificationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'title', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    ordering = ('-created_at',)
+    search_fields = ('user__username', 'title',)
+    list_filter = ('status',)
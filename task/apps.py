@@ -4,3 +4,41 @@ from django.apps import AppConfig
 class TaskConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'task'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from core.cache import invalidate_on_change
+        from .models import Task, TaskApplicant, TaskCategory, TaskReview
+        from .ratings import review_deleted, review_saved
+        from .recommend import forget_performer_profile
+        from .search import remove_from_search_index, update_search_index
+
+        invalidate_on_change('task_categories', TaskCategory)
+
+        # Full-text search index (task.search)
+        def task_saved(sender, instance, **kwargs):
+            if any(instance.has_changed(name) for name in instance.tracked_fields):
+                update_search_index(sender.objects.filter(pk=instance.pk))
+
+        def task_deleted(sender, instance, using, **kwargs):
+            remove_from_search_index([instance.pk], using)
+
+        def category_saved(sender, instance, created, **kwargs):
+            if not created and instance.has_changed('title'):
+                update_search_index(Task.objects.filter(task_category=instance))
+
+        post_save.connect(task_saved, sender=Task, weak=False, dispatch_uid="task-search:task")
+        post_delete.connect(task_deleted, sender=Task, weak=False, dispatch_uid="task-search:delete")
+        post_save.connect(category_saved, sender=TaskCategory, weak=False, dispatch_uid="task-search:category")
+
+        # Recommendations (task.recommend): a new application changes the performer's profile
+        def applicant_saved(sender, instance, created, **kwargs):
+            if created and instance.performer_id:
+                forget_performer_profile(instance.performer_id)
+
+        post_save.connect(applicant_saved, sender=TaskApplicant, weak=False, dispatch_uid="task-recommend:applicant")
+
+        # Rating aggregates on the reviewed profiles (task.ratings)
+        post_save.connect(review_saved, sender=TaskReview, dispatch_uid="task-ratings:review")
+        post_delete.connect(review_deleted, sender=TaskReview, dispatch_uid="task-ratings:delete")
@@ -0,0 +1,64 @@
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_RADIUS_KM = math.pi * EARTH_RADIUS_KM  # Half the circumference, covers the whole globe
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    # Great-circle distance between two points, in kilometers
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box_filter(latitude, longitude, radius_km, lat_field='latitude', lng_field='longitude'):
+    """
+    Returns a Q object that keeps every point within radius_km of the origin.
+    It is a cheap, index friendly prefilter; the exact distance check is done
+    afterwards with the haversine expression.
+    """
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = latitude - d_lat, latitude + d_lat
+
+    # The box touches a pole, every longitude is in range
+    if min_lat <= -90 or max_lat >= 90:
+        return Q(**{f'{lat_field}__gte': max(min_lat, -90), f'{lat_field}__lte': min(max_lat, 90)})
+
+    d_lng = math.degrees(
+        math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude))))
+    )
+    min_lng, max_lng = longitude - d_lng, longitude + d_lng
+    lat_range = Q(**{f'{lat_field}__gte': min_lat, f'{lat_field}__lte': max_lat})
+
+    if d_lng >= 180:
+        return lat_range
+
+    # Split the longitude range when the box crosses the antimeridian
+    if min_lng < -180:
+        lng_range = Q(**{f'{lng_field}__gte': min_lng + 360}) | Q(**{f'{lng_field}__lte': max_lng})
+    elif max_lng > 180:
+        lng_range = Q(**{f'{lng_field}__gte': min_lng}) | Q(**{f'{lng_field}__lte': max_lng - 360})
+    else:
+        lng_range = Q(**{f'{lng_field}__gte': min_lng, f'{lng_field}__lte': max_lng})
+
+    return lat_range & lng_range
+
+
+def distance_expression(latitude, longitude, lat_field='latitude', lng_field='longitude'):
+    # Haversine distance (km) from the origin to each row, evaluated by the database
+    origin_lat = Radians(Value(latitude, output_field=FloatField()))
+    d_lat = Radians(F(lat_field)) - origin_lat
+    d_lng = Radians(F(lng_field)) - Radians(Value(longitude, output_field=FloatField()))
+
+    a = (
+        Power(Sin(d_lat / 2), 2)
+        + Cos(origin_lat) * Cos(Radians(F(lat_field))) * Power(Sin(d_lng / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM, output_field=FloatField()) * ASin(
+        Least(Sqrt(a), Value(1.0, output_field=FloatField()))
+    )
@@ -0,0 +1,115 @@
+import asyncio
+import statistics
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.http import JsonResponse
+from django.test.utils import override_settings
+from django.urls import path
+
+from task.models import TaskCategory
+
+BENCHMARK_PATH = '/benchmark-db-connections/'
+
+
+def load_categories():
+    # Stand-in for a request's work: one small read
+    return list(TaskCategory.objects.all()[:10])
+
+
+def categories_view(request):
+    return JsonResponse({'categories': len(load_categories())})
+
+
+# The benchmark's own URLconf, so requests go through the full ASGI handler without auth or caching
+urlpatterns = [path(BENCHMARK_PATH.strip('/') + '/', categories_view)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures request latency and connections opened with a new DB connection per request versus "
+        "persistent connections, through Django's ASGI handler as daphne runs it and through ChatConsumer's "
+        "sync_to_async calls. Connection pooling (PgBouncer) is not part of it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Requests per mode.")
+        parser.add_argument('--max-age', type=int, default=60, help="CONN_MAX_AGE for the persistent mode.")
+
+    def handle(self, *args, **options):
+        connection = connections['default']
+        original_max_age = connection.settings_dict['CONN_MAX_AGE']
+        self.opened = 0
+        connection_created.connect(self.count_connection)
+        try:
+            self.stdout.write(f"Database:    {connection.vendor} {connection.settings_dict['NAME']}")
+            for max_age in (0, options['max_age']):
+                connection.close()
+                connection.settings_dict['CONN_MAX_AGE'] = max_age
+                label = "per-request" if max_age == 0 else f"persistent ({max_age}s)"
+                self.report(f"HTTP {label}", asyncio.run(self.run_requests(options['requests'])))
+                self.report(f"Consumer {label}", asyncio.run(self.run_consumer_calls(options['requests'])))
+        except DatabaseError as e:
+            raise CommandError(f"{e}. Run migrate against this database first.")
+        finally:
+            connection_created.disconnect(self.count_connection)
+            connection.settings_dict['CONN_MAX_AGE'] = original_max_age
+            connection.close()
+
+    def count_connection(self, **kwargs):
+        self.opened += 1
+
+    async def run_requests(self, requests):
+        # Every sync view runs in a fresh thread under ASGI, so each request gets its own connection
+        handler, self.opened, timings = ASGIHandler(), 0, []
+        with override_settings(ROOT_URLCONF=__name__):
+            for _ in range(requests):
+                started = time.perf_counter()
+                status = await self.asgi_request(handler)
+                timings.append(time.perf_counter() - started)
+                if status != 200:
+                    raise CommandError(f"Benchmark request failed with {status}")
+        await sync_to_async(connections.close_all)()
+        return timings
+
+    async def asgi_request(self, handler):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': BENCHMARK_PATH, 'raw_path': BENCHMARK_PATH.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'localhost')], 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+        }
+        body, sent = [{'type': 'http.request', 'body': b'', 'more_body': False}], []
+
+        async def receive():
+            if body:
+                return body.pop()
+            # The client never disconnects early
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        await handler(scope, receive, send)
+        return sent[0]['status']
+
+    async def run_consumer_calls(self, requests):
+        # How ChatConsumer reaches the database from daphne's event loop: one shared thread and connection
+        self.opened, timings = 0, []
+        for _ in range(requests):
+            started = time.perf_counter()
+            await sync_to_async(load_categories)()
+            timings.append(time.perf_counter() - started)
+        await sync_to_async(connections.close_all)()
+        return timings
+
+    def report(self, label, timings):
+        timings = sorted(timing * 1000 for timing in timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:<28} mean {statistics.mean(timings):.3f}ms  p50 {statistics.median(timings):.3f}ms  "
+            f"p95 {p95:.3f}ms  connections opened {self.opened}"
+        )
@@ -0,0 +1,84 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.benchmark import QueryCounter, throwaway_database
+from task.models import Task, TaskCategory, TaskReview
+from task.serializers import CompactTaskReviewSerializer, TaskReviewSerializers
+from user_profile.models import UserProfile
+from user_profile.serializers import OpenReportResolver
+
+VIEWS = ('full', 'compact')
+
+
+def seed_reviews(reviews):
+    # A performer reviewed by `reviews` different providers, every profile with a photo
+    category = TaskCategory.objects.create(title="Repair")
+    profiles = []
+    for i in range(reviews + 1):
+        user = User.objects.create(username=f"bench{i}", first_name="Bench", last_name=f"User {i}")
+        profiles.append(UserProfile.objects.create(
+            user=user, address="Legazpi City", contact_number="09170000000",
+            profile_photo=f"images/profiles/bench{i}.jpg",
+            photo_variants={'profile_photo': {size: f"images/profiles/bench{i}_{size}.webp" for size in ('thumb', 'small', 'medium')}},
+        ))
+    performer = profiles[0]
+    for provider in profiles[1:]:
+        task = Task.objects.create(
+            title="Fix the fence", description="Needs help " * 20, address="Albay", task_category=category,
+            provider=provider, performer=performer, status=Task.COMPLETED, is_done_perform=True,
+            latitude=13.1391, longitude=123.7438,
+        )
+        TaskReview.objects.create(task=task, performer_rate=5, performer_feedback="Great work", provider_rate=4)
+    return performer
+
+
+class Command(BaseCommand):
+    help = "Compares the full and compact review list: payload size, serialization time and request time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviews', type=int, default=50, help="Reviews of the listed performer.")
+        parser.add_argument('--requests', type=int, default=100, help="Requests per view.")
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.run_views(seed_reviews(options['reviews']), options['requests'])
+
+    def serialize_page(self, view, performer, page_size):
+        # Serializer work alone, on rows already fetched
+        reviews = TaskReview.objects.filter(task__performer=performer).order_by('-created_at')
+        if view == 'compact':
+            rows = list(reviews.compact()[:page_size])
+            started = time.perf_counter()
+            CompactTaskReviewSerializer(rows, many=True, context={'review_subject': performer.pk}).data
+        else:
+            rows = list(reviews.for_list()[:page_size])
+            resolver = OpenReportResolver(user_id for row in rows for user_id in (row.task.provider.user_id, performer.user_id))
+            started = time.perf_counter()
+            TaskReviewSerializers(rows, many=True, context={'report_resolver': resolver}).data
+        return time.perf_counter() - started
+
+    def run_views(self, performer, requests):
+        client = APIClient()
+        client.force_authenticate(performer.user)
+        url = reverse('api:task-review-list')
+        for view in VIEWS:
+            params = {'performer': performer.pk, **({'view': view} if view == 'compact' else {})}
+            timings = []
+            with QueryCounter() as queries:
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    res = client.get(url, params)
+                    timings.append(time.perf_counter() - started)
+                    if res.status_code != 200:
+                        raise CommandError(f"{view} list failed with {res.status_code}: {res.content.decode()[:500]}")
+            page_size = len(res.data['results'])
+            serializing = [self.serialize_page(view, performer, page_size) for _ in range(requests)]
+            self.stdout.write(
+                f"{view:<8} {len(res.content):>7} bytes/page  serialize p50 {statistics.median(serializing) * 1000:.2f}ms  "
+                f"request p50 {statistics.median(timings) * 1000:.2f}ms  queries/request {queries.count / requests:.1f}"
+            )
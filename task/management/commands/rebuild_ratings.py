@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from task.ratings import BATCH_SIZE, rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Recomputes the rating aggregates of every profile from the reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Profiles per transaction.")
+
+    def handle(self, *args, **options):
+        updated = rebuild_ratings(batch_size=options['batch_size'])
+        self.stdout.write(f"Updated the ratings of {updated} profile(s).")
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from task.recommend import TaskIndex, active_performers, refresh_performer_profile
+
+
+class Command(BaseCommand):
+    help = "Keeps the task recommendation index up to date and publishes it to the cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Refresh once and exit.")
+        parser.add_argument('--interval', type=float, default=30.0, help="Seconds between refreshes.")
+
+    def handle(self, *args, **options):
+        index = TaskIndex()
+        while True:
+            close_old_connections()
+            since = index.since
+            full = index.refresh()
+            index.publish()
+            # Profiles of performers with new applications or completed tasks, before they ask
+            performers = active_performers(since) if since is not None else set()
+            for profile_pk in performers:
+                refresh_performer_profile(profile_pk)
+            self.stdout.write(
+                f"{'Rebuilt' if full else 'Refreshed'} {len(index)} open task(s), {len(performers)} performer profile(s)."
+            )
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from task.notification import drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Delivers queued push notifications from the outbox to FCM."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the outbox once and exit.")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep when the outbox is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            processed = drain_outbox()
+            if processed:
+                self.stdout.write(f"Processed {processed} notification(s).")
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0022_task_num_worker'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('performer__isnull', True), ('status', 'PENDING')), fields=['latitude', 'longitude'], name='task_open_geo_idx'),
+        ),
+    ]
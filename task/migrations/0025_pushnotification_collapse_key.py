@@ -0,0 +1,27 @@
+# Generated by Django 4.2.13 on 2026-10-18 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0024_pushnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pushnotification',
+            name='coalesced_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='pushnotification',
+            name='collapse_key',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='pushnotification',
+            index=models.Index(fields=['collapse_key', 'status'], name='push_collapse_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.13 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0026_task_open_feed_idx'),
+        ('fcm_django', '0011_fcmdevice_fcm_django_registration_id_user_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['provider', 'status', '-updated_at'], name='task_provider_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['performer', 'status', '-updated_at'], name='task_performer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskapplicant',
+            index=models.Index(fields=['performer', '-updated_at'], name='task_applicant_perf_idx'),
+        ),
+        # The outbox loads each recipient's active devices; FCMDevice belongs to fcm_django
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS fcm_device_user_active_idx ON fcm_django_fcmdevice (user_id, active)',
+            'DROP INDEX IF EXISTS fcm_device_user_active_idx',
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.13 on 2026-10-18 12:50
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from task.search import FTS_TABLE, update_search_index
+
+
+def create_search_index(apps, schema_editor):
+    # GIN on Postgres, an FTS5 table on SQLite; then index the existing tasks
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS task_search_vector_idx ON task_task USING gin (search_vector)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            f'title, category, description, address, tokenize="unicode61 remove_diacritics 2")'
+        )
+    update_search_index(apps.get_model('task', 'Task').objects.using(schema_editor.connection.alias).all())
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS task_search_vector_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0027_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
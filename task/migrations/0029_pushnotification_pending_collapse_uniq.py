@@ -0,0 +1,39 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:21
+
+import json
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    # Untried chat pushes queued twice for the same key become one, keeping the oldest
+    PushNotification = apps.get_model('task', 'PushNotification')
+    db = schema_editor.connection.alias
+    pending = PushNotification.objects.using(db).filter(status='PENDING', attempts=0).exclude(collapse_key='')
+    duplicated = pending.values('collapse_key').annotate(rows=Count('id'), total=Sum('coalesced_count')).filter(rows__gt=1)
+    for row in duplicated:
+        pushes = list(pending.filter(collapse_key=row['collapse_key']).order_by('pk'))
+        keep = pushes[0]
+        keep.coalesced_count = row['total']
+        keep.body = f"{keep.coalesced_count} new messages"
+        data = json.loads(keep.data.get('json', '{}'))
+        data.update(body=keep.body, count=keep.coalesced_count)
+        keep.data = dict(keep.data, json=json.dumps(data))
+        keep.save(update_fields=['coalesced_count', 'body', 'data'])
+        pending.filter(pk__in=[push.pk for push in pushes[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0028_task_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pushnotification',
+            constraint=models.UniqueConstraint(condition=models.Q(('attempts', 0), ('status', 'PENDING'), models.Q(('collapse_key', ''), _negated=True)), fields=('collapse_key',), name='push_pending_collapse_uniq'),
+        ),
+    ]
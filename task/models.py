@@ -1,12 +1,21 @@
+from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Prefetch, Q
 from django.forms import ValidationError
+from django.utils import timezone
 
-from core.base_models import BaseModel
-from user_profile.models import UserProfile
+from django.contrib.postgres.search import SearchVectorField
+
+from core.base_models import BaseModel, TrackedFieldsMixin, model_fields
+from user_profile.models import UserProfile, profile_fields
 from django_admin_geomap import GeoItem
+from task.geo import MAX_RADIUS_KM, bounding_box_filter, distance_expression
+from task.search import SOURCE_FIELDS, search_tasks
 
-class TaskCategory(BaseModel):
+class TaskCategory(TrackedFieldsMixin, BaseModel):
     title = models.CharField(max_length=25, unique=True)
+    # A new title re-indexes the category's tasks for search
+    tracked_fields = ('title',)
     
     class Meta:
         verbose_name = "Category"
@@ -17,7 +26,70 @@ class TaskCategory(BaseModel):
         return self.title
 
 
-class Task(BaseModel, GeoItem):
+def task_select_related(prefix='', detail=False):
+    # Relations nested by TaskListSerializers, plus the review for TaskSerializer
+    related = [f'{prefix}task_category', f'{prefix}provider__user', f'{prefix}performer__user']
+    if detail:
+        related.append(f'{prefix}task_review')
+    return related
+
+
+def task_only_fields(prefix='', detail=False):
+    fields = (
+        model_fields(Task, prefix, exclude=('search_vector',))
+        + model_fields(TaskCategory, f'{prefix}task_category__')
+        + profile_fields(f'{prefix}provider__')
+        + profile_fields(f'{prefix}performer__')
+    )
+    if detail:
+        fields += model_fields(TaskReview, f'{prefix}task_review__')
+    return fields
+
+
+def task_applicants_prefetch(prefix=''):
+    # Applicants with their profiles, in one query for every task on the page
+    return Prefetch(
+        f'{prefix}task_applicant',
+        queryset=TaskApplicant.objects.select_related('performer__user').only(
+            *model_fields(TaskApplicant), *profile_fields('performer__')
+        ),
+    )
+
+
+class TaskQuerySet(models.QuerySet):
+    def for_list(self):
+        # Query plan for TaskListSerializers
+        return self.select_related(*task_select_related()).only(*task_only_fields())
+
+    def for_detail(self):
+        # Query plan for TaskSerializer
+        return self.select_related(*task_select_related(detail=True)).only(
+            *task_only_fields(detail=True)
+        ).prefetch_related(task_applicants_prefetch())
+
+    def nearby(self, latitude, longitude, radius_km):
+        # Bounding box prefilter (uses the lat/lng index) followed by the exact haversine check
+        return self.filter(
+            bounding_box_filter(latitude, longitude, radius_km)
+        ).annotate(
+            distance=distance_expression(latitude, longitude)
+        ).filter(distance__lte=radius_km).order_by('distance', 'id')
+
+    def nearest(self, latitude, longitude, k, start_radius_km=5.0):
+        # Grow the search radius until it holds at least k tasks, then keep the k closest
+        radius_km = start_radius_km
+        while radius_km < MAX_RADIUS_KM:
+            if self.nearby(latitude, longitude, radius_km).count() >= k:
+                break
+            radius_km *= 4
+        return self.nearby(latitude, longitude, min(radius_km, MAX_RADIUS_KM))[:k]
+
+    def search(self, text):
+        # Full-text match on title, category, description and address, best first (see task.search)
+        return search_tasks(self, text)
+
+
+class Task(TrackedFieldsMixin, BaseModel, GeoItem):
     IN_PERSON = 'IN_PERSON'
     ONLINE = 'ONLINE'
 
@@ -60,6 +132,11 @@ class Task(BaseModel, GeoItem):
     status = models.CharField(
         max_length=15, choices=STATUSES, default=PENDING, verbose_name="Task Status")
     rejection_reason = models.TextField(blank=True, null=True)
+    # Postgres full-text vector, kept up to date by task.search.update_search_index
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = TaskQuerySet.as_manager()
+    tracked_fields = SOURCE_FIELDS
     
     @property
     def geomap_longitude(self):
@@ -86,6 +163,23 @@ class Task(BaseModel, GeoItem):
         verbose_name = "Task"
         verbose_name_plural = "Tasks"
         ordering = ['-updated_at',]
+        indexes = [
+            # Spatial prefilter for the "tasks near me" feed, limited to open tasks
+            models.Index(
+                fields=['latitude', 'longitude'],
+                condition=Q(status='PENDING', performer__isnull=True),
+                name='task_open_geo_idx',
+            ),
+            # Keyset pages of the open task feed, most recently updated first
+            models.Index(
+                fields=['-updated_at', '-id'],
+                condition=Q(status='PENDING', performer__isnull=True),
+                name='task_open_feed_idx',
+            ),
+            # "My tasks" lists for providers and performers, optionally by status
+            models.Index(fields=['provider', 'status', '-updated_at'], name='task_provider_status_idx'),
+            models.Index(fields=['performer', 'status', '-updated_at'], name='task_performer_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.status}"
@@ -103,27 +197,63 @@ class Task(BaseModel, GeoItem):
         super().save(*args, **kwargs)
 
 
+class TaskApplicantQuerySet(models.QuerySet):
+    def for_list(self):
+        # Query plan for TaskListApplicantSerializer, which renders the full task
+        return self.select_related(*task_select_related('task__', detail=True)).only(
+            *model_fields(TaskApplicant), *task_only_fields('task__', detail=True)
+        ).prefetch_related(task_applicants_prefetch('task__'))
+
+
 class TaskApplicant(BaseModel):
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='task_applicant')
     performer = models.ForeignKey(UserProfile, null=True, blank=True, on_delete=models.CASCADE, related_name='task_applicant_performer')
     description = models.TextField(null=True, blank=True)
+
+    objects = TaskApplicantQuerySet.as_manager()
     
     class Meta:
         unique_together = ['task', 'performer',]
         verbose_name = "Applicant"
         verbose_name_plural = "Applicants"
         ordering = ['-updated_at']
+        indexes = [
+            # A performer's applications, newest first
+            models.Index(fields=['performer', '-updated_at'], name='task_applicant_perf_idx'),
+        ]
     
     def __str__(self):
         return f"{self.task.title} - {self.performer.user.get_full_name}"
 
 
-class TaskReview(BaseModel):
+class TaskReviewQuerySet(models.QuerySet):
+    def for_list(self):
+        # Query plan for TaskReviewSerializers
+        return self.select_related(*task_select_related('task__')).only(
+            *model_fields(TaskReview), *task_only_fields('task__')
+        )
+
+    def compact(self):
+        # Rows for CompactTaskReviewSerializer: the review, the task's title and both parties' names and photos
+        parties = [
+            f'task__{role}__{field}'
+            for role in ('provider', 'performer')
+            for field in ('id', 'user__first_name', 'user__last_name', 'profile_photo', 'photo_variants')
+        ]
+        return self.values(*model_fields(TaskReview, exclude=('task',)), 'task_id', 'task__title', *parties)
+
+
+class TaskReview(TrackedFieldsMixin, BaseModel):
     task = models.OneToOneField(Task, on_delete=models.CASCADE, related_name='task_review')
     provider_rate = models.IntegerField(default=0, choices=((i,i) for i in range(0, 6)))
     provider_feedback = models.TextField(null=True, blank=True)
     performer_rate = models.IntegerField(default=0, choices=((i,i) for i in range(0, 6)))
     performer_feedback = models.TextField(null=True, blank=True)
+
+    objects = TaskReviewQuerySet.as_manager()
+
+    # The rates a save moves the profiles' rating aggregates from, see task.ratings
+    tracked_fields = ('provider_rate', 'performer_rate')
     
     class Meta:
         verbose_name = "Review"
@@ -132,4 +262,52 @@ class TaskReview(BaseModel):
     
     def __str__(self):
         return self.task.title
-    
\ No newline at end of file
+    
+
+
+class PushNotification(BaseModel):
+    """
+    Outbox of push notifications. Requests only insert rows here; the
+    send_notifications worker delivers them to the user's FCM devices.
+    """
+    PENDING = 'PENDING'
+    SENT = 'SENT'
+    FAILED = 'FAILED'
+
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='push_notifications')
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    data = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    # Pushes sharing a key are merged while pending (e.g. one "N new messages" per chat)
+    collapse_key = models.CharField(max_length=100, blank=True, default='')
+    coalesced_count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        verbose_name = "Push Notification"
+        verbose_name_plural = "Push Notifications"
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='push_due_idx'),
+            models.Index(fields=['collapse_key', 'status'], name='push_collapse_idx'),
+        ]
+        constraints = [
+            # At most one untried push per key for new messages to be folded into
+            models.UniqueConstraint(
+                fields=['collapse_key'], condition=models.Q(status='PENDING', attempts=0) & ~models.Q(collapse_key=''),
+                name='push_pending_collapse_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.title} - {self.user} ({self.status})"
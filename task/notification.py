@@ -1,15 +1,188 @@
-import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from fcm_django.models import FCMDevice
+from fcm_django.settings import FCM_DJANGO_SETTINGS
+from firebase_admin import messaging
 from firebase_admin.messaging import Message, Notification
 
+from task.models import PushNotification
+
+logger = logging.getLogger(__name__)
+
+PUSH_SETTINGS = {
+    # Dotted path of the class that talks to FCM
+    "TRANSPORT": "task.notification.FirebaseTransport",
+    # Messages per send_each call, 500 is the FCM maximum
+    "BATCH_SIZE": 500,
+    # Notifications claimed by one drain pass
+    "DRAIN_LIMIT": 1000,
+    "MAX_ATTEMPTS": 5,
+    # Retry delay doubles on every failed attempt, starting from this
+    "RETRY_BACKOFF_SECONDS": 30,
+    "MAX_BACKOFF_SECONDS": 3600,
+    # Claimed rows are skipped by other workers for this long, see claim_notifications
+    "LEASE_SECONDS": 300,
+    # Chat messages within this many seconds of the last push share one, see chat.notification
+    "CHAT_COALESCE_SECONDS": 10,
+}
+PUSH_SETTINGS.update(getattr(settings, "PUSH_NOTIFICATIONS", {}))
+
 
 def notifyTask(user, notification, data):
-    for device in FCMDevice.objects.all().filter(user=user):
-        message = Message(
-            notification=Notification(**notification),
-            data=data  # Add data to the message
+    # Queue the push, the outbox worker (manage.py send_notifications) delivers it
+    PushNotification.objects.create(
+        user=user,
+        title=notification.get("title", ""),
+        body=notification.get("body", ""),
+        data=data,
+    )
+
+
+class FirebaseTransport:
+    def send_each(self, messages):
+        app = FCM_DJANGO_SETTINGS["DEFAULT_FIREBASE_APP"]
+        return messaging.send_each(messages, app=app).responses
+
+
+class LocalTransport:
+    """
+    In-process stand-in for FCM, used by tests and local development.
+    Tokens listed in dead_tokens fail as unregistered, tokens in
+    failing_tokens fail with a retryable error.
+    """
+
+    def __init__(self, dead_tokens=(), failing_tokens=()):
+        self.dead_tokens = set(dead_tokens)
+        self.failing_tokens = set(failing_tokens)
+        self.calls = []
+
+    @property
+    def sent(self):
+        return [message for call in self.calls for message in call if message.token not in self.dead_tokens | self.failing_tokens]
+
+    def send_each(self, messages):
+        self.calls.append(list(messages))
+        responses = []
+        for message in messages:
+            if message.token in self.dead_tokens:
+                responses.append(messaging.SendResponse(None, messaging.UnregisteredError("Unregistered token")))
+            elif message.token in self.failing_tokens:
+                responses.append(messaging.SendResponse(None, messaging.QuotaExceededError("Quota exceeded")))
+            else:
+                responses.append(messaging.SendResponse({"name": f"local/{len(self.calls)}"}, None))
+        return responses
+
+
+def get_transport():
+    return import_string(PUSH_SETTINGS["TRANSPORT"])()
+
+
+def is_dead_token_error(exc):
+    return isinstance(exc, (messaging.UnregisteredError, messaging.SenderIdMismatchError))
+
+
+def retry_delay(attempts):
+    delay = PUSH_SETTINGS["RETRY_BACKOFF_SECONDS"] * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, PUSH_SETTINGS["MAX_BACKOFF_SECONDS"]))
+
+
+def claim_notifications():
+    # Lease the rows in a short transaction instead of holding locks across the
+    # FCM round trip; a worker that dies leaves them to be retried when the lease ends.
+    # The attempt is counted now, so chat pushes stop folding into rows already in flight.
+    now = timezone.now()
+    with transaction.atomic():
+        notifications = list(
+            PushNotification.objects.select_for_update(skip_locked=True)
+            .filter(status=PushNotification.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:PUSH_SETTINGS["DRAIN_LIMIT"]]
+        )
+        PushNotification.objects.filter(pk__in=[notification.pk for notification in notifications]).update(
+            next_attempt_at=now + timedelta(seconds=PUSH_SETTINGS["LEASE_SECONDS"]), attempts=F("attempts") + 1
         )
-        
-        device.send_message(message)
-        
-        
\ No newline at end of file
+    for notification in notifications:
+        notification.attempts += 1
+    return notifications
+
+
+def drain_outbox(transport=None):
+    """
+    Sends every due notification in the outbox and returns how many were
+    processed. Rows are leased first, so several workers can run and no
+    transaction stays open while FCM answers.
+    """
+    transport = transport or get_transport()
+
+    notifications = claim_notifications()
+    if not notifications:
+        return 0
+
+    tokens_by_user = {}
+    devices = FCMDevice.objects.filter(
+        user_id__in={notification.user_id for notification in notifications}, active=True
+    ).values_list("user_id", "registration_id")
+    for user_id, token in devices:
+        tokens_by_user.setdefault(user_id, []).append(token)
+
+    # One message per (notification, device), sent in batches of up to 500
+    outgoing = []
+    for notification in notifications:
+        for token in tokens_by_user.get(notification.user_id, []):
+            message = Message(
+                notification=Notification(title=notification.title, body=notification.body),
+                data=notification.data,
+                token=token,
+            )
+            outgoing.append((notification, message))
+
+    delivered, errors, dead_tokens = set(), {}, set()
+    batch_size = PUSH_SETTINGS["BATCH_SIZE"]
+    for i in range(0, len(outgoing), batch_size):
+        batch = outgoing[i:i + batch_size]
+        try:
+            responses = transport.send_each([message for _, message in batch])
+        except Exception as exc:
+            logger.warning("Push batch failed: %s", exc)
+            responses = [messaging.SendResponse(None, exc)] * len(batch)
+
+        for (notification, message), result in zip(batch, responses):
+            if result.success:
+                delivered.add(notification.pk)
+            elif is_dead_token_error(result.exception):
+                dead_tokens.add(message.token)
+            else:
+                errors[notification.pk] = str(result.exception)
+
+    now = timezone.now()
+    for notification in notifications:
+        notification.updated_at = now
+        if notification.pk in delivered or notification.pk not in errors:
+            # Reached at least one device, or there is no live device to retry
+            notification.status = PushNotification.SENT
+            notification.sent_at = now
+            notification.last_error = None
+        elif notification.attempts >= PUSH_SETTINGS["MAX_ATTEMPTS"]:
+            notification.status = PushNotification.FAILED
+            notification.last_error = errors[notification.pk]
+        else:
+            notification.next_attempt_at = now + retry_delay(notification.attempts)
+            notification.last_error = errors[notification.pk]
+
+    # The results, in a second short transaction
+    with transaction.atomic():
+        PushNotification.objects.bulk_update(
+            notifications, ["status", "attempts", "next_attempt_at", "last_error", "sent_at", "updated_at"]
+        )
+        if dead_tokens:
+            # Same pruning rule as fcm_django: deactivate, or delete when DELETE_INACTIVE_DEVICES is set
+            FCMDevice.objects.filter(registration_id__in=dead_tokens).update(active=False)
+            if FCM_DJANGO_SETTINGS["DELETE_INACTIVE_DEVICES"]:
+                FCMDevice.objects.filter(registration_id__in=dead_tokens).delete()
+
+    return len(notifications)
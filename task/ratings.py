@@ -0,0 +1,145 @@
+"""
+Rating aggregates on UserProfile (provider_rating_* and performer_rating_*).
+
+provider_rate rates the task's provider and performer_rate its performer.
+Saving or deleting a review moves only the difference from the rates it was
+loaded with (see TaskConfig.ready), so nothing is recounted per request.
+`manage.py rebuild_ratings` recomputes every profile from TaskReview.
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from user_profile.models import UserProfile, empty_rating_histogram
+from user_profile.signals import profiles_bulk_updated
+
+from .models import Task, TaskReview
+
+# Role: (TaskReview column, Task field of the rated profile)
+RATED_BY = {'provider': ('provider_rate', 'provider'), 'performer': ('performer_rate', 'performer')}
+BATCH_SIZE = 500
+
+
+def summarize(histogram):
+    # Stored columns of one role's histogram, unrated reviews (0) left out of count and sum
+    return {
+        'count': sum(histogram[1:]),
+        'sum': sum(stars * count for stars, count in enumerate(histogram)),
+        'histogram': histogram,
+    }
+
+
+def rating_aggregates(reviews, profile_pks=None):
+    """
+    {profile pk: {field: value}} of every profile rated by `reviews` (a
+    TaskReview queryset), or of those in `profile_pks` only, two GROUP BY
+    queries in all.
+    """
+    histograms = {}
+    for role, (rate_field, profile_field) in RATED_BY.items():
+        if profile_pks is None:
+            rated = reviews.filter(**{f'task__{profile_field}__isnull': False})
+        else:
+            rated = reviews.filter(**{f'task__{profile_field}__in': profile_pks})
+        rows = rated.order_by().values(
+            f'task__{profile_field}_id', rate_field
+        ).annotate(reviews=Count('id')).values_list(f'task__{profile_field}_id', rate_field, 'reviews')
+        for profile_pk, stars, count in rows:
+            histograms.setdefault(profile_pk, {}).setdefault(role, empty_rating_histogram())[stars] += count
+    return {
+        profile_pk: {
+            f'{role}_rating_{name}': value
+            for role in UserProfile.RATING_ROLES
+            for name, value in summarize(roles.get(role, empty_rating_histogram())).items()
+        }
+        for profile_pk, roles in histograms.items()
+    }
+
+
+def apply_rates(task_id, old, new):
+    """
+    Moves the aggregates of the task's provider and performer from the
+    `old` rates ({role: stars}, empty for a new review) to the `new` ones
+    (empty for a deleted review).
+    """
+    rated = Task.objects.filter(pk=task_id).values_list('provider_id', 'performer_id').first()
+    if rated is None:
+        return
+    changes = {}
+    for role, profile_pk in zip(('provider', 'performer'), rated):
+        if profile_pk is not None and old.get(role) != new.get(role):
+            changes.setdefault(profile_pk, []).append((role, old.get(role), new.get(role)))
+    if not changes:
+        return
+
+    with transaction.atomic():
+        # Locked in pk order, so two reviews between the same people can't deadlock
+        profiles = list(
+            UserProfile.objects.select_related(None).select_for_update().filter(pk__in=changes).order_by('pk').only('pk', 'user_id', *UserProfile.RATING_FIELDS)
+        )
+        for profile in profiles:
+            for role, before, after in changes[profile.pk]:
+                histogram = list(getattr(profile, f'{role}_rating_histogram'))
+                if before is not None:
+                    histogram[before] -= 1
+                if after is not None:
+                    histogram[after] += 1
+                for name, value in summarize(histogram).items():
+                    setattr(profile, f'{role}_rating_{name}', value)
+        UserProfile.objects.bulk_update(profiles, UserProfile.RATING_FIELDS)
+        updated = [(profile.pk, profile.user_id) for profile in profiles]
+        # bulk_update skips post_save, this drops the cached payloads once the ratings are visible
+        transaction.on_commit(lambda: profiles_bulk_updated.send(sender=UserProfile, profiles=updated))
+
+
+def review_rates(review, loaded):
+    # {role: stars} of a review as saved now, or as it was loaded
+    return {
+        role: review.loaded_value(rate_field) if loaded else getattr(review, rate_field)
+        for role, (rate_field, _) in RATED_BY.items()
+    }
+
+
+def review_saved(sender, instance, created, **kwargs):
+    if created:
+        apply_rates(instance.task_id, {}, review_rates(instance, loaded=False))
+    elif any(instance.has_changed(name) for name in instance.tracked_fields):
+        apply_rates(instance.task_id, review_rates(instance, loaded=True), review_rates(instance, loaded=False))
+
+
+def review_deleted(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', None) is not None
+    apply_rates(instance.task_id, review_rates(instance, loaded=loaded), {})
+
+
+def rebuild_ratings(batch_size=BATCH_SIZE):
+    """
+    Rewrites the aggregates of every profile whose stored values differ from
+    what its reviews add up to. Returns how many profiles changed.
+    """
+    empty = {
+        f'{role}_rating_{name}': value
+        for role in UserProfile.RATING_ROLES
+        for name, value in summarize(empty_rating_histogram()).items()
+    }
+    profiles = UserProfile.objects.select_related(None).order_by('pk').only('pk', 'user_id', *UserProfile.RATING_FIELDS)
+    last_pk, total = 0, 0
+    while True:
+        with transaction.atomic():
+            batch = list(profiles.select_for_update().filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return total
+            last_pk = batch[-1].pk
+            # Counted under the lock, a review saved meanwhile waits for it and then moves these values
+            aggregates = rating_aggregates(TaskReview.objects.all(), [profile.pk for profile in batch])
+            changed = []
+            for profile in batch:
+                expected = aggregates.get(profile.pk, empty)
+                if any(getattr(profile, field) != value for field, value in expected.items()):
+                    for field, value in expected.items():
+                        setattr(profile, field, value)
+                    changed.append(profile)
+            if changed:
+                UserProfile.objects.bulk_update(changed, UserProfile.RATING_FIELDS)
+                updated = [(profile.pk, profile.user_id) for profile in changed]
+                transaction.on_commit(lambda updated=updated: profiles_bulk_updated.send(sender=UserProfile, profiles=updated))
+                total += len(changed)
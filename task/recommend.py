@@ -0,0 +1,298 @@
+"""
+Task recommendations for performers.
+
+Open tasks are kept as NumPy feature arrays (category, position on the unit
+sphere, reward, provider rating) in a TaskIndex that the
+refresh_recommendations job updates incrementally and publishes to the
+cache. Each performer gets a small profile (category affinity from their
+applications and completed tasks, and their recent task locations). A
+request scores every open task in one vectorized pass and keeps the top k.
+"""
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from user_profile.models import UserProfile
+
+from .geo import EARTH_RADIUS_KM
+from .models import Task, TaskApplicant, TaskReview
+
+RECOMMEND_SETTINGS = {
+    # How much each signal weighs in the score, every signal is scaled to 0..1
+    "WEIGHTS": {"affinity": 0.4, "distance": 0.3, "reward": 0.15, "rating": 0.15},
+    # Distance at which the distance signal drops to 1/e
+    "DISTANCE_SCALE_KM": 10.0,
+    # Affinity per application and per completed task
+    "APPLIED_WEIGHT": 1.0,
+    "COMPLETED_WEIGHT": 3.0,
+    # Recent task locations kept per performer
+    "MAX_LOCATIONS": 5,
+    # Provider ratings are pulled toward this many reviews of RATING_PRIOR stars
+    "RATING_PRIOR": 3.5,
+    "RATING_PRIOR_COUNT": 3,
+    # Rows saved this long before a pass are read again by the next one, for
+    # transactions that committed late
+    "OVERLAP_SECONDS": 60,
+    # Rebuild from scratch this often, so deleted tasks don't linger
+    "FULL_REFRESH_SECONDS": 60 * 60,
+    # A web process refreshes its own copy when nothing newer was published
+    "MAX_STALENESS_SECONDS": 5 * 60,
+    "PERFORMER_TIMEOUT": 60 * 60,
+}
+RECOMMEND_SETTINGS.update(getattr(settings, "RECOMMENDATIONS", {}))
+
+SNAPSHOT_KEY = "recommend:tasks"
+VERSION_KEY = "recommend:version"
+ARRAYS = ('ids', 'category', 'provider', 'xyz', 'reward', 'rating')
+
+
+def unit_vectors(latitudes, longitudes):
+    # Points on the unit sphere: the angle between two is their great-circle distance
+    lat, lng = np.radians(np.asarray(latitudes, dtype=np.float64)), np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack((np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat))).reshape(-1, 3)
+
+
+def provider_ratings(provider_ids=None):
+    # {provider pk: smoothed provider rating scaled to 0..1}, from the aggregates task.ratings keeps
+    profiles = UserProfile.objects.filter(provider_rating_count__gt=0)
+    if provider_ids is not None:
+        profiles = profiles.filter(pk__in=list(provider_ids))
+    prior, prior_count = RECOMMEND_SETTINGS["RATING_PRIOR"], RECOMMEND_SETTINGS["RATING_PRIOR_COUNT"]
+    return {
+        provider_id: (total + prior * prior_count) / (count + prior_count) / 5
+        for provider_id, total, count in profiles.order_by().values_list('pk', 'provider_rating_sum', 'provider_rating_count')
+    }
+
+
+class TaskIndex:
+    """
+    Feature arrays of the open tasks (PENDING, no performer yet), one row per
+    task, in the order of `ids`.
+    """
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.category = np.empty(0, dtype=np.int64)
+        self.provider = np.empty(0, dtype=np.int64)
+        self.xyz = np.empty((0, 3), dtype=np.float64)
+        self.reward = np.empty(0, dtype=np.float32)
+        self.rating = np.empty(0, dtype=np.float32)
+        # Tasks and reviews changed after `since` are picked up by the next refresh
+        self.since = None
+        self.built_at = None
+        self.refreshed_at = 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def refresh(self):
+        """
+        Brings the arrays up to date: every open task on the first pass and
+        once per FULL_REFRESH_SECONDS, otherwise only the tasks and reviews
+        changed since the last pass.
+        """
+        started = timezone.now()
+        full = self.since is None or (started - self.built_at).total_seconds() > RECOMMEND_SETTINGS["FULL_REFRESH_SECONDS"]
+        fields = ('id', 'task_category_id', 'provider_id', 'latitude', 'longitude', 'reward')
+        if full:
+            self.__init__()
+            self.upsert(list(Task.objects.filter(status=Task.PENDING, performer=None).values_list(*fields)))
+            self.built_at = started
+        else:
+            since = self.since - timedelta(seconds=RECOMMEND_SETTINGS["OVERLAP_SECONDS"])
+            changed = Task.objects.filter(updated_at__gte=since)
+            self.remove(changed.exclude(status=Task.PENDING, performer=None).values_list('id', flat=True))
+            self.upsert(list(changed.filter(status=Task.PENDING, performer=None).values_list(*fields)))
+            # New reviews change their provider's rating on every open task of theirs
+            reviewed = set(TaskReview.objects.filter(updated_at__gte=since).values_list('task__provider_id', flat=True))
+            if reviewed:
+                self.update_ratings(reviewed)
+        self.since = started
+        self.refreshed_at = time.time()
+        return full
+
+    def upsert(self, rows):
+        if not rows:
+            return
+        ids, category, provider, lat, lng, reward = zip(*rows)
+        self.remove(ids)
+        ratings = provider_ratings(set(provider))
+        self.ids = np.concatenate((self.ids, np.array(ids, dtype=np.int64)))
+        self.category = np.concatenate((self.category, np.array(category, dtype=np.int64)))
+        self.provider = np.concatenate((self.provider, np.array(provider, dtype=np.int64)))
+        self.xyz = np.concatenate((self.xyz, unit_vectors(lat, lng)))
+        self.reward = np.concatenate((self.reward, np.array(reward, dtype=np.float32)))
+        self.rating = np.concatenate((self.rating, np.array([self.default_rating(ratings, pk) for pk in provider], dtype=np.float32)))
+
+    def remove(self, task_ids):
+        keep = ~np.isin(self.ids, np.fromiter(task_ids, dtype=np.int64))
+        if not keep.all():
+            for name in ARRAYS:
+                setattr(self, name, getattr(self, name)[keep])
+
+    def update_ratings(self, provider_ids):
+        ratings = provider_ratings(provider_ids)
+        for provider_id in provider_ids:
+            self.rating[self.provider == provider_id] = self.default_rating(ratings, provider_id)
+
+    @staticmethod
+    def default_rating(ratings, provider_id):
+        return ratings.get(provider_id, RECOMMEND_SETTINGS["RATING_PRIOR"] / 5)
+
+    def dumps(self):
+        buffer = BytesIO()
+        np.savez(buffer, **{name: getattr(self, name) for name in ARRAYS})
+        return {'arrays': buffer.getvalue(), 'since': self.since, 'built_at': self.built_at, 'refreshed_at': self.refreshed_at}
+
+    @classmethod
+    def loads(cls, snapshot):
+        index = cls()
+        with np.load(BytesIO(snapshot['arrays'])) as arrays:
+            for name in ARRAYS:
+                setattr(index, name, arrays[name])
+        index.since, index.built_at, index.refreshed_at = snapshot['since'], snapshot['built_at'], snapshot['refreshed_at']
+        return index
+
+    def publish(self):
+        cache.set(SNAPSHOT_KEY, self.dumps(), None)
+        # Set last: a reader that sees the version finds the snapshot
+        cache.set(VERSION_KEY, self.refreshed_at, None)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    This process's TaskIndex: reloaded when the job publishes a newer one
+    (one cache read per call otherwise), refreshed here if none is recent.
+    """
+    global _index
+    published = cache.get(VERSION_KEY)
+    with _index_lock:
+        if published and (_index is None or published > _index.refreshed_at):
+            snapshot = cache.get(SNAPSHOT_KEY)
+            if snapshot is not None:
+                _index = TaskIndex.loads(snapshot)
+        if _index is None or time.time() - _index.refreshed_at > RECOMMEND_SETTINGS["MAX_STALENESS_SECONDS"]:
+            index = _index or TaskIndex()
+            index.refresh()
+            index.publish()
+            _index = index
+        return _index
+
+
+def performer_key(profile_pk):
+    return f"recommend:performer:{profile_pk}"
+
+
+def build_performer_profile(profile_pk):
+    # {'affinity': {category: weight}, 'locations': [[lat, lng], ...], 'applied': [task pk, ...]}
+    history = [
+        (RECOMMEND_SETTINGS["APPLIED_WEIGHT"], row)
+        for row in TaskApplicant.objects.filter(performer_id=profile_pk).values_list(
+            'task__task_category_id', 'task__latitude', 'task__longitude', 'created_at'
+        )
+    ] + [
+        (RECOMMEND_SETTINGS["COMPLETED_WEIGHT"], row)
+        for row in Task.objects.filter(performer_id=profile_pk, status=Task.COMPLETED).values_list(
+            'task_category_id', 'latitude', 'longitude', 'updated_at'
+        )
+    ]
+    affinity = {}
+    for weight, (category, _, _, _) in history:
+        affinity[category] = affinity.get(category, 0) + weight
+    recent = sorted(history, key=lambda entry: entry[1][3], reverse=True)
+    return {
+        'affinity': affinity,
+        'locations': [[lat, lng] for _, (_, lat, lng, _) in recent[:RECOMMEND_SETTINGS["MAX_LOCATIONS"]]],
+        # Open tasks they already applied to aren't recommended again
+        'applied': list(TaskApplicant.objects.filter(
+            performer_id=profile_pk, task__status=Task.PENDING
+        ).values_list('task_id', flat=True)),
+    }
+
+
+def get_performer_profile(profile_pk):
+    profile = cache.get(performer_key(profile_pk))
+    if profile is None:
+        profile = refresh_performer_profile(profile_pk)
+    return profile
+
+
+def forget_performer_profile(profile_pk):
+    # Rebuilt on their next request, or by the job before that
+    cache.delete(performer_key(profile_pk))
+
+
+def refresh_performer_profile(profile_pk):
+    profile = build_performer_profile(profile_pk)
+    cache.set(performer_key(profile_pk), profile, RECOMMEND_SETTINGS["PERFORMER_TIMEOUT"])
+    return profile
+
+
+def active_performers(since):
+    # Performers whose history changed since `since`, for the job to refresh
+    applied = TaskApplicant.objects.filter(created_at__gte=since, performer__isnull=False).values_list('performer_id', flat=True)
+    completed = Task.objects.filter(updated_at__gte=since, status=Task.COMPLETED, performer__isnull=False).values_list('performer_id', flat=True)
+    return set(applied) | set(completed)
+
+
+def score_tasks(index, performer, exclude_provider=None):
+    # One score per row of `index`, higher is better; own and applied tasks get -inf
+    weights = RECOMMEND_SETTINGS["WEIGHTS"]
+    scores = np.zeros(len(index), dtype=np.float64)
+    if not len(index):
+        return scores
+
+    affinity = performer['affinity']
+    if affinity:
+        # Dense lookup table by category pk, scaled so the favorite category is 1
+        table = np.zeros(max(int(index.category.max()), *map(int, affinity)) + 1)
+        for category, weight in affinity.items():
+            table[int(category)] = weight
+        scores += weights["affinity"] * table[index.category] / table.max()
+
+    if performer['locations']:
+        places = unit_vectors(*zip(*performer['locations']))
+        # Closest usual location: the largest cosine is the smallest angle
+        cosine = np.clip((index.xyz @ places.T).max(axis=1), -1.0, 1.0)
+        distance_km = np.arccos(cosine) * EARTH_RADIUS_KM
+        scores += weights["distance"] * np.exp(-distance_km / RECOMMEND_SETTINGS["DISTANCE_SCALE_KM"])
+
+    top_reward = index.reward.max()
+    if top_reward > 0:
+        scores += weights["reward"] * np.log1p(np.maximum(index.reward, 0)) / np.log1p(top_reward)
+    scores += weights["rating"] * index.rating
+
+    if exclude_provider is not None:
+        scores[index.provider == exclude_provider] = -np.inf
+    if performer['applied']:
+        scores[np.isin(index.ids, np.array(performer['applied'], dtype=np.int64))] = -np.inf
+    return scores
+
+
+def top_tasks(index, scores, k):
+    # Task pks of the k best scores, best first; argpartition keeps this O(n)
+    candidates = np.flatnonzero(np.isfinite(scores))
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    order = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return index.ids[order].tolist()
+
+
+def recommend(profile_pk, k):
+    """
+    Pks of up to k open tasks for the performer, best first. Tasks they
+    posted are left out; the caller filters what changed since the last
+    refresh (see RecommendedTaskListView).
+    """
+    index = get_index()
+    return top_tasks(index, score_tasks(index, get_performer_profile(profile_pk), exclude_provider=profile_pk), k)
@@ -0,0 +1,135 @@
+"""
+Full-text search over tasks: title, category title, description and address,
+best matches first.
+
+Postgres keeps a weighted tsvector in Task.search_vector (GIN indexed by
+migration 0028); SQLite keeps the same columns in the task_search FTS5 table.
+Both are refreshed by update_search_index whenever a task's text or its
+category's title changes (see TaskConfig.ready).
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import F, FloatField, OuterRef, Q, Subquery
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+# No stemming: listings mix English and Filipino
+SEARCH_CONFIG = 'simple'
+FTS_TABLE = 'task_search'
+# Task fields that feed the index, besides the category's title
+SOURCE_FIELDS = ('title', 'description', 'address', 'task_category_id')
+# title, category, description, address; the tsvector weights and FTS5 bm25 weights
+WEIGHTS = ('A', 'B', 'C', 'D')
+BM25_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+MAX_TERMS = 8
+BATCH_SIZE = 500
+
+
+def search_terms(text):
+    # Words only, so nothing in the input is query syntax
+    return re.findall(r'\w+', (text or '').lower())[:MAX_TERMS]
+
+
+def category_title(tasks):
+    category = tasks.model._meta.get_field('task_category').related_model
+    return Subquery(category.objects.filter(pk=OuterRef('task_category_id')).order_by().values('title')[:1])
+
+
+def update_search_index(tasks):
+    """
+    Recomputes the search entries of a Task queryset: one UPDATE on Postgres,
+    a delete and an INSERT ... SELECT per batch on SQLite.
+    """
+    connection = connections[tasks.db]
+    if connection.vendor == 'postgresql':
+        sources = (F('title'), category_title(tasks), F('description'), F('address'))
+        vector = None
+        for source, weight in zip(sources, WEIGHTS):
+            part = SearchVector(source, weight=weight, config=SEARCH_CONFIG)
+            vector = part if vector is None else vector + part
+        tasks.update(search_vector=vector)
+    elif connection.vendor == 'sqlite':
+        task_table = tasks.model._meta.db_table
+        category_table = tasks.model._meta.get_field('task_category').related_model._meta.db_table
+        ids = list(tasks.values_list('pk', flat=True))
+        with connection.cursor() as cursor:
+            for i in range(0, len(ids), BATCH_SIZE):
+                batch = ids[i:i + BATCH_SIZE]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', batch)
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE} (rowid, title, category, description, address) '
+                    f'SELECT t.id, t.title, c.title, t.description, t.address FROM {task_table} t '
+                    f'JOIN {category_table} c ON c.id = t.task_category_id WHERE t.id IN ({placeholders})',
+                    batch,
+                )
+
+
+def remove_from_search_index(task_ids, using='default'):
+    # Postgres' vector goes with the row, only the FTS5 table needs cleaning up
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and task_ids:
+        placeholders = ', '.join(['%s'] * len(task_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', list(task_ids))
+
+
+def search_tasks(queryset, text):
+    """
+    Tasks matching every word of `text` (as a prefix, for search-as-you-type),
+    annotated with `rank` and ordered by it, newest first among equals.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    ordering = ('-rank', '-updated_at', '-id')
+
+    if vendor == 'postgresql':
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by(*ordering)
+
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+        task_table = queryset.model._meta.db_table
+        # bm25 is lower for better matches
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{task_table}"."id"',
+            [match], output_field=FloatField(),
+        )
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        return queryset.filter(pk__in=matches).annotate(rank=rank).order_by(*ordering)
+
+    # Other databases: every word somewhere in the text, unranked
+    for term in terms:
+        queryset = queryset.filter(
+            Q(title__icontains=term) | Q(description__icontains=term)
+            | Q(address__icontains=term) | Q(task_category__title__icontains=term)
+        )
+    return queryset.order_by(*ordering[1:])
+
+
+class TaskSearchFilter(BaseFilterBackend):
+    """
+    ?search= through Task.objects.search. Results come ranked, unless the view
+    orders them afterwards (distance for location filters, recency for
+    before/after cursors).
+    """
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        return queryset.search(request.query_params.get(self.search_param, ''))
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param, 'required': False, 'in': 'query',
+            'description': "Words to find in the title, category, description or address.",
+            'schema': {'type': 'string'},
+        }]
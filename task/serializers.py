@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from user_profile.serializers import UserSerializer, UserReportSerializer
+from user_profile.serializers import PhotoVariantField, RatingSummaryField, UserSerializer, UserReportSerializer
 from user_profile.models import UserProfile, UserReport
 from rest_framework.validators import UniqueTogetherValidator
 
@@ -15,13 +15,22 @@ class TaskCategorySerializers(serializers.ModelSerializer):
 class TaskProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer()
     report = serializers.SerializerMethodField()
+    # Lists show avatars, not the full upload
+    profile_photo = PhotoVariantField('small')
+    # Aggregates stored on the profile row, no query of their own
+    provider_rating = RatingSummaryField('provider')
+    performer_rating = RatingSummaryField('performer')
     class Meta:
         model = UserProfile
-        fields = '__all__'
+        exclude = ['photo_variants', *UserProfile.RATING_FIELDS]
     
     def get_report(self, obj):
-        # Check if the user has any reports
-        report = UserReport.objects.filter(reported_user=obj.user).exclude(status='Resolved').first()  # Assuming 'reporter' is a ForeignKey to the user in UserReport
+        # List views share one batched lookup for the whole page through the context
+        resolver = self.context.get('report_resolver')
+        if resolver is not None and resolver.covers(obj.user_id):
+            report = resolver.get(obj.user_id)
+        else:
+            report = UserReport.objects.filter(reported_user_id=obj.user_id).exclude(status='resolved').order_by('pk').first()
         return UserReportSerializer(report).data if report else None
 
     def __init__(self, *args, **kwargs):
@@ -30,19 +39,16 @@ class TaskProfileSerializer(serializers.ModelSerializer):
         self.request = context.get('request', None)
         super(TaskProfileSerializer, self).__init__(*args, **kwargs)
 
-    def get_profile_photo(self, data):
-        request = self.context.get('request')
-        photo_url = data.profile_photo.url
-        return request.build_absolute_uri(photo_url)
-
 class TaskListSerializers(serializers.ModelSerializer):
     task_category = TaskCategorySerializers()
     provider = TaskProfileSerializer()
     performer = TaskProfileSerializer()
+    # Only present when the list is filtered by location (km from the given point)
+    distance = serializers.FloatField(read_only=True)
 
     class Meta:
         model = Task
-        fields = '__all__'
+        exclude = ['search_vector']
 
 
 class TaskReviewSerializers(serializers.ModelSerializer):
@@ -66,6 +72,49 @@ class TaskReviewSerializers(serializers.ModelSerializer):
         instance.save()
         return instance
 
+
+# Timestamps as ModelSerializer renders them, for serializers that build rows by hand
+format_datetime = serializers.DateTimeField().to_representation
+
+
+class CompactTaskReviewSerializer(serializers.BaseSerializer):
+    """
+    Review feed entry built from TaskReview.objects.compact() rows: the
+    review, its task's id and title, and the other party's name and
+    thumbnail. `review_subject` in the context is the profile pk the list is
+    about; the counterpart is whoever isn't them.
+    """
+    REVIEW_FIELDS = ('id', 'provider_rate', 'provider_feedback', 'performer_rate', 'performer_feedback')
+
+    def to_representation(self, row):
+        subject = self.context.get('review_subject')
+        role = 'provider' if str(row['task__performer__id']) == str(subject) else 'performer'
+        representation = {name: row[name] for name in self.REVIEW_FIELDS}
+        representation.update(
+            created_at=format_datetime(row['created_at']),
+            updated_at=format_datetime(row['updated_at']),
+            task={'id': row['task_id'], 'title': row['task__title']},
+            counterpart=self.counterpart(row, role),
+        )
+        return representation
+
+    def counterpart(self, row, role):
+        prefix = f'task__{role}__'
+        if row[f'{prefix}id'] is None:
+            return None
+        photo = UserProfile.stored_photo_url(
+            'profile_photo', row[f'{prefix}profile_photo'], row[f'{prefix}photo_variants'] or {}, 'thumb'
+        )
+        request = self.context.get('request')
+        return {
+            'id': row[f'{prefix}id'],
+            'role': role,
+            'first_name': row[f'{prefix}user__first_name'],
+            'last_name': row[f'{prefix}user__last_name'],
+            'profile_photo': request.build_absolute_uri(photo) if photo and request else photo,
+        }
+
+
 class TaskPrevReviewSerializers(serializers.ModelSerializer):
     class Meta:
         model = TaskReview
@@ -1,3 +1,637 @@
+import base64
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from fcm_django.models import FCMDevice
+from rest_framework.test import APIClient
+
+from task import recommend
+from task.geo import haversine_km
+from task.management.commands.benchmark_review_list import Command as BenchmarkReviewList
+from task.notification import PUSH_SETTINGS, LocalTransport, drain_outbox, notifyTask
+from user_profile.models import UserProfile, UserReport
+from .models import PushNotification, Task, TaskApplicant, TaskCategory, TaskReview
+
+
+def create_profile(username, **kwargs):
+    user = User.objects.create(username=username, email=f"{username}@example.com",
+                               first_name=username.title(), last_name="Tester")
+    return UserProfile.objects.create(user=user, address="Legazpi City", contact_number="09170000000", **kwargs)
+
+
+def create_task(provider, category, latitude=13.1391, longitude=123.7438, **kwargs):
+    kwargs.setdefault('title', 'Fix the fence')
+    kwargs.setdefault('description', "Needs help")
+    kwargs.setdefault('address', "Albay")
+    return Task.objects.create(
+        task_category=category, provider=provider, latitude=latitude, longitude=longitude, **kwargs
+    )
+
+
+def capture_queries(client, url, params=None):
+    with CaptureQueriesContext(connection) as ctx:
+        res = client.get(url, params or {})
+    assert res.status_code == 200, res.data
+    return [query['sql'] for query in ctx.captured_queries]
+
+
+def build_marketplace(me, tasks=4, applicants=3):
+    """
+    Creates tasks where `me` is the provider, the performer and an applicant,
+    each with reported counterparts, so every list endpoint has a full page.
+    """
+    category = TaskCategory.objects.get_or_create(title="Repair")[0]
+    for i in range(tasks):
+        other = create_profile(f"other{me.pk}x{i}")
+        UserReport.objects.create(reporter=me.user, reported_user=other.user, reason="Spam")
+        offered = create_task(me, category, title=f"Mine {i}", performer=other, status=Task.COMPLETED, is_done_perform=True)
+        TaskReview.objects.create(task=offered, provider_rate=5, performer_rate=4)
+        create_task(other, category, title=f"Assigned {i}", performer=me, status=Task.IN_PROGRESS)
+        open_task = create_task(other, category, title=f"Open {i}")
+        TaskApplicant.objects.create(task=open_task, performer=me)
+        for j in range(applicants):
+            applicant = create_profile(f"applicant{me.pk}x{i}x{j}")
+            UserReport.objects.create(reporter=me.user, reported_user=applicant.user, reason="Fake")
+            TaskApplicant.objects.create(task=open_task, performer=applicant)
+            TaskApplicant.objects.create(task=offered, performer=applicant)
+    return category
+
+
+def sequential_scans(queries):
+    # EXPLAIN each captured SELECT and return the plan steps that read a whole table
+    scans = []
+    with connection.cursor() as cursor:
+        for sql in queries:
+            if not sql.startswith('SELECT'):
+                continue
+            if connection.vendor == 'postgresql':
+                # Seeded tables are tiny, so make the planner show what it would use at scale
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                scans += [row[0] for row in cursor.fetchall() if 'Seq Scan' in row[0]]
+            else:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                # Derived tables (DISTINCT counts) show up as "SCAN subquery", those aren't tables
+                scans += [row[-1] for row in cursor.fetchall()
+                          if row[-1].startswith('SCAN ') and ' USING ' not in row[-1] and 'subquery' not in row[-1]]
+    return scans
+
+
+LIST_ENDPOINTS = [
+    ('api:task-list', {}),
+    ('api:provider-list', {}),
+    ('api:performer-list', {}),
+    ('api:task-review-list', {'my_reviews': 1}),
+    ('api:taskapplicant-list', {}),
+]
+
+
+class ReportQueryTests(TestCase):
+    def setUp(self):
+        self.me = create_profile("me")
+        build_marketplace(self.me)
+        self.client = APIClient()
+        self.client.force_authenticate(self.me.user)
+
+    def test_reports_are_loaded_once_per_list(self):
+        for name, params in LIST_ENDPOINTS:
+            with self.subTest(endpoint=name):
+                queries = capture_queries(self.client, reverse(name), params)
+                report_queries = [sql for sql in queries if 'FROM "user_profile_userreport"' in sql]
+                self.assertEqual(len(report_queries), 1, report_queries)
+
+    def test_open_report_is_embedded(self):
+        res = self.client.get(reverse('api:taskapplicant-list'))
+        task = res.data['results'][0]
+        self.assertEqual(task['provider']['report']['reason'], "Spam")
+        self.assertEqual({a['performer']['report']['reason'] for a in task['task_applicants'] if a['performer']['id'] != self.me.pk}, {"Fake"})
+        self.assertIsNone(next(a for a in task['task_applicants'] if a['performer']['id'] == self.me.pk)['performer']['report'])
+
+    def test_resolved_reports_are_skipped(self):
+        UserReport.objects.update(status='resolved')
+        res = self.client.get(reverse('api:task-list'))
+        self.assertIsNone(res.data['results'][0]['provider']['report'])
+
+
+class QueryPlanTests(TestCase):
+    def query_counts(self, username, tasks, applicants):
+        me = create_profile(username)
+        build_marketplace(me, tasks=tasks, applicants=applicants)
+        client = APIClient()
+        client.force_authenticate(me.user)
+        return {name: capture_queries(client, reverse(name), params) for name, params in LIST_ENDPOINTS}
+
+    def test_query_count_is_constant(self):
+        small = self.query_counts("small", tasks=1, applicants=1)
+        large = self.query_counts("large", tasks=12, applicants=4)
+        for name, _ in LIST_ENDPOINTS:
+            with self.subTest(endpoint=name):
+                self.assertEqual(len(small[name]), len(large[name]), large[name])
+
+    def test_no_sequential_scans(self):
+        me = create_profile("me")
+        build_marketplace(me, tasks=3, applicants=2)
+        client = APIClient()
+        client.force_authenticate(me.user)
+        filtered = [
+            ('api:provider-list', {'status': Task.PENDING}),
+            ('api:performer-list', {'status': Task.IN_PROGRESS}),
+            ('api:taskapplicant-list', {'status': Task.PENDING}),
+        ]
+        for name, params in LIST_ENDPOINTS + filtered:
+            with self.subTest(endpoint=name, params=params):
+                self.assertEqual(sequential_scans(capture_queries(client, reverse(name), params)), [])
+
+    def test_user_columns_are_trimmed(self):
+        queries = self.query_counts("me", tasks=2, applicants=2)
+        for name, _ in LIST_ENDPOINTS:
+            with self.subTest(endpoint=name):
+                self.assertFalse([sql for sql in queries[name] if '"password"' in sql and 'FROM "task_' in sql])
+
+
+class NearbyTaskTests(TestCase):
+    # Legazpi City, Albay
+    origin = (13.1391, 123.7438)
+
+    def setUp(self):
+        self.category = TaskCategory.objects.create(title="Repair")
+        self.provider = create_profile("provider")
+        self.performer = create_profile("performer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.performer.user)
+
+        self.near = create_task(self.provider, self.category, 13.1450, 123.7500, title="Near")        # ~1 km
+        self.town = create_task(self.provider, self.category, 13.2500, 123.6800, title="Town")        # ~14 km
+        self.far = create_task(self.provider, self.category, 14.5995, 120.9842, title="Manila")       # ~340 km
+        create_task(self.provider, self.category, 13.1400, 123.7440, title="Taken", performer=self.performer)
+
+    def test_haversine(self):
+        self.assertAlmostEqual(haversine_km(0, 0, 0, 1), 111.19, places=1)
+        self.assertAlmostEqual(haversine_km(13.1391, 123.7438, 13.1391, 123.7438), 0)
+
+    def test_radius_filters_and_sorts_by_distance(self):
+        res = self.client.get(reverse('api:task-list'), {
+            'latitude': self.origin[0], 'longitude': self.origin[1], 'radius': 20,
+        })
+        self.assertEqual(res.status_code, 200)
+        titles = [task['title'] for task in res.data['results']]
+        self.assertEqual(titles, ['Near', 'Town'])
+        expected = haversine_km(*self.origin, self.town.latitude, self.town.longitude)
+        self.assertAlmostEqual(res.data['results'][1]['distance'], expected, places=3)
+
+    def test_nearest_expands_radius(self):
+        res = self.client.get(reverse('api:task-list'), {
+            'latitude': self.origin[0], 'longitude': self.origin[1], 'nearest': 3,
+        })
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([task['title'] for task in res.data['results']], ['Near', 'Town', 'Manila'])
+
+    def test_antimeridian(self):
+        west = create_task(self.provider, self.category, 0, -179.95, title="West")
+        tasks = Task.objects.nearby(0, 179.95, 20)
+        self.assertEqual(list(tasks), [west])
+
+    def test_invalid_coordinates(self):
+        res = self.client.get(reverse('api:task-list'), {'latitude': 'abc', 'longitude': 1})
+        self.assertEqual(res.status_code, 400)
+        res = self.client.get(reverse('api:task-list'), {'latitude': 1, 'longitude': 1, 'nearest': 0})
+        self.assertEqual(res.status_code, 400)
+        for radius in ('nan', 'inf', '-1'):
+            res = self.client.get(reverse('api:task-list'), {'latitude': 1, 'longitude': 1, 'radius': radius})
+            self.assertEqual(res.status_code, 400, radius)
+
+    def test_plain_list_has_no_distance(self):
+        res = self.client.get(reverse('api:task-list'))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['count'], 3)
+        self.assertNotIn('distance', res.data['results'][0])
+
+
+class TaskFeedKeysetTests(TestCase):
+    def setUp(self):
+        category = TaskCategory.objects.create(title="Repair")
+        provider = create_profile("provider")
+        self.tasks = [create_task(provider, category, title=f"Task {i}") for i in range(23)]
+        # Ties on updated_at are broken by id
+        Task.objects.filter(pk__in=[task.pk for task in self.tasks[5:15]]).update(updated_at=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(create_profile("performer").user)
+
+    def test_walks_the_feed_without_count(self):
+        url, seen = reverse('api:task-list') + '?before=', []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.get(url)
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn('count', res.data)
+            self.assertFalse([q['sql'] for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+            seen += [task['id'] for task in res.data['results']]
+            url = res.data['next']
+        expected = Task.objects.order_by('-updated_at', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_previous_returns_to_newer_page(self):
+        first = self.client.get(reverse('api:task-list'), {'before': ''}).data
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual([task['id'] for task in back['results']], [task['id'] for task in first['results']])
+        self.assertIsNone(back['previous'])
+
+    def test_rejects_bad_cursor_and_location(self):
+        url = reverse('api:task-list')
+        self.assertEqual(self.client.get(url, {'before': 'nope'}).status_code, 400)
+        # Well-formed JSON with values of the wrong type
+        for values in ([['2024-01-01'], 1], [{}, 1], ['2024-01-01T00:00:00', [1]], ['2024-01-01T00:00:00', None], [None, 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            self.assertEqual(self.client.get(url, {'before': cursor}).status_code, 400, values)
+        res = self.client.get(url, {'before': '', 'latitude': 13.1, 'longitude': 123.7})
+        self.assertEqual(res.status_code, 400)
+        # Page numbers still work when no cursor is sent
+        self.assertEqual(self.client.get(url, {'page': 2}).data['count'], 23)
+
+
+class TaskSearchTests(TestCase):
+    def setUp(self):
+        repair = TaskCategory.objects.create(title="Repair")
+        self.plumbing = TaskCategory.objects.create(title="Plumbing")
+        provider = create_profile("provider")
+        self.fence = create_task(provider, repair, title="Fix the fence", description="Wooden, two meters")
+        self.paint = create_task(provider, repair, title="Paint the wall", description="Next to the fence")
+        self.sink = create_task(provider, self.plumbing, title="Leaky sink", description="Kitchen", address="Daraga")
+        self.far = create_task(provider, repair, latitude=14.5995, longitude=120.9842, title="Fence in Manila")
+        self.taken = create_task(provider, repair, title="Fence repair", performer=create_profile("worker"))
+        self.client = APIClient()
+        self.client.force_authenticate(create_profile("me").user)
+
+    def search(self, text, **params):
+        res = self.client.get(reverse('api:task-list'), {'search': text, **params})
+        self.assertEqual(res.status_code, 200, res.data)
+        return [task['id'] for task in res.data['results']]
+
+    def test_ranks_title_over_description(self):
+        ids = self.search("fence")
+        self.assertEqual(set(ids), {self.fence.pk, self.paint.pk, self.far.pk})
+        self.assertEqual(ids[-1], self.paint.pk)
+        self.assertEqual(self.search("fen wood"), [self.fence.pk])
+
+    def test_category_and_address(self):
+        self.assertEqual(self.search("plumb"), [self.sink.pk])
+        self.assertEqual(self.search("daraga"), [self.sink.pk])
+        # Query syntax is just words
+        self.assertEqual(self.search('sink" OR * NOT'), [])
+        self.assertEqual(self.search('"sink*'), [self.sink.pk])
+
+    def test_combines_with_location(self):
+        self.assertEqual(set(self.search("fence", latitude=13.1391, longitude=123.7438, radius=10)),
+                         {self.fence.pk, self.paint.pk})
+
+    def test_index_follows_edits(self):
+        self.sink.title = "Clogged drain"
+        self.sink.save()
+        self.assertEqual(self.search("sink"), [])
+        self.assertEqual(self.search("clogged"), [self.sink.pk])
+
+        self.plumbing.title = "Pipes"
+        self.plumbing.save()
+        self.assertEqual(self.search("pipes"), [self.sink.pk])
+
+        self.sink.delete()
+        self.assertEqual(self.search("pipes"), [])
+        self.assertEqual(Task.objects.search("fence").count(), 4)
+
+    def test_status_updates_skip_reindexing(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.fence.status = Task.IN_PROGRESS
+            self.fence.save()
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'task_search' in q['sql']])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        recommend._index = None
+        self.repair = TaskCategory.objects.create(title="Repair")
+        self.cleaning = TaskCategory.objects.create(title="Cleaning")
+        self.me = create_profile("me")
+        self.provider = create_profile("provider")
+        # History: two repair jobs in Legazpi, one of them done
+        create_task(self.provider, self.repair, performer=self.me, status=Task.COMPLETED, is_done_perform=True)
+        TaskApplicant.objects.create(task=create_task(self.provider, self.repair, status=Task.IN_PROGRESS), performer=self.me)
+
+        self.near_repair = create_task(self.provider, self.repair)
+        self.near_cleaning = create_task(self.provider, self.cleaning)
+        self.far_repair = create_task(self.provider, self.repair, latitude=14.5995, longitude=120.9842)
+        self.own = create_task(self.me, self.repair)
+        self.applied = create_task(self.provider, self.repair)
+        TaskApplicant.objects.create(task=self.applied, performer=self.me)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.me.user)
+
+    def recommended(self, **params):
+        res = self.client.get(reverse('api:task-recommended'), params)
+        self.assertEqual(res.status_code, 200, res.data)
+        return [task['id'] for task in res.data]
+
+    def test_ranks_by_affinity_and_distance(self):
+        # Own and applied tasks never show up
+        self.assertEqual(self.recommended(), [self.near_repair.pk, self.far_repair.pk, self.near_cleaning.pk])
+        self.assertEqual(self.recommended(limit=1), [self.near_repair.pk])
+        self.assertEqual(self.client.get(reverse('api:task-recommended'), {'limit': 500}).status_code, 400)
+
+    def test_rewards_and_provider_ratings_count(self):
+        rated = create_profile("rated")
+        for _ in range(3):
+            TaskReview.objects.create(task=create_task(rated, self.cleaning, status=Task.COMPLETED, is_done_perform=True), provider_rate=5)
+        well_paid = create_task(self.provider, self.cleaning, reward=5000)
+        well_rated = create_task(rated, self.cleaning)
+        ranked = self.recommended()
+        self.assertLess(ranked.index(well_paid.pk), ranked.index(self.near_cleaning.pk))
+        self.assertLess(ranked.index(well_rated.pk), ranked.index(self.near_cleaning.pk))
+
+    def test_refresh_is_incremental(self):
+        index = recommend.TaskIndex()
+        self.assertTrue(index.refresh())
+        self.assertEqual(set(index.ids.tolist()), {self.near_repair.pk, self.near_cleaning.pk, self.far_repair.pk, self.own.pk, self.applied.pk})
+
+        self.near_repair.status = Task.IN_PROGRESS
+        self.near_repair.save()
+        new = create_task(self.provider, self.cleaning)
+        TaskReview.objects.create(task=create_task(self.provider, self.repair, status=Task.COMPLETED, is_done_perform=True), provider_rate=1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(index.refresh())
+        self.assertNotIn(self.near_repair.pk, index.ids.tolist())
+        self.assertIn(new.pk, index.ids.tolist())
+        self.assertTrue((index.rating[index.provider == self.provider.pk] < recommend.RECOMMEND_SETTINGS["RATING_PRIOR"] / 5).all())
+        # Only what changed is read again
+        task_reads = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT "task_task"."id"')]
+        self.assertEqual(len(task_reads), 2)
+        self.assertTrue(all('"task_task"."updated_at" >=' in sql for sql in task_reads))
+
+    def test_web_processes_load_the_published_index(self):
+        out = StringIO()
+        call_command('refresh_recommendations', '--once', stdout=out)
+        self.assertIn("Rebuilt 5 open task(s)", out.getvalue())
+        recommend._index = None
+        recommend.get_performer_profile(self.me.pk)
+        with self.assertNumQueries(0):
+            ranked = recommend.recommend(self.me.pk, 3)
+        self.assertEqual(ranked, [self.near_repair.pk, self.far_repair.pk, self.near_cleaning.pk])
+
+    def test_new_applications_reach_the_profile(self):
+        self.assertIn(self.near_cleaning.pk, self.recommended())
+        TaskApplicant.objects.create(task=self.near_cleaning, performer=self.me)
+        self.assertNotIn(self.near_cleaning.pk, recommend.recommend(self.me.pk, 10))
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.provider = create_profile("provider")
+        self.performer = create_profile("performer")
+        self.category = TaskCategory.objects.create(title="Repair")
+        self.task = create_task(self.provider, self.category, performer=self.performer, status=Task.COMPLETED, is_done_perform=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.provider.user)
+
+    def review(self, task, **rates):
+        return self.client.post(f'/api/task/{task.pk}/review/', rates)
+
+    def summary(self, profile, role):
+        profile.refresh_from_db()
+        return profile.rating_summary(role)
+
+    def test_reviews_move_the_aggregates(self):
+        self.assertEqual(self.review(self.task, performer_rate=5).status_code, 201)
+        self.assertEqual(self.summary(self.performer, 'performer'), {"count": 1, "sum": 5, "average": 5.0, "histogram": [0, 0, 0, 0, 0, 1]})
+        # The provider hasn't been rated yet
+        self.assertEqual(self.summary(self.provider, 'provider'), {"count": 0, "sum": 0, "average": None, "histogram": [1, 0, 0, 0, 0, 0]})
+
+        res = self.review(self.task, performer_rate=2, provider_rate=4)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['task']['performer']['performer_rating']['histogram'], [0, 0, 1, 0, 0, 0])
+        self.assertEqual(res.data['task']['provider']['provider_rating']['average'], 4.0)
+
+        other = create_task(self.provider, self.category, performer=self.performer, status=Task.COMPLETED, is_done_perform=True)
+        self.review(other, performer_rate=3)
+        self.assertEqual(self.summary(self.performer, 'performer'), {"count": 2, "sum": 5, "average": 2.5, "histogram": [0, 0, 1, 1, 0, 0]})
+        TaskReview.objects.get(task=other).delete()
+        self.assertEqual(self.summary(self.performer, 'performer')["histogram"], [0, 0, 1, 0, 0, 0])
+
+    def test_lists_read_them_from_the_profile_row(self):
+        self.review(self.task, performer_rate=4, provider_rate=5)
+        task = Task.objects.for_list().get(pk=self.task.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(task.performer.rating_summary('performer')["average"], 4.0)
+            self.assertEqual(task.provider.rating_summary('provider')["average"], 5.0)
+
+    def test_profile_writes_keep_the_ratings(self):
+        stale = UserProfile.objects.get(pk=self.performer.pk)
+        self.review(self.task, performer_rate=4)
+        stale.suspend("Spam")
+        self.assertEqual(self.summary(self.performer, 'performer')["sum"], 4)
+
+    def test_rebuild(self):
+        self.review(self.task, performer_rate=4, provider_rate=3)
+        expected = self.summary(self.performer, 'performer'), self.summary(self.provider, 'provider')
+        UserProfile.objects.update(performer_rating_count=9, provider_rating_histogram=[0] * 6)
+        out = StringIO()
+        call_command('rebuild_ratings', stdout=out)
+        self.assertIn("Updated the ratings of 2 profile(s)", out.getvalue())
+        self.assertEqual((self.summary(self.performer, 'performer'), self.summary(self.provider, 'provider')), expected)
+        call_command('rebuild_ratings', stdout=out)
+        self.assertIn("Updated the ratings of 0 profile(s)", out.getvalue())
+
+
+class CompactReviewTests(TestCase):
+    def setUp(self):
+        self.me = create_profile("me")
+        self.other = create_profile("other", profile_photo="images/profiles/other.jpg",
+                                    photo_variants={'profile_photo': {'thumb': "images/profiles/other_thumb.webp"}})
+        category = TaskCategory.objects.create(title="Repair")
+        # I provided one task and performed another, both for `other`
+        provided = create_task(self.me, category, title="Paint the gate", performer=self.other, status=Task.COMPLETED, is_done_perform=True)
+        performed = create_task(self.other, category, title="Fix the fence", performer=self.me, status=Task.COMPLETED, is_done_perform=True)
+        self.provided = TaskReview.objects.create(task=provided, provider_rate=4, performer_rate=5, performer_feedback="Tidy")
+        self.performed = TaskReview.objects.create(task=performed, provider_rate=3, performer_rate=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.me.user)
+
+    def compact(self, **params):
+        res = self.client.get(reverse('api:task-review-list'), {'view': 'compact', **params})
+        self.assertEqual(res.status_code, 200, res.data)
+        return res.data['results']
+
+    def test_entries_name_the_counterpart(self):
+        entries = {entry['id']: entry for entry in self.compact(my_reviews=1)}
+        self.assertEqual(entries[self.provided.pk]['task'], {'id': self.provided.task_id, 'title': "Paint the gate"})
+        self.assertEqual(entries[self.provided.pk]['performer_feedback'], "Tidy")
+        counterpart = entries[self.provided.pk]['counterpart']
+        self.assertEqual((counterpart['id'], counterpart['role'], counterpart['first_name']), (self.other.pk, 'performer', "Other"))
+        self.assertEqual(counterpart['profile_photo'], "http://testserver/media/images/profiles/other_thumb.webp")
+        self.assertEqual(entries[self.performed.pk]['counterpart']['role'], 'provider')
+
+        [entry] = self.compact(performer=self.other.pk)
+        self.assertEqual((entry['id'], entry['counterpart']['id']), (self.provided.pk, self.me.pk))
+
+    def test_one_query_for_the_page(self):
+        queries = capture_queries(self.client, reverse('api:task-review-list'), {'view': 'compact', 'my_reviews': 1})
+        # The page's COUNT and its rows, no report lookups
+        self.assertEqual(len(queries), 2, queries)
+        self.assertFalse([sql for sql in queries if 'user_profile_userreport' in sql])
+        self.assertEqual(sequential_scans(queries), [])
+        full = self.client.get(reverse('api:task-review-list'), {'my_reviews': 1})
+        self.assertEqual(full.data['count'], 2)
+        self.assertIn('provider', full.data['results'][0]['task'])
+
+    def test_benchmark_compares_both_views(self):
+        out = StringIO()
+        BenchmarkReviewList(stdout=out).run_views(self.other, requests=2)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines], ['full', 'compact'])
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = TaskCategory.objects.create(title="Repair")
+        self.client = APIClient()
+        self.client.force_authenticate(create_profile("me").user)
+        self.url = reverse('api:task-category-list')
+
+    def test_second_request_skips_the_database(self):
+        first = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(self.url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        # Search terms are part of the key
+        self.assertEqual(self.client.get(self.url, {'search': 'nothing'}).data['count'], 0)
+
+    def test_saving_a_category_invalidates(self):
+        etag = self.client.get(self.url)['ETag']
+        TaskCategory.objects.create(title="Cleaning")
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['count'], 2)
+        self.category.delete()
+        self.assertEqual(self.client.get(self.url).data['count'], 1)
+
+    def test_revalidation_returns_not_modified(self):
+        res = self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=res['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=res['Last-Modified']).status_code, 304)
+        # Permissions still apply to cached responses
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+    def test_policy_pages_revalidate(self):
+        res = self.client.get(reverse('privacy_policy'))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.client.get(reverse('privacy_policy'), HTTP_IF_NONE_MATCH=res['ETag']).status_code, 304)
+
+
+class PushOutboxTests(TestCase):
+    def setUp(self):
+        self.category = TaskCategory.objects.create(title="Repair")
+        self.provider = create_profile("provider")
+        self.performer = create_profile("performer")
+        for token in ("p1", "p2", "p3"):
+            FCMDevice.objects.create(user=self.performer.user, registration_id=token, type="android")
+        FCMDevice.objects.create(user=self.provider.user, registration_id="q1", type="android")
+        self.task = create_task(self.provider, self.category)
+        self.client = APIClient()
+        self.client.force_authenticate(self.provider.user)
+
+    def approve_performer(self):
+        url = reverse('api:provider-patch-performer', args=[self.task.pk])
+        return self.client.patch(url, {'performer_id': self.performer.pk}, format='json')
+
+    def test_request_only_queues(self):
+        with mock.patch('firebase_admin.messaging.send_each') as send_each:
+            res = self.approve_performer()
+        self.assertEqual(res.status_code, 200)
+        send_each.assert_not_called()
+        self.assertEqual(PushNotification.objects.filter(user=self.performer.user, status=PushNotification.PENDING).count(), 1)
+
+    def test_drain_batches_messages(self):
+        self.approve_performer()
+        TaskApplicant.objects.create(task=create_task(self.provider, self.category), performer=self.performer)
+        notifyTask(self.provider.user, {"title": "E-Tugal", "body": "New applicant"}, {"title": "E-Tugal"})
+
+        transport = LocalTransport()
+        with mock.patch.dict(PUSH_SETTINGS, BATCH_SIZE=3):
+            self.assertEqual(drain_outbox(transport), 2)
+        self.assertEqual([len(call) for call in transport.calls], [3, 1])
+        self.assertEqual({message.token for message in transport.sent}, {"p1", "p2", "p3", "q1"})
+        self.assertFalse(PushNotification.objects.exclude(status=PushNotification.SENT).exists())
+        self.assertEqual(drain_outbox(transport), 0)
+
+    def test_dead_tokens_are_pruned(self):
+        self.approve_performer()
+        drain_outbox(LocalTransport(dead_tokens={"p2"}))
+        self.assertEqual(set(FCMDevice.objects.values_list('registration_id', flat=True)), {"p1", "p3", "q1"})
+        self.assertEqual(PushNotification.objects.get().status, PushNotification.SENT)
+
+    def test_rows_are_leased_not_locked_while_sending(self):
+        self.approve_performer()
+        atomic_depth = len(connection.atomic_blocks)
+        seen = []
+
+        class Probe(LocalTransport):
+            def send_each(probe, messages):
+                # No transaction of drain_outbox's own is open, and the rows are leased
+                seen.append((len(connection.atomic_blocks), drain_outbox(LocalTransport())))
+                return super().send_each(messages)
+
+        self.assertEqual(drain_outbox(Probe()), 1)
+        self.assertEqual(seen, [(atomic_depth, 0)])
+        self.assertEqual(PushNotification.objects.get().status, PushNotification.SENT)
+
+    def test_retry_with_backoff(self):
+        self.approve_performer()
+        transport = LocalTransport(failing_tokens={"p1", "p2", "p3"})
+        notification = PushNotification.objects.get()
+        for attempt in range(1, PUSH_SETTINGS["MAX_ATTEMPTS"] + 1):
+            PushNotification.objects.filter(pk=notification.pk).update(next_attempt_at=timezone.now())
+            before = timezone.now()
+            self.assertEqual(drain_outbox(transport), 1)
+            notification.refresh_from_db()
+            self.assertEqual(notification.attempts, attempt)
+            if attempt < PUSH_SETTINGS["MAX_ATTEMPTS"]:
+                self.assertEqual(notification.status, PushNotification.PENDING)
+                expected = timedelta(seconds=PUSH_SETTINGS["RETRY_BACKOFF_SECONDS"] * 2 ** (attempt - 1))
+                self.assertGreaterEqual(notification.next_attempt_at, before + expected)
+                # Not due yet
+                self.assertEqual(drain_outbox(transport), 0)
+        self.assertEqual(notification.status, PushNotification.FAILED)
+        self.assertIn("Quota", notification.last_error)
+
+
+class ConnectionSettingsTests(TestCase):
+    def test_connections_are_closed_per_request_and_checked(self):
+        # Persistent connections leak under daphne, see the DATABASES comment
+        settings_dict = connections['default'].settings_dict
+        self.assertEqual(settings_dict['CONN_MAX_AGE'], 0)
+        self.assertTrue(settings_dict['CONN_HEALTH_CHECKS'])
 
-# Create your tests here.
+    def test_benchmark_reports_each_mode(self):
+        out = StringIO()
+        call_command("benchmark_db_connections", requests=5, stdout=out)
+        lines = {line.split('  ')[0].strip(): line for line in out.getvalue().splitlines()}
+        for label in ("HTTP per-request", "Consumer per-request", "HTTP persistent (60s)", "Consumer persistent (60s)"):
+            self.assertIn(label, lines)
+        # Through the ASGI handler every request opens its own connection, persistent or not
+        self.assertTrue(lines["HTTP persistent (60s)"].endswith("connections opened 5"), lines)
+        # ChatConsumer's calls share one thread, so one connection serves them all
+        self.assertTrue(lines["Consumer per-request"].endswith("connections opened 1"), lines)
+        self.assertEqual(connections['default'].settings_dict['CONN_MAX_AGE'], 0)
@@ -1,31 +1,87 @@
+import math
+from operator import attrgetter
+
 from rest_framework import generics, permissions, response, filters, viewsets, status, exceptions
 
-from core.paginate import ExtraSmallResultsSetPagination
+from core.cache import CachedListMixin
+from core.paginate import ExtraSmallKeysetPagination, ExtraSmallResultsSetPagination
 from task.notification import notifyTask
 from user_profile.models import UserProfile
+from user_profile.serializers import OpenReportResolver
 from .models import TaskCategory, Task, TaskReview, TaskApplicant
+from .recommend import recommend
+from .search import TaskSearchFilter
 from .serializers import (TaskCategorySerializers, TaskListSerializers, TaskSerializer, 
-                          TaskReviewSerializers, CreateTaskApplicantSerializer, TaskListApplicantSerializer)
+                          TaskReviewSerializers, CompactTaskReviewSerializer, CreateTaskApplicantSerializer, TaskListApplicantSerializer)
 from rest_framework.decorators import action
 from firebase_admin.messaging import Message, Notification
+from django.db import transaction
 from django.db.models import Q
 
-class TaskCategoryListView(generics.ListAPIView):
+
+class OpenReportsMixin:
+    """
+    Batches TaskProfileSerializer.get_report for list responses: the open
+    reports of every profile on the page are loaded with one query and shared
+    through the serializer context.
+    """
+    # Attribute paths from each listed object to the UserProfiles it embeds
+    report_profile_fields = ()
+    # Attribute path to the embedded Task ('' when the object is the task itself)
+    report_task_field = None
+    # Whether the task payload nests its applicants' profiles
+    report_task_applicants = False
+
+    def get_serializer(self, *args, **kwargs):
+        if args and kwargs.get('many'):
+            kwargs.setdefault('context', self.get_serializer_context())
+            kwargs['context']['report_resolver'] = OpenReportResolver(self.get_report_user_ids(args[0]))
+        return super().get_serializer(*args, **kwargs)
+
+    def get_report_user_ids(self, objects):
+        user_ids = set()
+        tasks = []
+        for obj in objects:
+            profiles = [attrgetter(path)(obj) for path in self.report_profile_fields]
+            if self.report_task_field is not None:
+                task = attrgetter(self.report_task_field)(obj) if self.report_task_field else obj
+                tasks.append(task)
+                profiles += [task.provider, task.performer]
+            user_ids.update(profile.user_id for profile in profiles if profile is not None)
+
+        if tasks and self.report_task_applicants:
+            if all('task_applicant' in getattr(task, '_prefetched_objects_cache', {}) for task in tasks):
+                applicants = [applicant.performer for task in tasks for applicant in task.task_applicant.all()]
+                user_ids.update(profile.user_id for profile in applicants if profile is not None)
+            else:
+                user_ids.update(
+                    TaskApplicant.objects.filter(task__in=tasks, performer__isnull=False)
+                    .values_list('performer__user_id', flat=True)
+                )
+        return user_ids
+
+
+class TaskCategoryListView(CachedListMixin, generics.ListAPIView):
     serializer_class = TaskCategorySerializers
     queryset = TaskCategory.objects.all()
     permission_classes = [permissions.IsAuthenticated,]
     pagination_class = ExtraSmallResultsSetPagination
     filter_backends = [filters.SearchFilter]
     search_fields = ['title',]
+    # Invalidated by TaskCategory saves/deletes, see TaskConfig.ready
+    cache_namespace = 'task_categories'
     
 
-class TaskListView(generics.ListAPIView):
+class TaskListView(OpenReportsMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated,]
     serializer_class = TaskListSerializers
-    queryset = Task.objects.all()
-    pagination_class = ExtraSmallResultsSetPagination
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['title',]
+    queryset = Task.objects.for_list()
+    pagination_class = ExtraSmallKeysetPagination
+    keyset_ordering = ('-updated_at', '-id')
+    filter_backends = [TaskSearchFilter]
+    report_task_field = ''
+    DEFAULT_RADIUS_KM = 25
+    MAX_NEAREST = 100
     
     def get_queryset(self):
         task_category_id = self.request.GET.get('task_category', None)
@@ -34,13 +90,89 @@ class TaskListView(generics.ListAPIView):
             return queryset.filter(task_category=task_category_id)
         
         return queryset
+
+    def filter_queryset(self, queryset):
+        # Location filtering goes last, the nearest-k query is sliced
+        return self.filter_by_location(super().filter_queryset(queryset))
+
+    def filter_by_location(self, queryset):
+        # "Tasks near me": ?latitude=&longitude= with either ?radius= (km) or ?nearest= (k)
+        latitude = self.request.GET.get('latitude', None)
+        longitude = self.request.GET.get('longitude', None)
+        if latitude is None and longitude is None:
+            return queryset
+        if self.paginator.uses_keyset(self.request):
+            raise exceptions.ValidationError({"error_message": "before/after cursors cannot be combined with location filtering."})
+
+        try:
+            latitude = float(latitude)
+            longitude = float(longitude)
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError({"error_message": "Both latitude and longitude must be valid numbers."})
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise exceptions.ValidationError({"error_message": "Latitude or longitude is out of range."})
+
+        nearest = self.request.GET.get('nearest', None)
+        if nearest is not None:
+            try:
+                nearest = int(nearest)
+            except ValueError:
+                nearest = 0
+            if not 0 < nearest <= self.MAX_NEAREST:
+                raise exceptions.ValidationError({"error_message": f"nearest must be between 1 and {self.MAX_NEAREST}."})
+            return queryset.nearest(latitude, longitude, nearest)
+
+        try:
+            radius = float(self.request.GET.get('radius', self.DEFAULT_RADIUS_KM))
+        except ValueError:
+            radius = 0
+        if not (math.isfinite(radius) and radius > 0):
+            raise exceptions.ValidationError({"error_message": "radius must be a positive number of kilometers."})
+        return queryset.nearby(latitude, longitude, radius)
     
 
 
-class TaskViewSet(viewsets.ModelViewSet):
-    queryset = Task.objects.all()
+class RecommendedTaskListView(OpenReportsMixin, generics.ListAPIView):
+    """
+    Open tasks ranked for the requesting performer (task.recommend): ?limit=
+    of them, best first, without pagination.
+    """
+    permission_classes = [permissions.IsAuthenticated,]
+    serializer_class = TaskListSerializers
+    queryset = Task.objects.for_list()
+    pagination_class = None
+    report_task_field = ''
+    DEFAULT_LIMIT = 20
+    MAX_LIMIT = 50
+    # Ranked past the limit, for tasks taken or applied to since the last refresh
+    OVERFETCH = 10
+
+    def list(self, request, *args, **kwargs):
+        try:
+            limit = int(request.GET.get('limit', self.DEFAULT_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= self.MAX_LIMIT:
+            raise exceptions.ValidationError({"error_message": f"limit must be between 1 and {self.MAX_LIMIT}."})
+
+        profile = request.user.profile
+        ranked = recommend(profile.pk, limit + self.OVERFETCH)
+        # The index may be a few minutes old, the database has the last word
+        tasks = {
+            task.pk: task for task in self.get_queryset().filter(
+                pk__in=ranked, status=Task.PENDING, performer=None
+            ).exclude(provider=profile).exclude(task_applicant__performer=profile)
+        }
+        page = [tasks[pk] for pk in ranked if pk in tasks][:limit]
+        return response.Response(self.get_serializer(page, many=True).data)
+
+
+class TaskViewSet(OpenReportsMixin, viewsets.ModelViewSet):
+    queryset = Task.objects.for_detail()
     serializer_class = TaskSerializer
     permission_classes = [permissions.IsAuthenticated]
+    report_task_field = ''
+    report_task_applicants = True
 
     def get_queryset(self):
         queryset = super().get_queryset().filter(provider=self.request.user.profile)
@@ -52,9 +184,7 @@ class TaskViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         user = self.request.user.profile
         
-        user.is_active()
-        
-        if user.is_suspended or user.is_terminated:
+        if not user.is_active():
             message = "terminated" if user.is_terminated else "suspended"
             raise exceptions.ValidationError({"error_message": f"Your account is {message}."})
     
@@ -120,10 +250,12 @@ class TaskViewSet(viewsets.ModelViewSet):
 
 
     
-class PerformerTaskViewSet(viewsets.ModelViewSet):
-    queryset = Task.objects.all()
+class PerformerTaskViewSet(OpenReportsMixin, viewsets.ModelViewSet):
+    queryset = Task.objects.for_detail()
     serializer_class = TaskSerializer
     permission_classes = [permissions.IsAuthenticated]
+    report_task_field = ''
+    report_task_applicants = True
 
     def get_queryset(self):
         queryset = super().get_queryset().filter(performer=self.request.user.profile)
@@ -167,10 +299,36 @@ class PerformerTaskViewSet(viewsets.ModelViewSet):
             return response.Response({"error_message": "is_done_perform is required."}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TaskReviewListView(generics.ListAPIView):
+class TaskReviewListView(OpenReportsMixin, generics.ListAPIView):
+    """
+    Reviews of a performer, a provider or the current user. `?view=compact`
+    returns CompactTaskReviewSerializer entries from one values() query
+    instead of nesting the whole task with both profiles.
+    """
     serializer_class = TaskReviewSerializers
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = ExtraSmallResultsSetPagination
+    report_task_field = 'task'
+
+    @property
+    def compact(self):
+        return self.request.query_params.get('view') == 'compact'
+
+    def get_serializer_class(self):
+        return CompactTaskReviewSerializer if self.compact else self.serializer_class
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        params = self.request.query_params
+        if params.get('my_reviews') is not None:
+            context['review_subject'] = self.request.user.profile.pk
+        else:
+            context['review_subject'] = params.get('performer') or params.get('provider')
+        return context
+
+    def get_report_user_ids(self, objects):
+        # Compact entries embed no profiles, so no reports
+        return set() if self.compact else super().get_report_user_ids(objects)
 
     def get_queryset(self):
         # Get query params for performer, provider, and my_reviews
@@ -180,6 +338,7 @@ class TaskReviewListView(generics.ListAPIView):
 
         # Base queryset for completed tasks
         queryset = TaskReview.objects.filter(task__status=Task.COMPLETED).order_by('-created_at')
+        queryset = queryset.compact() if self.compact else queryset.for_list()
 
         # If 'my_reviews' is provided, filter by current user as performer or provider
         if my_reviews is not None:
@@ -230,7 +389,7 @@ class TaskApplicantCreateView(generics.CreateAPIView):
         user = self.request.user.profile
         
         # Validate user's status before creating TaskApplicant
-        if user.is_suspended or user.is_terminated:
+        if not user.is_active():
             message = "terminated" if user.is_terminated else "suspended"
             raise exceptions.ValidationError({"error_message": f"Your account is {message}."})
     
@@ -263,11 +422,13 @@ class TaskApplicantCreateView(generics.CreateAPIView):
         notifyTask(task.provider.user, notification, data)
 
 
-class TaskListApplicantView(generics.ListAPIView):
+class TaskListApplicantView(OpenReportsMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
-    queryset = TaskApplicant.objects.all()
+    queryset = TaskApplicant.objects.for_list()
     serializer_class = TaskListApplicantSerializer
     pagination_class = ExtraSmallResultsSetPagination
+    report_task_field = 'task'
+    report_task_applicants = True
 
     def get_queryset(self):
         queryset = super().get_queryset().filter(performer=self.request.user.profile)
@@ -298,7 +459,9 @@ class TaskReviewViewSet(viewsets.ViewSet):
             # If a review exists, update it
             serializer = TaskReviewSerializers(task_review, data=request.data, partial=True)
             if serializer.is_valid():
-                serializer.save()
+                # With the profiles' rating aggregates (task.ratings)
+                with transaction.atomic():
+                    serializer.save()
                 return response.Response(serializer.data, status=status.HTTP_200_OK)
             return response.Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except TaskReview.DoesNotExist:
@@ -306,7 +469,8 @@ class TaskReviewViewSet(viewsets.ViewSet):
             serializer = TaskReviewSerializers(data=request.data, partial=True)
             if serializer.is_valid():
                 # Manually assign the task to the review
-                serializer.save(task=task)
+                with transaction.atomic():
+                    serializer.save(task=task)
                 return response.Response(serializer.data, status=status.HTTP_201_CREATED)
             return response.Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -1,9 +1,10 @@
 from django.contrib import admin
-from .models import UserProfile, UserReport, ReportImage
+from .models import UserProfile, UserReport, ReportImage, OutgoingEmail
 from django.core.mail import send_mail
 from etugal_core import settings
 from django.contrib import messages
-from .email import Util
+from django.db import transaction
+from .email import Util, queue_moderation_emails, queue_verification_emails
 
 class ReportImageInline(admin.TabularInline):
     model = ReportImage
@@ -59,54 +60,57 @@ class UserProfileAdminView(admin.ModelAdmin):
     search_fields = ('user__first_name', 'user__last_name',)
     list_filter = (CustomVerificationStatusListFilter, 'is_suspended', 'is_terminated')
     
-    actions = ['suspend_1_day', 'suspend_3_days', 'suspend_1_week', 'suspend_1_month', 'terminate_user']
+    actions = ['verify_selected', 'suspend_1_day', 'suspend_3_days', 'suspend_1_week', 'suspend_1_month', 'terminate_user']
+
+    # Action methods for suspending and terminating users, one UPDATE per action
+    def suspend_profiles(self, request, queryset, duration_key):
+        with transaction.atomic():
+            profiles = UserProfile.bulk_suspend(queryset, reason="Admin Suspension", duration_key=duration_key)
+            queue_moderation_emails(profiles, 'suspend', "Admin Suspension", duration_key)
+        self.message_user(request, f"{len(profiles)} users suspended.", level=messages.SUCCESS)
 
-    # Action methods for suspending and terminating users
     def suspend_1_day(self, request, queryset):
-        for profile in queryset:
-            profile.suspend(reason="Admin Suspension", duration_key='1_day')
+        self.suspend_profiles(request, queryset, '1_day')
     suspend_1_day.short_description = 'Suspend for 1 Day'
 
     def suspend_3_days(self, request, queryset):
-        for profile in queryset:
-            profile.suspend(reason="Admin Suspension", duration_key='3_days')
+        self.suspend_profiles(request, queryset, '3_days')
     suspend_3_days.short_description = 'Suspend for 3 Days'
 
     def suspend_1_week(self, request, queryset):
-        for profile in queryset:
-            profile.suspend(reason="Admin Suspension", duration_key='1_week')
+        self.suspend_profiles(request, queryset, '1_week')
     suspend_1_week.short_description = 'Suspend for 1 Week'
 
     def suspend_1_month(self, request, queryset):
-        for profile in queryset:
-            profile.suspend(reason="Admin Suspension", duration_key='1_month')
+        self.suspend_profiles(request, queryset, '1_month')
     suspend_1_month.short_description = 'Suspend for 1 Month'
 
     def terminate_user(self, request, queryset):
-        for profile in queryset:
-            profile.terminate(reason="Admin Termination")
+        with transaction.atomic():
+            profiles = UserProfile.bulk_terminate(queryset, reason="Admin Termination")
+            queue_moderation_emails(profiles, 'terminate', "Admin Termination")
+        self.message_user(request, f"{len(profiles)} users terminated.", level=messages.SUCCESS)
     terminate_user.short_description = 'Terminate selected users'
 
+    def verify_selected(self, request, queryset):
+        with transaction.atomic():
+            profiles = UserProfile.bulk_verify(queryset)
+            transaction.on_commit(lambda: queue_verification_emails(profiles, UserProfile.VERIFIED))
+        self.message_user(request, f"{len(profiles)} users verified.", level=messages.SUCCESS)
+    verify_selected.short_description = 'Verify selected users'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+
     # Override save_model to send email when the verification status changes
     def save_model(self, request, obj, form, change):
-        prev_profile = UserProfile.objects.get(pk=obj.pk)
-        if obj.verification_status == UserProfile.VERIFIED and not prev_profile.verification_status == UserProfile.VERIFIED: 
-            message = f'Your account was verified by our team. Kindly ignore this message if you did not initiate this request.'
-            Util.send_email_with_certifi(
-                subject='Registration',
-                from_email='settings.EMAIL_HOST_USER',
-                message=message,
-                recipient_list=[obj.user.email],
-            )
-        if obj.verification_status == UserProfile.REJECTED and not prev_profile.verification_status == UserProfile.REJECTED:
-            message = f'Your account was rejected by our team. \n{obj.verification_remarks}'
-            Util.send_email_with_certifi(
-                subject='Registration',
-                from_email='settings.EMAIL_HOST_USER',
-                message=message,
-                recipient_list=[obj.user.email],
-            )
+        # Compared with the value loaded for the form, no second read
+        status_changed = obj.has_changed('verification_status')
         super(UserProfileAdminView, self).save_model(request, obj, form, change)
+        if status_changed:
+            profiles = [(obj.pk, obj.user_id, obj.user.email)]
+            status, remarks = obj.verification_status, obj.verification_remarks
+            transaction.on_commit(lambda: queue_verification_emails(profiles, status, remarks))
 
     # Customize the form field for verification_status in the admin form
     def formfield_for_choice_field(self, db_field, request, **kwargs):
@@ -143,7 +147,7 @@ class UserReportAdmin(admin.ModelAdmin):
             self.message_user(request, message, level=messages.SUCCESS)
             Util.send_email_with_certifi(
                 subject='Account Suspension',
-                from_email='settings.EMAIL_HOST_USER',
+                from_email=settings.EMAIL_HOST_USER,
                 message=obj.resolution_notes,
                 recipient_list=[obj.reported_user.email],
             )
@@ -153,27 +157,39 @@ class UserReportAdmin(admin.ModelAdmin):
             self.message_user(request, message, level=messages.SUCCESS)
             Util.send_email_with_certifi(
                 subject='Account Termination',
-                from_email='settings.EMAIL_HOST_USER',
+                from_email=settings.EMAIL_HOST_USER,
                 message=obj.resolution_notes,
                 recipient_list=[obj.reported_user.email],
             )
         else:
             self.message_user(request, f"No action taken on {obj.reported_user}.", level=messages.INFO)
 
+    def resolve_reports(self, request, queryset, action_taken, reason_template):
+        # Reports and profiles are updated in bulk, then the notices are queued in one go
+        with transaction.atomic():
+            moderated = UserReport.bulk_resolve(
+                queryset, action_taken, resolution_notes="Resolved by admin action", reason_template=reason_template,
+            )
+            for (reason, duration_key), profiles in moderated.items():
+                queue_moderation_emails(profiles, action_taken, reason, duration_key)
+        return sum(len(profiles) for profiles in moderated.values())
+
     def resolve_as_suspension(self, request, queryset):
-        for report in queryset.filter(status='pending'):
-            report.resolve_report(action_taken='suspend', resolution_notes="Resolved by admin action")
-            profile = report.reported_user.profile
-            profile.suspend(reason=f"Suspended due to report: {report.reason}", duration_key=report.suspension_duration)
-        self.message_user(request, f"{queryset.count()} users suspended.", level=messages.SUCCESS)
+        count = self.resolve_reports(request, queryset, 'suspend', "Suspended due to report: {reason}")
+        self.message_user(request, f"{count} users suspended.", level=messages.SUCCESS)
 
     resolve_as_suspension.short_description = 'Suspend User for 1 Week'
 
     def resolve_as_termination(self, request, queryset):
-        for report in queryset.filter(status='pending'):
-            report.resolve_report(action_taken='terminate', resolution_notes="Resolved by admin action")
-            profile = report.reported_user.profile
-            profile.terminate(reason=f"Terminated due to report: {report.reason}")
-        self.message_user(request, f"{queryset.count()} users terminated.", level=messages.SUCCESS)
+        count = self.resolve_reports(request, queryset, 'terminate', "Terminated due to report: {reason}")
+        self.message_user(request, f"{count} users terminated.", level=messages.SUCCESS)
+
+    resolve_as_termination.short_description = 'Terminate User'
+
 
-    resolve_as_termination.short_description = 'Terminate User'
\ No newline at end of file
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    ordering = ('-created_at',)
+    search_fields = ('subject',)
+    list_filter = ('status',)
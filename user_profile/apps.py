@@ -4,3 +4,31 @@ from django.apps import AppConfig
 class UserProfileConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user_profile'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from django.db.models.signals import post_delete, post_save
+        from oauth2_provider.models import AccessToken
+
+        from .authentication import access_token_changed, profile_changed, profiles_changed, user_changed
+        from . import search as name_search
+        from .models import UserProfile
+        from .payload import profile_saved, profiles_updated, user_saved
+        from .signals import profiles_bulk_updated
+
+        for signal in (post_save, post_delete):
+            signal.connect(profile_saved, sender=UserProfile, dispatch_uid=f"profile-payload:profile:{signal}")
+            signal.connect(user_saved, sender=User, dispatch_uid=f"profile-payload:user:{signal}")
+        profiles_bulk_updated.connect(profiles_updated, sender=UserProfile, dispatch_uid="profile-payload:bulk")
+
+        # Cached token authentication (user_profile.authentication)
+        for signal in (post_save, post_delete):
+            signal.connect(access_token_changed, sender=AccessToken, dispatch_uid=f"auth-token:token:{signal}")
+            signal.connect(user_changed, sender=User, dispatch_uid=f"auth-token:user:{signal}")
+            signal.connect(profile_changed, sender=UserProfile, dispatch_uid=f"auth-token:profile:{signal}")
+        profiles_bulk_updated.connect(profiles_changed, sender=UserProfile, dispatch_uid="auth-token:bulk")
+
+        # Name search (user_profile.search)
+        post_save.connect(name_search.profile_saved, sender=UserProfile, dispatch_uid="name-search:profile")
+        post_delete.connect(name_search.profile_deleted, sender=UserProfile, dispatch_uid="name-search:delete")
+        post_save.connect(name_search.user_saved, sender=User, dispatch_uid="name-search:user")
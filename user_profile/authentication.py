@@ -0,0 +1,98 @@
+"""
+OAuth2Authentication with a cache of validated access tokens.
+
+Tokens are cached under a hash of their value in the "auth_tokens" cache (an
+in-process LRU, or Redis when AUTH_TOKEN_CACHE_SHARED is set), never past the
+token's expiry. Each user has a version in the default cache (core.cache),
+bumped when one of their tokens is revoked or their User/UserProfile changes;
+a cached token only counts while the user's version is still the one read
+before it was looked up, so the first request of a token only records whose
+it is. The versions must be seen by every process, so the
+cache is only used when the default cache is shared (AUTH_TOKEN_CACHE_ENABLED).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+
+from core.cache import bump_version, get_version
+
+
+def token_key(token):
+    return f"auth-token:{hashlib.sha256(token.encode()).hexdigest()}"
+
+
+def user_namespace(user_id):
+    return f"auth:{user_id}"
+
+
+def token_timeout(access_token):
+    remaining = int((access_token.expires - timezone.now()).total_seconds())
+    return min(settings.AUTH_TOKEN_CACHE_TIMEOUT, remaining)
+
+
+def bearer_token(request):
+    # Only the header form is cached, anything else goes through oauthlib as usual
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(auth) == 2 and auth[0].lower() == 'bearer':
+        return auth[1]
+    return None
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    def authenticate(self, request):
+        token = bearer_token(request)
+        if token is None or not settings.AUTH_TOKEN_CACHE_ENABLED:
+            return super().authenticate(request)
+
+        tokens = caches['auth_tokens']
+        key = token_key(token)
+        entry, version = tokens.get(key), None
+        if entry is not None:
+            cached_version, user, access_token = entry
+            # Any bump since, from any process, changes the version
+            version = get_version(user_namespace(user.pk))
+            if cached_version == version and not access_token.is_expired():
+                return user, access_token
+
+        result = super().authenticate(request)
+        if result is not None and result[0] is not None:
+            user, access_token = result
+            timeout = token_timeout(access_token)
+            if timeout > 0:
+                # Only a version read before the lookup is safe to keep, so a token seen
+                # for the first time is stored unusable and cached from its next request on
+                usable = version if entry is not None and entry[1].pk == user.pk else None
+                tokens.set(key, (usable, user, access_token), timeout)
+        return result
+
+
+def invalidate_user_tokens(user_id):
+    if user_id is None:
+        return
+    bump_version(user_namespace(user_id))
+    # Again after commit, in case a request read the old rows in between
+    transaction.on_commit(lambda: bump_version(user_namespace(user_id)))
+
+
+def access_token_changed(sender, instance, created=False, **kwargs):
+    # New tokens can't be cached yet, revoking deletes the row
+    if not created:
+        invalidate_user_tokens(instance.user_id)
+
+
+def user_changed(sender, instance, **kwargs):
+    invalidate_user_tokens(instance.pk)
+
+
+def profile_changed(sender, instance, **kwargs):
+    # Suspension and termination live on the profile
+    invalidate_user_tokens(instance.user_id)
+
+
+def profiles_changed(sender, profiles, **kwargs):
+    for profile_pk, user_id in profiles:
+        invalidate_user_tokens(user_id)
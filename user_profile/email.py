@@ -1,11 +1,40 @@
 from django.core.mail import EmailMessage
+import logging
 import threading
 import smtplib
 import ssl
+import time
+from datetime import timedelta
+from functools import lru_cache
+
 import certifi
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from etugal_core import settings
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from user_profile.models import OutgoingEmail, UserProfile, UserReport
+
+logger = logging.getLogger(__name__)
+
+EMAIL_SETTINGS = {
+    # Messages per second over the SMTP session, 0 for no limit
+    "RATE_LIMIT": 5,
+    # Gmail drops sessions after about 100 messages, reconnect before that
+    "MAX_MESSAGES_PER_SESSION": 90,
+    # Close the session after this many seconds without mail
+    "IDLE_TIMEOUT": 120,
+    # Emails claimed by one drain pass, and how long they stay claimed
+    "DRAIN_LIMIT": 100,
+    "LEASE_SECONDS": 300,
+    "MAX_ATTEMPTS": 5,
+    # Retry delay doubles on every failed attempt, starting from this
+    "RETRY_BACKOFF_SECONDS": 60,
+    "MAX_BACKOFF_SECONDS": 3600,
+}
+EMAIL_SETTINGS.update(getattr(settings, "EMAIL_QUEUE", {}))
+
 
 class EmailThread(threading.Thread):
 
@@ -27,35 +56,196 @@ class Util:
 
     @staticmethod
     def send_email_with_certifi(subject, message, from_email, recipient_list):
-        context = ssl.create_default_context(cafile=certifi.where())  # Create a context with certifi's CA bundle
-        with smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT) as server:
-            server.starttls(context=context)
-            server.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
-            server.sendmail(from_email, recipient_list, f'Subject: {subject}\n\n{message}')
+        # Queued, the send_emails worker delivers it
+        return queue_email(subject, message, from_email, recipient_list)
 
     @staticmethod
     def send_html_email_with_certifi(subject, plain_message, html_message, from_email, recipient_list):
         """
-        Sends an HTML email with a plain text fallback using certifi for SSL/TLS.
+        Queues an HTML email with a plain text fallback.
         """
-        context = ssl.create_default_context(cafile=certifi.where())  # Use certifi's CA bundle
-
-        # Create a MIME Multipart message to support both plain text and HTML content
-        msg = MIMEMultipart("alternative")
-        msg['Subject'] = subject
-        msg['From'] = from_email
-        msg['To'] = ', '.join(recipient_list)
-
-        # Add plain text part (for fallback)
-        part1 = MIMEText(plain_message, "plain")
-        msg.attach(part1)
-
-        # Add HTML part
-        part2 = MIMEText(html_message, "html")
-        msg.attach(part2)
-
-        # Send the email using smtplib with certifi's CA bundle for SSL/TLS security
-        with smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT) as server:
-            server.starttls(context=context)
-            server.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
-            server.sendmail(from_email, recipient_list, msg.as_string())
\ No newline at end of file
+        return queue_email(subject, plain_message, from_email, recipient_list, html_message=html_message)
+
+
+def queue_email(subject, message, from_email, recipient_list, html_message=''):
+    return OutgoingEmail.objects.create(
+        subject=subject, body=message, html_body=html_message or '',
+        from_email=from_email or settings.EMAIL_HOST_USER or '', recipients=list(recipient_list),
+    )
+
+
+def queue_moderation_emails(profiles, action_taken, reason, duration_key=None):
+    """
+    Notices for a bulk suspension or termination, queued with one INSERT.
+    `profiles` are the (pk, user_id, email) rows the bulk update returned.
+    """
+    if action_taken == 'suspend':
+        durations = dict(UserReport._meta.get_field('suspension_duration').choices)
+        period = f" for {durations[duration_key]}" if duration_key in durations else ""
+        subject, message = 'Account Suspension', f"Your account has been suspended{period}.\nReason: {reason}"
+    else:
+        subject, message = 'Account Termination', f"Your account has been terminated.\nReason: {reason}"
+    return OutgoingEmail.objects.bulk_create([
+        OutgoingEmail(subject=subject, body=message, from_email=settings.EMAIL_HOST_USER or '', recipients=[email])
+        for _, _, email in profiles if email
+    ], batch_size=500)
+
+
+def queue_verification_emails(profiles, status, remarks=None):
+    # Verified/rejected notices for (pk, user_id, email) rows, queued with one INSERT
+    if status == UserProfile.VERIFIED:
+        message = 'Your account was verified by our team. Kindly ignore this message if you did not initiate this request.'
+    elif status == UserProfile.REJECTED:
+        message = f'Your account was rejected by our team. \n{remarks}'
+    else:
+        return []
+    return OutgoingEmail.objects.bulk_create([
+        OutgoingEmail(subject='Registration', body=message, from_email=settings.EMAIL_HOST_USER or '', recipients=[email])
+        for _, _, email in profiles if email
+    ], batch_size=500)
+
+
+@lru_cache(maxsize=None)
+def ssl_context():
+    # certifi's CA bundle is read once per process
+    return ssl.create_default_context(cafile=certifi.where())
+
+
+def build_message(email):
+    if email.html_body:
+        # Plain text first, clients show the last part they support
+        message = MIMEMultipart("alternative")
+        message.attach(MIMEText(email.body, "plain"))
+        message.attach(MIMEText(email.html_body, "html"))
+    else:
+        message = MIMEText(email.body, "plain")
+    message['Subject'] = email.subject
+    message['From'] = email.from_email
+    message['To'] = ', '.join(email.recipients)
+    return message.as_string()
+
+
+class SMTPSession:
+    """
+    One authenticated SMTP connection, opened on first use and reused for
+    every message after it. Sends are paced to EMAIL_SETTINGS["RATE_LIMIT"].
+    """
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.connection = None
+        self.sent = 0
+        self.connects = 0
+        self.last_used = 0
+
+    def open(self):
+        connection = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=self.timeout)
+        try:
+            if settings.EMAIL_USE_TLS:
+                connection.starttls(context=ssl_context())
+            if settings.EMAIL_HOST_USER:
+                connection.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
+        except BaseException:
+            connection.close()
+            raise
+        self.connection, self.sent = connection, 0
+        self.connects += 1
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.connection = None
+
+    def close_if_idle(self):
+        if self.connection is not None and time.monotonic() - self.last_used > EMAIL_SETTINGS["IDLE_TIMEOUT"]:
+            self.close()
+
+    def throttle(self):
+        if EMAIL_SETTINGS["RATE_LIMIT"]:
+            wait = self.last_used + 1 / EMAIL_SETTINGS["RATE_LIMIT"] - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+    def send(self, from_email, recipients, message):
+        if self.sent >= EMAIL_SETTINGS["MAX_MESSAGES_PER_SESSION"]:
+            self.close()
+        self.throttle()
+        reconnected = self.connection is None
+        if reconnected:
+            self.open()
+        try:
+            self.connection.sendmail(from_email, recipients, message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped a session we kept open, reconnect once
+            self.connection = None
+            if reconnected:
+                raise
+            self.open()
+            self.connection.sendmail(from_email, recipients, message)
+        finally:
+            self.last_used = time.monotonic()
+        self.sent += 1
+
+
+def is_permanent_error(exc):
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    return isinstance(exc, (smtplib.SMTPDataError, smtplib.SMTPSenderRefused)) and exc.smtp_code >= 500
+
+
+def retry_delay(attempts):
+    delay = EMAIL_SETTINGS["RETRY_BACKOFF_SECONDS"] * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, EMAIL_SETTINGS["MAX_BACKOFF_SECONDS"]))
+
+
+def claim_emails():
+    # Lease the rows instead of holding locks while a rate-limited send runs;
+    # a worker that dies leaves them to be picked up when the lease ends
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutgoingEmail.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:EMAIL_SETTINGS["DRAIN_LIMIT"]]
+        )
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            next_attempt_at=now + timedelta(seconds=EMAIL_SETTINGS["LEASE_SECONDS"])
+        )
+    return emails
+
+
+def drain_queue(session):
+    """
+    Sends every due email over `session` and returns how many were processed.
+    Several workers can run, each claims its own rows.
+    """
+    emails = claim_emails()
+    for i, email in enumerate(emails):
+        email.attempts += 1
+        try:
+            session.send(email.from_email, email.recipients, build_message(email))
+        except (smtplib.SMTPException, OSError) as exc:
+            logger.warning("Email %s failed: %s", email.pk, exc)
+            email.last_error = str(exc)
+            if is_permanent_error(exc) or email.attempts >= EMAIL_SETTINGS["MAX_ATTEMPTS"]:
+                email.status = OutgoingEmail.FAILED
+            else:
+                email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+
+            if not isinstance(exc, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused)):
+                # The session itself is broken: put the rest back for the next pass
+                session.close()
+                email.save(update_fields=["status", "attempts", "next_attempt_at", "last_error", "updated_at"])
+                OutgoingEmail.objects.filter(pk__in=[rest.pk for rest in emails[i + 1:]]).update(
+                    next_attempt_at=email.next_attempt_at
+                )
+                return i + 1
+        else:
+            email.status = OutgoingEmail.SENT
+            email.sent_at = timezone.now()
+            email.last_error = None
+        email.save(update_fields=["status", "attempts", "next_attempt_at", "last_error", "sent_at", "updated_at"])
+    return len(emails)
@@ -0,0 +1,64 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from oauth2_provider.models import Application
+
+from core.benchmark import QueryCounter, throwaway_database
+from user_profile.models import UserProfile
+
+PASSWORD = "benchmark-password"
+CLIENT_SECRET = "benchmark-secret"
+
+
+def seed_login():
+    user = User.objects.create_user(username="bench", password=PASSWORD, first_name="Bench", last_name="User")
+    UserProfile.objects.create(user=user, address="Legazpi City", contact_number="09170000000")
+    application = Application.objects.create(
+        name="Benchmark", user=user, client_type=Application.CLIENT_CONFIDENTIAL,
+        authorization_grant_type=Application.GRANT_PASSWORD, client_secret=CLIENT_SECRET,
+    )
+    return json.dumps({
+        'grant_type': 'password', 'username': user.username, 'password': PASSWORD,
+        'client_id': application.client_id, 'client_secret': CLIENT_SECRET,
+    })
+
+
+class Command(BaseCommand):
+    help = "Measures password-grant logins per second on one worker and the queries each one runs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help="Logins to time.")
+        parser.add_argument(
+            '--fast-hasher', action='store_true',
+            help="Hash with MD5 so password hashing doesn't hide the view's own cost.",
+        )
+
+    def handle(self, *args, **options):
+        hashers = ['django.contrib.auth.hashers.MD5PasswordHasher'] if options['fast_hasher'] else None
+        with override_settings(**({'PASSWORD_HASHERS': hashers} if hashers else {})):
+            with throwaway_database():
+                self.run_logins(seed_login(), options['logins'])
+
+    def run_logins(self, body, logins):
+        client, url = Client(), reverse('token')
+        timings = []
+        with QueryCounter() as queries:
+            for _ in range(logins):
+                started = time.perf_counter()
+                res = client.post(url, body, content_type='application/json')
+                timings.append(time.perf_counter() - started)
+                if res.status_code != 200:
+                    raise CommandError(f"Login failed with {res.status_code}: {res.content.decode()}")
+
+        timings = sorted(timing * 1000 for timing in timings)
+        self.stdout.write(f"Logins:          {logins}")
+        self.stdout.write(f"Logins/sec:      {logins / (sum(timings) / 1000):.1f}")
+        self.stdout.write(f"Latency:         mean {statistics.mean(timings):.2f}ms  p50 {statistics.median(timings):.2f}ms  "
+                          f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f}ms")
+        self.stdout.write(f"Queries/login:   {queries.count / logins:.2f}")
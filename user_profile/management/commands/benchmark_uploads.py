@@ -0,0 +1,127 @@
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from PIL import Image
+
+from core.benchmark import throwaway_database
+from user_profile.models import ReportImage
+
+BOUNDARY = "benchmark-boundary"
+
+
+def seed_report():
+    # A reporter with a bearer token, and the user they report
+    reporter = User.objects.create_user(username="bench-reporter", first_name="Bench", last_name="Reporter")
+    reported = User.objects.create_user(username="bench-reported", first_name="Bench", last_name="Reported")
+    application = Application.objects.create(
+        name="Benchmark", user=reporter, client_type=Application.CLIENT_CONFIDENTIAL,
+        authorization_grant_type=Application.GRANT_PASSWORD,
+    )
+    token = AccessToken.objects.create(
+        user=reporter, application=application, token="benchmark-upload-token",
+        expires=timezone.now() + timedelta(hours=1), scope="read write",
+    )
+    return token.token, reported.pk
+
+
+def write_image(out, size, seed):
+    # A real JPEG header padded with noise to `size` bytes; viewers ignore trailing data
+    buffer = BytesIO()
+    Image.new("RGB", (16, 16), (seed % 256, 0, 0)).save(buffer, format="JPEG")
+    out.write(buffer.getvalue())
+    remaining = size - buffer.tell()
+    while remaining > 0:
+        chunk = os.urandom(min(remaining, 1024 * 1024))
+        out.write(chunk)
+        remaining -= len(chunk)
+
+
+def write_body(path, reported_id, images, size, duplicates=0):
+    """
+    The multipart body of a report with `images` files of `size` bytes, the
+    last `duplicates` of them repeating the first. Written straight to disk.
+    """
+    first = path + '.first'
+    with open(first, 'wb') as out:
+        write_image(out, size, 0)
+    with open(path, 'wb') as out:
+        for name, value in (('reported_user', reported_id), ('reason', "Benchmark")):
+            out.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for i in range(images):
+            out.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="images"; filename="photo{i}.jpg"\r\n'
+                      f'Content-Type: image/jpeg\r\n\r\n'.encode())
+            if i == 0 or i >= images - duplicates:
+                with open(first, 'rb') as image:
+                    shutil.copyfileobj(image, out)
+            else:
+                write_image(out, size, i)
+            out.write(b'\r\n')
+        out.write(f'--{BOUNDARY}--\r\n'.encode())
+    os.remove(first)
+    return os.path.getsize(path)
+
+
+class Command(BaseCommand):
+    help = "Posts a report with large images through the WSGI handler and reports peak memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=10, help="Images in the report.")
+        parser.add_argument('--size-mb', type=float, default=5, help="Size of each image.")
+        parser.add_argument('--duplicates', type=int, default=0, help="How many of them repeat the first one.")
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix="benchmark-uploads-")
+        try:
+            with override_settings(MEDIA_ROOT=os.path.join(workdir, 'media'), MAX_IMAGE_UPLOAD_SIZE=64 * 1024 * 1024):
+                with throwaway_database():
+                    token, reported_id = seed_report()
+                    body = os.path.join(workdir, 'body')
+                    write_body(body, reported_id, options['images'], int(options['size_mb'] * 1024 * 1024), options['duplicates'])
+                    self.run_upload(body, token)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def run_upload(self, body_path, token):
+        length = os.path.getsize(body_path)
+        statuses = []
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        tracemalloc.start()
+        started = time.perf_counter()
+        with open(body_path, 'rb') as body:
+            environ = RequestFactory()._base_environ(
+                PATH_INFO=reverse('api:user-report-create'), REQUEST_METHOD='POST',
+                CONTENT_TYPE=f'multipart/form-data; boundary={BOUNDARY}', CONTENT_LENGTH=str(length),
+                HTTP_AUTHORIZATION=f'Bearer {token}', **{'wsgi.input': body, 'wsgi.errors': sys.stderr},
+            )
+            res = WSGIHandler()(environ, lambda status, headers: statuses.append(status))
+            content = b''.join(res)
+            # What the WSGI server does after sending it: closes the request's files
+            res.close()
+        elapsed = time.perf_counter() - started
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if not statuses[0].startswith('201'):
+            raise CommandError(f"Upload failed with {statuses[0]}: {content.decode()[:500]}")
+
+        # ru_maxrss is in KB on Linux; the peak only grows, so this is what the request added
+        self.stdout.write(f"Body:            {length / 1024 / 1024:.1f} MB")
+        self.stdout.write(f"Time:            {elapsed:.2f}s")
+        self.stdout.write(f"Peak RSS growth: {(rss_after - rss_before) / 1024:.1f} MB")
+        self.stdout.write(f"Python peak:     {traced_peak / 1024 / 1024:.1f} MB")
+        self.stdout.write(f"Stored images:   {ReportImage.objects.values('image').distinct().count()}")
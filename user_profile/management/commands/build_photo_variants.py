@@ -0,0 +1,49 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.images import build_variants
+from user_profile.models import UserProfile
+from user_profile.signals import profiles_bulk_updated
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Writes the resized variants of photos uploaded before they existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Profiles per pass.")
+
+    def handle(self, *args, **options):
+        has_photo = Q()
+        for field in UserProfile.PHOTO_FIELDS:
+            has_photo |= ~Q(**{field: ''}) & Q(**{f'{field}__isnull': False})
+        profiles = UserProfile.objects.filter(has_photo).order_by('pk').only('pk', 'user_id', 'photo_variants', *UserProfile.PHOTO_FIELDS)
+
+        last_pk, total = 0, 0
+        while True:
+            batch = list(profiles.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            updated = []
+            for profile in batch:
+                variants = dict(profile.photo_variants)
+                for field in UserProfile.PHOTO_FIELDS:
+                    photo = getattr(profile, field)
+                    if photo and field not in variants:
+                        try:
+                            variants[field] = build_variants(photo)
+                        except (OSError, ValueError) as exc:
+                            # Missing or unreadable file, the original URL keeps being used
+                            logger.warning("No variants for %s of profile %s: %s", field, profile.pk, exc)
+                if variants != profile.photo_variants:
+                    # One column, profiles_bulk_updated below drops the cached payloads
+                    UserProfile.objects.filter(pk=profile.pk).update(photo_variants=variants)
+                    updated.append((profile.pk, profile.user_id))
+            if updated:
+                profiles_bulk_updated.send(sender=UserProfile, profiles=updated)
+                total += len(updated)
+        self.stdout.write(f"Built variants for {total} profile(s).")
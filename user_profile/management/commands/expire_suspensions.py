@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from user_profile.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Lifts suspensions whose suspended_until has passed, in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Sweep once and exit.")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds between sweeps.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Profiles per UPDATE.")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            expired = UserProfile.expire_suspensions(batch_size=options['batch_size'])
+            if expired:
+                self.stdout.write(f"Lifted {expired} expired suspension(s).")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from user_profile.email import SMTPSession, drain_queue
+
+
+class Command(BaseCommand):
+    help = "Delivers queued emails over one reused SMTP session."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+
+    def handle(self, *args, **options):
+        session = SMTPSession()
+        try:
+            while True:
+                close_old_connections()
+                processed = drain_queue(session)
+                if processed:
+                    self.stdout.write(f"Processed {processed} email(s).")
+                if options['once']:
+                    break
+                if not processed:
+                    session.close_if_idle()
+                    time.sleep(options['interval'])
+        finally:
+            session.close()
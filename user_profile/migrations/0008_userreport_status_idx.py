@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_profile', '0007_userreport_additional_info'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userreport',
+            index=models.Index(fields=['reported_user', 'status'], name='report_user_status_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_profile', '0008_userreport_status_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(condition=models.Q(('is_suspended', True)), fields=['suspended_until'], name='profile_suspension_idx'),
+        ),
+    ]
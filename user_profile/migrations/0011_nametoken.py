@@ -0,0 +1,39 @@
+# Generated by Django 4.2.13 on 2026-10-18 12:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from user_profile.search import BATCH_SIZE, name_tokens
+
+
+def index_names(apps, schema_editor):
+    UserProfile = apps.get_model('user_profile', 'UserProfile')
+    NameToken = apps.get_model('user_profile', 'NameToken')
+    db = schema_editor.connection.alias
+    rows = UserProfile.objects.using(db).order_by('pk').values_list('pk', 'user__first_name', 'user__last_name')
+    NameToken.objects.using(db).bulk_create(
+        (NameToken(user_profile_id=pk, token=token) for pk, first, last in rows.iterator() for token in name_tokens(first, last)),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_profile', '0010_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NameToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('user_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_tokens', to='user_profile.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'user_profile'], name='name_token_prefix_idx', opclasses=['varchar_pattern_ops', 'int8_ops'])],
+            },
+        ),
+        migrations.RunPython(index_names, migrations.RunPython.noop),
+    ]
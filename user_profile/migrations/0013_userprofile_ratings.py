@@ -0,0 +1,59 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:08
+
+from django.db import migrations, models
+import user_profile.models
+
+from task.ratings import BATCH_SIZE, rating_aggregates
+
+
+def count_ratings(apps, schema_editor):
+    UserProfile = apps.get_model('user_profile', 'UserProfile')
+    TaskReview = apps.get_model('task', 'TaskReview')
+    db = schema_editor.connection.alias
+    aggregates = rating_aggregates(TaskReview.objects.using(db))
+    UserProfile.objects.using(db).bulk_update(
+        [UserProfile(pk=pk, **fields) for pk, fields in aggregates.items()],
+        user_profile.models.UserProfile.RATING_FIELDS, batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_profile', '0012_userprofile_photo_variants'),
+        ('task', '0028_task_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='performer_rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='performer_rating_histogram',
+            field=models.JSONField(default=user_profile.models.empty_rating_histogram, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='performer_rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='provider_rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='provider_rating_histogram',
+            field=models.JSONField(default=user_profile.models.empty_rating_histogram, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='provider_rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_ratings, migrations.RunPython.noop),
+    ]
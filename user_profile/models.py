@@ -1,11 +1,27 @@
+import hashlib
 from datetime import timedelta
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.contrib.auth.models import User
 from etugal_core import settings
 from django.utils import timezone
 
+from core.images import delete_variants, process_upload
+from core.uploads import EXTENSIONS as UPLOAD_EXTENSIONS
+from core.base_models import BaseModel, TrackedFieldsMixin, model_fields
+from user_profile.signals import profiles_bulk_updated
 
-class UserProfile(models.Model):
+# auth_user columns read by nested profile payloads (UserSerializer)
+PROFILE_USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name')
+# Stars 0 (left unrated) to 5
+RATING_STARS = 6
+
+
+def empty_rating_histogram():
+    return [0] * RATING_STARS
+
+
+class UserProfile(TrackedFieldsMixin, models.Model):
     class ProfileManager(models.Manager):
         def get_queryset(self):
             return super().get_queryset().select_related('user')
@@ -59,37 +75,190 @@ class UserProfile(models.Model):
     suspended_until = models.DateTimeField(blank=True, null=True)
     is_terminated = models.BooleanField(default=False)
     termination_reason = models.TextField(blank=True, null=True)
-    
-    
-    
+    # Resized copies of the photos, {field: {size: storage name}}, see core.images
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Ratings received from reviews, kept up to date by task.ratings. Counts and
+    # sums cover rated reviews only, histogram[0] counts reviews left unrated.
+    provider_rating_count = models.PositiveIntegerField(default=0, editable=False)
+    provider_rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    provider_rating_histogram = models.JSONField(default=empty_rating_histogram, editable=False)
+    performer_rating_count = models.PositiveIntegerField(default=0, editable=False)
+    performer_rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    performer_rating_histogram = models.JSONField(default=empty_rating_histogram, editable=False)
+
+    # Original values kept at load time, see TrackedFieldsMixin
+    tracked_fields = ('verification_status',)
+
+    PHOTO_FIELDS = ('profile_photo', 'id_photo', 'face_photo')
+    RATING_ROLES = ('provider', 'performer')
+    RATING_FIELDS = tuple(
+        f'{role}_rating_{name}' for role in RATING_ROLES for name in ('count', 'sum', 'histogram')
+    )
+
     def __str__(self):
         return str(f'{self.user.last_name} - {self.user.first_name}')
+
+    def save(self, *args, **kwargs):
+        variants = self.photo_variants
+        replaced = self.process_photos()
+        update_fields = kwargs.get('update_fields')
+        if self.photo_variants is not variants and update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'photo_variants'}
+        super().save(*args, **kwargs)
+        if replaced:
+            # Old variants go once the row points at the new ones
+            storage = self._meta.get_field('profile_photo').storage
+            transaction.on_commit(lambda: [delete_variants(storage, variants) for variants in replaced])
+
+    def process_photos(self):
+        # New uploads are re-encoded and resized; returns the variants they replace
+        replaced = []
+        for field in self.PHOTO_FIELDS:
+            photo = getattr(self, field)
+            if photo and not photo._committed:
+                old = self.photo_variants.get(field)
+                self.photo_variants = dict(self.photo_variants, **{field: process_upload(photo)})
+            elif not photo and field in self.photo_variants:
+                old = self.photo_variants[field]
+                self.photo_variants = {name: value for name, value in self.photo_variants.items() if name != field}
+            else:
+                continue
+            if old:
+                replaced.append(old)
+        return replaced
+
+    def photo_url(self, field, size=None):
+        # URL of a photo's variant, or of the photo itself when it has none (yet)
+        return self.stored_photo_url(field, getattr(self, field).name, self.photo_variants, size)
+
+    @classmethod
+    def stored_photo_url(cls, field, name, variants, size=None):
+        # photo_url() from the raw column values, for values() rows
+        if not name:
+            return None
+        return cls._meta.get_field(field).storage.url(variants.get(field, {}).get(size) or name)
     
+    def rating_summary(self, role):
+        # Ratings received as 'provider' or 'performer'
+        count, total = getattr(self, f'{role}_rating_count'), getattr(self, f'{role}_rating_sum')
+        return {
+            "count": count,
+            "sum": total,
+            "average": round(total / count, 2) if count else None,
+            "histogram": getattr(self, f'{role}_rating_histogram'),
+        }
+
     def suspend(self, reason, duration_key=None):
         self.is_suspended = True
         self.suspension_reason = reason
-        if duration_key in self.SUSPENSION_DURATIONS:
-            self.suspended_until = timezone.now() + self.SUSPENSION_DURATIONS[duration_key]
-        else:
-            self.suspended_until = None  # Indefinite suspension
-            # Log an error or raise an exception if needed
-        self.save()
+        self.suspended_until = self.suspension_end(duration_key)
+        self.save(update_fields=['is_suspended', 'suspension_reason', 'suspended_until'])
 
     def terminate(self, reason):
         self.is_terminated = True
         self.termination_reason = reason
-        self.save()
+        self.save(update_fields=['is_terminated', 'termination_reason'])
+
+    @classmethod
+    def suspension_end(cls, duration_key, now=None):
+        if duration_key in cls.SUSPENSION_DURATIONS:
+            return (now or timezone.now()) + cls.SUSPENSION_DURATIONS[duration_key]
+        return None  # Indefinite suspension
 
-    def is_active(self):
-        # Check suspension expiry and termination
-        if self.is_terminated:
+    @classmethod
+    def bulk_suspend(cls, profiles, reason, duration_key=None):
+        """
+        suspend() for a queryset of profiles in one UPDATE. Returns the
+        (pk, user_id, email) of every profile it suspended.
+        """
+        return cls._bulk_moderate(
+            profiles, is_suspended=True, suspension_reason=reason, suspended_until=cls.suspension_end(duration_key)
+        )
+
+    @classmethod
+    def bulk_terminate(cls, profiles, reason):
+        # terminate() for a queryset of profiles, see bulk_suspend
+        return cls._bulk_moderate(profiles, is_terminated=True, termination_reason=reason)
+
+    @classmethod
+    def bulk_verify(cls, profiles):
+        # Marks the profiles not verified yet as VERIFIED, see bulk_suspend
+        return cls._bulk_moderate(profiles.exclude(verification_status=cls.VERIFIED), verification_status=cls.VERIFIED)
+
+    @classmethod
+    def _bulk_moderate(cls, profiles, **changes):
+        moderated = list(profiles.order_by().values_list('pk', 'user_id', 'user__email'))
+        if moderated:
+            cls.objects.filter(pk__in=[pk for pk, _, _ in moderated]).update(**changes)
+            # update() skips post_save, the payload and token caches listen for this instead
+            profiles_bulk_updated.send(sender=cls, profiles=[(pk, user_id) for pk, user_id, _ in moderated])
+        return moderated
+
+    def is_currently_suspended(self, now=None):
+        # A suspension past suspended_until no longer counts, even before the sweep clears it
+        if not self.is_suspended:
             return False
-        if self.is_suspended and self.suspended_until and self.suspended_until < timezone.now():
-            self.is_suspended = False
-            self.suspension_reason = ""
-            self.suspended_until = None
-            self.save()
-        return not self.is_suspended
+        return self.suspended_until is None or self.suspended_until >= (now or timezone.now())
+
+    def is_active(self, now=None):
+        # Pure check, expired suspensions are cleared by `manage.py expire_suspensions`
+        return not self.is_terminated and not self.is_currently_suspended(now)
+
+    @classmethod
+    def expire_suspensions(cls, batch_size=1000, now=None):
+        """
+        Lifts every suspension whose suspended_until has passed, one UPDATE
+        per batch, and sends profiles_bulk_updated for each batch.
+        """
+        now = now or timezone.now()
+        expired = cls.objects.filter(is_suspended=True, suspended_until__lt=now)
+        total = 0
+        while True:
+            batch = list(expired.order_by('pk').values_list('pk', 'user_id')[:batch_size])
+            if not batch:
+                return total
+            pks = [pk for pk, _ in batch]
+            total += cls.objects.filter(pk__in=pks, is_suspended=True, suspended_until__lt=now).update(
+                is_suspended=False, suspension_reason="", suspended_until=None
+            )
+            profiles_bulk_updated.send(sender=cls, profiles=batch)
+
+    class Meta:
+        indexes = [
+            # Suspensions waiting for expire_suspensions
+            models.Index(fields=['suspended_until'], condition=models.Q(is_suspended=True), name='profile_suspension_idx'),
+        ]
+
+
+class NameToken(models.Model):
+    """
+    One normalized word of a profile's first or last name, for prefix search
+    of people by name (user_profile.search). Kept in sync by UserProfileConfig.ready.
+    """
+    user_profile = models.ForeignKey(UserProfile, related_name='name_tokens', on_delete=models.CASCADE)
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [
+            # Prefix range scans that yield the profile without reading the row;
+            # pattern ops so Postgres can use it for LIKE 'prefix%' in any collation
+            models.Index(
+                fields=['token', 'user_profile'], name='name_token_prefix_idx',
+                opclasses=['varchar_pattern_ops', 'int8_ops'],
+            ),
+        ]
+
+
+def suspended_q(prefix='', now=None):
+    # Q for profiles (at `prefix`) under a suspension that hasn't expired
+    return Q(**{f'{prefix}is_suspended': True}) & (
+        Q(**{f'{prefix}suspended_until__isnull': True}) | Q(**{f'{prefix}suspended_until__gte': now or timezone.now()})
+    )
+
+
+def profile_fields(prefix):
+    # only() field list for a select_related UserProfile (and its user) at `prefix`
+    return model_fields(UserProfile, prefix) + [f'{prefix}user__{name}' for name in PROFILE_USER_FIELDS]
 
 
 class UserReport(models.Model):
@@ -127,6 +296,12 @@ class UserReport(models.Model):
     resolution_notes = models.TextField(blank=True, null=True)
     resolved_at = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Open-report lookups for the users shown in list endpoints
+            models.Index(fields=['reported_user', 'status'], name='report_user_status_idx'),
+        ]
+
     def resolve_report(self, action_taken, resolution_notes=""):
         self.status = 'resolved'
         self.action_taken = action_taken
@@ -145,6 +320,40 @@ class UserReport(models.Model):
         
         self.save()
 
+    @classmethod
+    def bulk_resolve(cls, reports, action_taken, resolution_notes="", reason_template="{reason}"):
+        """
+        resolve_report() for a queryset of reports. Pending ones are resolved
+        in one UPDATE, their users moderated in one more per distinct
+        (reason, duration); a report without a duration suspends
+        indefinitely, as the admin actions always did. Returns {(reason, duration_key): [(pk, user_id, email), ...]}.
+        """
+        pending = list(
+            reports.filter(status='pending').order_by('pk')
+            .values_list('pk', 'reported_user_id', 'reason', 'suspension_duration')
+        )
+        if not pending:
+            return {}
+        cls.objects.filter(pk__in=[pk for pk, _, _, _ in pending]).update(
+            status='resolved', action_taken=action_taken, resolution_notes=resolution_notes, resolved_at=timezone.now()
+        )
+
+        # A user reported more than once gets the latest report's reason, as if resolved one by one
+        latest = {user_id: (reason, duration) for _, user_id, reason, duration in pending}
+        groups = {}
+        for user_id, (reason, duration) in latest.items():
+            groups.setdefault((reason, duration if action_taken == 'suspend' else None), []).append(user_id)
+
+        moderated = {}
+        for (reason, duration), user_ids in groups.items():
+            profiles = UserProfile.objects.filter(user_id__in=user_ids)
+            reason_text = reason_template.format(reason=reason)
+            if action_taken == 'suspend':
+                moderated[(reason_text, duration)] = UserProfile.bulk_suspend(profiles, reason_text, duration)
+            elif action_taken == 'terminate':
+                moderated[(reason_text, None)] = UserProfile.bulk_terminate(profiles, reason_text)
+        return moderated
+
     def __str__(self):
         return f"Report by {self.reporter.username} against {self.reported_user.username} (Status: {self.status})"
     
@@ -154,5 +363,73 @@ class ReportImage(models.Model):
     report = models.ForeignKey(UserReport, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='report_images/')  # You can customize the upload path
 
+    MAX_PER_REPORT = 10
+
+    def __str__(self):
+        return f'Image for report {self.report.id}'
+
+    @classmethod
+    def store(cls, report, uploads):
+        """
+        Saves uploads under the hash of their content, so the same picture is
+        stored once however often it's reported, and creates their rows with
+        one INSERT. Uploads from core.uploads come hashed already.
+        """
+        field = cls._meta.get_field('image')
+        names = {}
+        for upload in uploads:
+            digest = getattr(upload, 'sha256', None) or content_hash(upload)
+            if digest in names:
+                continue
+            extension = UPLOAD_EXTENSIONS.get(getattr(upload, 'image_format', None)) or upload.name.rsplit('.', 1)[-1].lower()
+            name = f"{field.upload_to}{digest[:2]}/{digest}.{extension}"
+            if not field.storage.exists(name):
+                name = field.storage.save(name, upload)
+            names[digest] = name
+        return cls.objects.bulk_create([cls(report=report, image=name) for name in names.values()])
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class OutgoingEmail(BaseModel):
+    """
+    Queue of outgoing mail. Requests only insert rows here; the send_emails
+    worker delivers them over one long-lived SMTP session.
+    """
+    PENDING = 'PENDING'
+    SENT = 'SENT'
+    FAILED = 'FAILED'
+
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Outgoing Email"
+        verbose_name_plural = "Outgoing Emails"
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='email_due_idx'),
+        ]
+
     def __str__(self):
-        return f'Image for report {self.report.id}'
\ No newline at end of file
+        return f"{self.subject} - {', '.join(self.recipients)} ({self.status})"
@@ -0,0 +1,114 @@
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from user_profile.models import UserProfile
+
+# Profile payloads are cached per user and per profile, dropped whenever the
+# User or UserProfile is saved (see UserProfileConfig.ready)
+PROFILE_CACHE_TIMEOUT = 60 * 60 * 24
+PHOTO_FIELDS = ('profilePhoto', 'idPhoto')
+
+
+def user_key(user_id):
+    return f"profile-payload:user:{user_id}"
+
+
+def profile_key(profile_pk):
+    return f"profile-payload:profile:{profile_pk}"
+
+
+def build_profile_payload(user_profile):
+    """
+    The profile representation shared by registration, login and /api/profile.
+    Photos are kept as relative URLs here, profile_response makes them absolute.
+    """
+    user = user_profile.user
+    suspended = user_profile.is_currently_suspended()
+    return {
+        "pk": str(user.pk),
+        "profilePk": str(user_profile.pk),
+        "username": user.username,
+        "firstName": user.first_name,
+        "lastName": user.last_name,
+        "email": user.email,
+        "contactNumber": user_profile.contact_number,
+        "birthdate": user_profile.birthdate.isoformat() if user_profile.birthdate else None,
+        "profilePhoto": user_profile.photo_url('profile_photo', 'medium'),
+        "idPhoto": user_profile.id_photo.url if user_profile.id_photo else None,
+        "address": user_profile.address,
+        "gender": user_profile.gender,
+        "verificationStatus": user_profile.verification_status,
+        "verificationRemarks": user_profile.verification_remarks,
+        # An expired suspension reads as lifted, the way the sweep will leave it
+        "is_suspended": suspended,
+        "suspension_reason": user_profile.suspension_reason if suspended else "",
+        "suspended_until": user_profile.suspended_until.isoformat() if suspended and user_profile.suspended_until else None,
+        "is_terminated": user_profile.is_terminated,
+        "termination_reason": user_profile.termination_reason,
+    }
+
+
+def cache_profile_payload(payload):
+    timeout = PROFILE_CACHE_TIMEOUT
+    if payload["suspended_until"]:
+        # Expire with the suspension so the payload flips to active on time
+        remaining = datetime.fromisoformat(payload["suspended_until"]) - timezone.now()
+        timeout = max(1, min(timeout, int(remaining.total_seconds()) + 1))
+    cache.set_many({
+        user_key(payload["pk"]): payload,
+        profile_key(payload["profilePk"]): payload,
+    }, timeout)
+    return payload
+
+
+def get_profile_payload(user_id=None, profile_pk=None):
+    """
+    Cached payload by user id or profile pk: no queries when warm, one when
+    cold. Raises UserProfile.DoesNotExist.
+    """
+    key = user_key(user_id) if user_id is not None else profile_key(profile_pk)
+    payload = cache.get(key)
+    if payload is None:
+        lookup = {'user_id': user_id} if user_id is not None else {'pk': profile_pk}
+        payload = cache_profile_payload(build_profile_payload(UserProfile.objects.select_related('user').get(**lookup)))
+    return payload
+
+
+def profile_response(request, payload, **extra):
+    # Absolute photo URLs depend on the request's host, so they're never cached
+    data = dict(payload, **extra)
+    for field in PHOTO_FIELDS:
+        if data[field]:
+            data[field] = request.build_absolute_uri(data[field])
+    return data
+
+
+def invalidate_profile_payload(user_id=None, profile_pk=None):
+    keys = []
+    if user_id is not None:
+        keys.append(user_key(user_id))
+        cached = cache.get(user_key(user_id))
+        if cached is not None:
+            keys.append(profile_key(cached["profilePk"]))
+    if profile_pk is not None:
+        keys.append(profile_key(profile_pk))
+
+    cache.delete_many(keys)
+    # Again after commit, in case a reader cached the old row in between
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def profile_saved(sender, instance, **kwargs):
+    invalidate_profile_payload(user_id=instance.user_id, profile_pk=instance.pk)
+
+
+def user_saved(sender, instance, **kwargs):
+    invalidate_profile_payload(user_id=instance.pk)
+
+
+def profiles_updated(sender, profiles, **kwargs):
+    for profile_pk, user_id in profiles:
+        invalidate_profile_payload(user_id=user_id, profile_pk=profile_pk)
@@ -0,0 +1,108 @@
+"""
+Prefix search of people by name, for the chat search box.
+
+Every word of a user's first and last name is kept lowercased and without
+accents in NameToken, indexed on (token, profile). A query matches the
+profiles that have a token starting with each of its words, so "mar cr"
+finds Maria Clara dela Cruz, without touching auth_user until the page is
+serialized.
+"""
+import re
+import unicodedata
+
+from django.db import connections
+from django.db.models import Q
+
+from core.cache import bump_version
+from user_profile.models import NameToken, UserProfile
+
+CACHE_NAMESPACE = 'name_search'
+MIN_QUERY_LENGTH = 2
+MAX_TERMS = 4
+TOKEN_LENGTH = NameToken._meta.get_field('token').max_length
+BATCH_SIZE = 500
+
+
+def normalize(text):
+    # "Peña" -> "pena": decompose, then drop the combining marks
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def name_tokens(*names):
+    tokens = []
+    for word in re.findall(r'\w+', normalize(' '.join(names))):
+        if word[:TOKEN_LENGTH] not in tokens:
+            tokens.append(word[:TOKEN_LENGTH])
+    return tokens
+
+
+def search_terms(text):
+    return name_tokens(text)[:MAX_TERMS]
+
+
+def update_name_index(profiles):
+    """
+    Rewrites the tokens of a UserProfile queryset, in batches. Returns the
+    pks of the profiles whose tokens changed.
+    """
+    db = profiles.db
+    rows = list(profiles.order_by('pk').values_list('pk', 'user__first_name', 'user__last_name'))
+    changed = []
+    for i in range(0, len(rows), BATCH_SIZE):
+        batch = {pk: name_tokens(first, last) for pk, first, last in rows[i:i + BATCH_SIZE]}
+        current = {pk: [] for pk in batch}
+        for pk, token in NameToken.objects.using(db).filter(user_profile__in=list(batch)).values_list('user_profile_id', 'token'):
+            current[pk].append(token)
+        stale = [pk for pk, tokens in batch.items() if sorted(tokens) != sorted(current[pk])]
+        if not stale:
+            continue
+        NameToken.objects.using(db).filter(user_profile__in=stale).delete()
+        NameToken.objects.using(db).bulk_create(
+            [NameToken(user_profile_id=pk, token=token) for pk in stale for token in batch[pk]]
+        )
+        changed += stale
+    return changed
+
+
+def prefix_q(term, using='default'):
+    if connections[using].vendor == 'sqlite':
+        # SQLite's LIKE is case-insensitive and can't use a BINARY index, a range can
+        return Q(token__gte=term, token__lt=term + '\U0010ffff')
+    return Q(token__startswith=term)
+
+
+def search_profiles(queryset, text):
+    """
+    Profiles with a name word starting with every word of `text`. Queries
+    shorter than MIN_QUERY_LENGTH match nothing, they'd match half the users.
+    """
+    terms = search_terms(text)
+    if len(''.join(terms)) < MIN_QUERY_LENGTH:
+        return queryset.none()
+    for term in terms:
+        tokens = NameToken.objects.using(queryset.db).filter(prefix_q(term, queryset.db))
+        queryset = queryset.filter(pk__in=tokens.values('user_profile_id'))
+    return queryset
+
+
+def reindex_profiles(profiles):
+    if update_name_index(profiles):
+        bump_version(CACHE_NAMESPACE)
+
+
+def profile_saved(sender, instance, created, using, raw=False, **kwargs):
+    # The name lives on User, a new profile is the only profile save that changes it
+    if created and not raw:
+        reindex_profiles(UserProfile.objects.using(using).filter(pk=instance.pk))
+
+
+def profile_deleted(sender, instance, **kwargs):
+    bump_version(CACHE_NAMESPACE)
+
+
+def user_saved(sender, instance, created, using, update_fields=None, raw=False, **kwargs):
+    # Logins save last_login only, those can't change the name
+    if created or raw or (update_fields is not None and not {'first_name', 'last_name'} & set(update_fields)):
+        return
+    reindex_profiles(UserProfile.objects.using(using).filter(user=instance))
@@ -3,6 +3,8 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import UserProfile, ReportImage, UserReport
 from django.core.files.base import ContentFile
+from django.db import transaction
+from core.uploads import check_uploads, uploaded_images
 import base64
 
 
@@ -23,23 +25,52 @@ class UserReportSerializer(serializers.ModelSerializer):
             },
         }
 
+    def validate(self, attrs):
+        request = self.context.get('request')
+        # Files come straight from the request, checked as they were uploaded (core.uploads)
+        attrs['images'] = uploaded_images(request, 'images', limit=ReportImage.MAX_PER_REPORT) if request else []
+        return attrs
+
     def create(self, validated_data):
         request = self.context.get('request')
+        images = validated_data.pop('images', [])
         
         # Automatically set the reporter to the current user
         if request and hasattr(request, 'user'):
             validated_data['reporter'] = request.user
 
-        # Create the UserReport instance
-        report = UserReport.objects.create(**validated_data)
-
-        # Handle images
-        images = request.FILES.getlist('images')  # Access the files directly
-        for image in images:
-            ReportImage.objects.create(report=report, image=image)  # Create ReportImage instances
+        with transaction.atomic():
+            report = UserReport.objects.create(**validated_data)
+            # Duplicates are stored once, the rows go in with one INSERT
+            ReportImage.store(report, images)
 
         return report
     
+class OpenReportResolver:
+    """
+    Loads the open (unresolved) report of a known set of users with a single
+    query, so serializers can embed them without one query per profile.
+    """
+
+    def __init__(self, user_ids):
+        self.user_ids = set(user_ids)
+        self._reports = None
+
+    def covers(self, user_id):
+        return user_id in self.user_ids
+
+    def get(self, user_id):
+        if self._reports is None:
+            self._reports = {}
+            queryset = UserReport.objects.filter(
+                reported_user_id__in=self.user_ids
+            ).exclude(status='resolved').prefetch_related('images').order_by('pk')
+            for report in queryset:
+                # Keep the oldest open report per user
+                self._reports.setdefault(report.reported_user_id, report)
+        return self._reports.get(user_id)
+
+    
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -172,11 +203,35 @@ class ProfileSerializer(serializers.Serializer):
         user.email = user_data.get('email', user.email)
         user.username = user_data.get('email', user.email)
 
-        instance.save()
+        instance.save(update_fields=['contact_number', 'address'])
 
         return instance
 
 
+class PhotoVariantField(serializers.Field):
+    # URL of a profile photo's `size` variant (see UserProfile.photo_url), absolute with a request
+    def __init__(self, size, photo_field=None, **kwargs):
+        self.size, self.photo_field = size, photo_field
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, profile):
+        url = profile.photo_url(self.photo_field or self.field_name, self.size)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if url and request else url
+
+
+class RatingSummaryField(serializers.Field):
+    # Ratings received as `role`, read from the profile's own columns (see UserProfile.rating_summary)
+    def __init__(self, role, **kwargs):
+        self.role = role
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, profile):
+        return profile.rating_summary(self.role)
+
+
 class UploadPhotoSerializer(serializers.ModelSerializer):
     profile_photo = serializers.ImageField(required=False, allow_null=True)
     id_photo = serializers.ImageField(required=False, allow_null=True)  
@@ -195,8 +250,14 @@ class UploadPhotoSerializer(serializers.ModelSerializer):
 
         super(UploadPhotoSerializer, self).__init__(*args, **kwargs)
     
+    def validate(self, attrs):
+        if self.request is not None:
+            check_uploads(self.request)
+        return attrs
+
     def update(self, instance, validated_data):
         # Custom logic to update specific fields
+        update_fields = [field for field in UserProfile.PHOTO_FIELDS if field in validated_data]
 
         if 'profile_photo' in validated_data:
             instance.profile_photo = validated_data.get('profile_photo', instance.profile_photo)
@@ -207,9 +268,10 @@ class UploadPhotoSerializer(serializers.ModelSerializer):
         if 'face_photo' in validated_data:
             instance.face_photo = validated_data.get('face_photo', instance.face_photo)
             instance.verification_status = UserProfile.PROCESSING_APPLICATION
+            update_fields.append('verification_status')
 
-        # Add any other custom logic here if needed
-        instance.save()
+        # Add any other custom logic here if needed; the ratings are left to task.ratings
+        instance.save(update_fields=update_fields)
         return instance
 
 
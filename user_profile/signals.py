@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent after a queryset update() on UserProfile, which skips post_save.
+# `profiles` is a list of (profile pk, user id) pairs.
+profiles_bulk_updated = Signal()
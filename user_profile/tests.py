@@ -1,3 +1,681 @@
-from django.test import TestCase
+import importlib.util
+import json
+import shutil
+import socket
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from oauth2_provider.models import AccessToken, Application, RefreshToken
+from PIL import Image
+
+from task.models import TaskCategory
+from task.serializers import TaskProfileSerializer
+from task.tests import create_profile
+from user_profile.management.commands.benchmark_login import Command as BenchmarkLogin, seed_login
+from user_profile.management.commands.benchmark_uploads import Command as BenchmarkUploads, write_body
+from user_profile.authentication import token_timeout, user_namespace
+from user_profile.email import EMAIL_SETTINGS, SMTPSession, Util, drain_queue, ssl_context
+from user_profile.models import OutgoingEmail, ReportImage, UserProfile, UserReport
+from user_profile.payload import user_key
+
+
+class ProfilePayloadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.profile = create_profile("me", profile_photo="images/profiles/me.jpg")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+        self.url = reverse('api:profile')
+
+    def get_profile(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(self.url, params)
+        self.assertEqual(res.status_code, 200)
+        return res.data, len(ctx.captured_queries)
+
+    def test_one_query_cold_none_warm(self):
+        data, cold = self.get_profile()
+        self.assertEqual(cold, 1)
+        self.assertEqual(data['profilePk'], str(self.profile.pk))
+        self.assertEqual(data['profilePhoto'], "http://testserver/media/images/profiles/me.jpg")
+        self.assertEqual(self.get_profile(), (data, 0))
+
+    def test_saves_invalidate(self):
+        self.get_profile()
+        self.get_profile(user_profile_id=self.profile.pk)
+
+        self.profile.address = "Daraga"
+        self.profile.save()
+        self.assertEqual(self.get_profile()[0]['address'], "Daraga")
+        self.assertEqual(self.get_profile(user_profile_id=self.profile.pk)[0]['address'], "Daraga")
+
+        self.profile.user.first_name = "Renamed"
+        self.profile.user.save()
+        self.assertEqual(self.get_profile()[0]['firstName'], "Renamed")
+        self.assertEqual(self.get_profile(user_profile_id=self.profile.pk)[0]['firstName'], "Renamed")
+
+    def test_patch_returns_fresh_payload(self):
+        res = self.client.patch(self.url, {'user': {
+            'email': "new@example.com", 'first_name': "New", 'last_name': "Name",
+            'birthdate': "01/31/2000", 'address': "Albay", 'contact_number': "0917", 'gender': "F",
+        }}, format='json')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['birthdate'], "2000-01-31")
+        data, queries = self.get_profile()
+        self.assertEqual((data['email'], queries), ("new@example.com", 0))
+
+    def test_missing_profiles(self):
+        self.assertEqual(self.client.get(self.url, {'user_profile_id': 999}).status_code, 404)
+        self.profile.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+
+class SuspensionExpiryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        past = timezone.now() - timedelta(hours=1)
+        self.expired = [create_profile(f"expired{i}", is_suspended=True, suspension_reason="Spam", suspended_until=past) for i in range(3)]
+        self.active = create_profile("active", is_suspended=True, suspension_reason="Spam",
+                                     suspended_until=timezone.now() + timedelta(days=1))
+        self.indefinite = create_profile("indefinite", is_suspended=True, suspension_reason="Fraud")
+
+    def test_is_active_does_not_write(self):
+        with CaptureQueriesContext(connection) as ctx:
+            states = [profile.is_active() for profile in (*self.expired, self.active, self.indefinite)]
+        self.assertEqual(states, [True, True, True, False, False])
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertTrue(UserProfile.objects.get(pk=self.expired[0].pk).is_suspended)
+
+    def test_expired_suspension_does_not_block_task_creation(self):
+        client = APIClient()
+        client.force_authenticate(self.expired[0].user)
+        category = TaskCategory.objects.create(title="Repair")
+        with CaptureQueriesContext(connection) as ctx:
+            res = client.post(reverse('api:provider-list'), {
+                'task_category_id': category.pk, 'title': "Fix", 'description': "Fence",
+                'address': "Albay", 'latitude': 13.1, 'longitude': 123.7,
+            })
+        self.assertEqual(res.status_code, 201, res.data)
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "user_profile_userprofile"')])
+
+    def test_sweep_updates_in_batches(self):
+        client = APIClient()
+        client.force_authenticate(self.expired[0].user)
+        client.get(reverse('api:profile'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(UserProfile.expire_suspensions(batch_size=2), 3)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(set(UserProfile.objects.filter(is_suspended=True).values_list('pk', flat=True)),
+                         {self.active.pk, self.indefinite.pk})
+        # The cached payload was dropped with the bulk update
+        self.assertIsNone(cache.get(user_key(self.expired[0].user_id)))
+
+    def test_command(self):
+        out = StringIO()
+        call_command("expire_suspensions", once=True, stdout=out)
+        self.assertIn("Lifted 3", out.getvalue())
+
+    def test_payload_reports_expiry_before_the_sweep(self):
+        client = APIClient()
+        client.force_authenticate(self.expired[0].user)
+        data = client.get(reverse('api:profile')).data
+        self.assertEqual((data['is_suspended'], data['suspended_until']), (False, None))
+        client.force_authenticate(self.active.user)
+        self.assertTrue(client.get(reverse('api:profile')).data['is_suspended'])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.body = seed_login()
+        self.url = reverse('token')
+
+    def login(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(self.url, self.body, content_type='application/json')
+        self.assertEqual(res.status_code, 200, res.content)
+        return res.json(), [q['sql'] for q in ctx.captured_queries]
+
+    def test_response_built_from_issued_token(self):
+        data, queries = self.login()
+        token = AccessToken.objects.get()
+        self.assertEqual(data['access_token'], token.token)
+        self.assertEqual(data['refresh_token'], RefreshToken.objects.get().token)
+        self.assertEqual((data['username'], data['firstName']), ("bench", "Bench"))
+        # No lookup of the token just created, the profile comes with its user
+        self.assertFalse([sql for sql in queries if sql.startswith('SELECT') and '"oauth2_provider_accesstoken"' in sql])
+        profile_reads = [sql for sql in queries if 'FROM "user_profile_userprofile"' in sql]
+        self.assertEqual(len(profile_reads), 1)
+        self.assertIn('JOIN "auth_user"', profile_reads[0])
+
+        # Warm payload: no profile query at all
+        _, queries = self.login()
+        self.assertFalse([sql for sql in queries if 'FROM "user_profile_userprofile"' in sql])
+
+    def test_multipart_login(self):
+        for url in (self.url, reverse('oauth2_provider:token')):
+            res = self.client.post(url, json.loads(self.body))
+            self.assertEqual(res.status_code, 200, res.content)
+            self.assertIn('access_token', res.json())
+
+    def test_missing_profile(self):
+        UserProfile.objects.all().delete()
+        res = self.client.post(self.url, self.body, content_type='application/json')
+        self.assertEqual(res.status_code, 400)
+
+    def test_benchmark(self):
+        # The command itself seeds a throwaway database, run its loop on ours
+        out = StringIO()
+        BenchmarkLogin(stdout=out).run_logins(self.body, 3)
+        self.assertIn("Logins/sec", out.getvalue())
+
+
+@override_settings(AUTH_TOKEN_CACHE_ENABLED=True)
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['auth_tokens'].clear()
+        self.profile = create_profile("me")
+        self.profile.user.set_password("old-password1")
+        self.profile.user.save()
+        application = Application.objects.create(
+            name="App", client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD,
+        )
+        self.token = AccessToken.objects.create(
+            user=self.profile.user, application=application, token="secret-token",
+            expires=timezone.now() + timedelta(minutes=10), scope="read write",
+        )
+        self.client = APIClient(HTTP_AUTHORIZATION="Bearer secret-token")
+
+    def token_lookups(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(reverse('api:profile'))
+        lookups = [q['sql'] for q in ctx.captured_queries if '"oauth2_provider_accesstoken"' in q['sql']]
+        return res.status_code, len(lookups)
+
+    def warm(self):
+        # The first hit only records whose token it is, the next is cached
+        self.token_lookups()
+        self.token_lookups()
+        self.assertEqual(self.token_lookups(), (200, 0))
+
+    def test_repeat_requests_skip_the_lookup(self):
+        self.assertEqual(self.token_lookups(), (200, 1))
+        self.warm()
+
+    def test_revoke(self):
+        self.warm()
+        self.token.revoke()
+        self.assertEqual(self.token_lookups(), (401, 1))
+
+    def test_password_change(self):
+        self.warm()
+        res = self.client.put(reverse('api:change-password'), {
+            'old_password': "old-password1", 'new_password': "new-password1",
+        })
+        self.assertEqual(res.status_code, 200, res.data)
+        self.assertEqual(self.token_lookups(), (200, 1))
+
+    def test_suspension(self):
+        self.warm()
+        self.profile.is_suspended = True
+        self.profile.save()
+        self.assertEqual(self.token_lookups(), (200, 1))
+        self.warm()
+        UserProfile.objects.filter(pk=self.profile.pk).update(suspended_until=timezone.now() - timedelta(minutes=1))
+        UserProfile.expire_suspensions()
+        self.assertEqual(self.token_lookups(), (200, 1))
+
+    def test_any_version_change_invalidates(self):
+        self.warm()
+        # A bump from a host whose clock is behind still moves the version
+        cache.set(f"version:{user_namespace(self.profile.user.pk)}", 1, None)
+        self.assertEqual(self.token_lookups(), (200, 1))
+        self.assertEqual(self.token_lookups(), (200, 0))
+
+    def test_not_used_without_a_shared_cache(self):
+        self.warm()
+        with override_settings(AUTH_TOKEN_CACHE_ENABLED=False):
+            self.assertEqual(self.token_lookups(), (200, 1))
+
+    def test_entries_never_outlive_the_token(self):
+        self.token.expires = timezone.now() + timedelta(seconds=30)
+        self.assertLessEqual(token_timeout(self.token), 30)
+        self.token.expires = timezone.now() - timedelta(seconds=1)
+        self.assertLessEqual(token_timeout(self.token), 0)
+
+
+class RecordingSMTPHandler:
+    # aiosmtpd handler: bounce@ is refused for good, busy@ for now
+    def __init__(self):
+        self.envelopes = []
+        self.sessions = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("bounce@"):
+            return "550 No such user"
+        if address.startswith("busy@"):
+            return "451 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.envelopes.append(envelope)
+        return "250 Message accepted"
+
+
+@skipUnless(importlib.util.find_spec("aiosmtpd"), "aiosmtpd is required")
+class EmailQueueTests(TestCase):
+    def setUp(self):
+        from aiosmtpd.controller import Controller
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.handler = RecordingSMTPHandler()
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=port)
+        self.controller.start()
+        self.addCleanup(self.controller.stop)
+
+        overrides = self.settings(EMAIL_HOST="127.0.0.1", EMAIL_PORT=port, EMAIL_USE_TLS=False, EMAIL_HOST_USER="")
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch.dict(EMAIL_SETTINGS, RATE_LIMIT=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = SMTPSession()
+        self.addCleanup(self.session.close)
+
+    def test_password_reset_only_queues(self):
+        create_profile("me")
+        res = self.client.post(reverse('api:forgot-password '), {'email_address': "me@example.com"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.handler.sessions, 0)
+
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.recipients, email.status), (["me@example.com"], OutgoingEmail.PENDING))
+        self.assertEqual(drain_queue(self.session), 1)
+        message = self.handler.envelopes[0].content.decode()
+        self.assertIn("multipart/alternative", message)
+        self.assertIn("Reset Your E-Tugal Password", message)
+
+    def test_one_session_for_many_messages(self):
+        for i in range(5):
+            Util.send_email_with_certifi("Registration", f"Message {i}", "noreply@example.com", [f"user{i}@example.com"])
+        self.assertEqual(drain_queue(self.session), 5)
+        self.assertEqual(drain_queue(self.session), 0)
+        self.assertEqual((len(self.handler.envelopes), self.handler.sessions), (5, 1))
+        self.assertFalse(OutgoingEmail.objects.exclude(status=OutgoingEmail.SENT).exists())
+
+        # A session the server dropped is reopened once
+        self.session.connection.close()
+        Util.send_email_with_certifi("Registration", "Again", "noreply@example.com", ["user@example.com"])
+        self.assertEqual(drain_queue(self.session), 1)
+        self.assertEqual((len(self.handler.envelopes), self.session.connects), (6, 2))
+
+    def test_refusals_and_retries(self):
+        for address in ("bounce@example.com", "busy@example.com", "ok@example.com"):
+            Util.send_email_with_certifi("Registration", "Hello", "noreply@example.com", [address])
+        self.assertEqual(drain_queue(self.session), 3)
+
+        statuses = dict(OutgoingEmail.objects.values_list('recipients__0', 'status'))
+        self.assertEqual(statuses, {
+            "bounce@example.com": OutgoingEmail.FAILED,
+            "busy@example.com": OutgoingEmail.PENDING,
+            "ok@example.com": OutgoingEmail.SENT,
+        })
+        retry = OutgoingEmail.objects.get(status=OutgoingEmail.PENDING)
+        self.assertEqual(retry.attempts, 1)
+        self.assertGreater(retry.next_attempt_at, timezone.now())
+        # Not due yet
+        self.assertEqual(drain_queue(self.session), 0)
+
+    def test_rate_limit(self):
+        for i in range(4):
+            Util.send_email_with_certifi("Registration", "Hello", "noreply@example.com", [f"user{i}@example.com"])
+        with mock.patch.dict(EMAIL_SETTINGS, RATE_LIMIT=20):
+            started = time.monotonic()
+            drain_queue(self.session)
+        self.assertGreaterEqual(time.monotonic() - started, 3 / 20)
+
+    def test_ssl_context_built_once(self):
+        self.assertIs(ssl_context(), ssl_context())
+
+
+class BulkModerationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin)
+        self.profiles = [create_profile(f"spam{i}") for i in range(30)]
+        reporter = create_profile("reporter").user
+        self.reports = [
+            UserReport.objects.create(reporter=reporter, reported_user=profile.user, reason=f"Spam {i % 2}",
+                                      suspension_duration='1_week')
+            for i, profile in enumerate(self.profiles)
+        ]
+
+    def run_action(self, model, action, objects):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(reverse(f'admin:user_profile_{model}_changelist'), {
+                'action': action, '_selected_action': [obj.pk for obj in objects],
+            })
+        self.assertEqual(res.status_code, 302)
+        return [q['sql'] for q in ctx.captured_queries]
+
+    def test_profile_actions_update_in_bulk(self):
+        queries = self.run_action('userprofile', 'suspend_1_week', self.profiles)
+        self.assertEqual(len([sql for sql in queries if sql.startswith('UPDATE "user_profile_userprofile"')]), 1)
+        self.assertLess(len(queries), 15)
+        suspended = UserProfile.objects.filter(is_suspended=True, suspension_reason="Admin Suspension")
+        self.assertEqual(suspended.count(), 30)
+        self.assertEqual(OutgoingEmail.objects.filter(subject='Account Suspension').count(), 30)
+        self.assertIn("for 1 Week", OutgoingEmail.objects.first().body)
+
+        queries = self.run_action('userprofile', 'terminate_user', self.profiles[:5])
+        self.assertEqual(UserProfile.objects.filter(is_terminated=True).count(), 5)
+        self.assertLess(len(queries), 15)
+
+    def test_report_actions_update_in_bulk(self):
+        client = APIClient()
+        client.force_authenticate(self.profiles[0].user)
+        client.get(reverse('api:profile'))
+
+        queries = self.run_action('userreport', 'resolve_as_suspension', self.reports)
+        updates = [sql for sql in queries if sql.startswith('UPDATE')]
+        # The reports, then one per distinct reason
+        self.assertEqual(len(updates), 3)
+        self.assertLess(len(queries), 20)
+
+        self.assertFalse(UserReport.objects.filter(status='pending').exists())
+        profile = UserProfile.objects.get(pk=self.profiles[1].pk)
+        self.assertEqual(profile.suspension_reason, "Suspended due to report: Spam 1")
+        self.assertAlmostEqual(profile.suspended_until, timezone.now() + timedelta(weeks=1), delta=timedelta(minutes=1))
+        self.assertEqual(OutgoingEmail.objects.filter(subject='Account Suspension').count(), 30)
+        # Cached payloads were dropped
+        self.assertTrue(client.get(reverse('api:profile')).data['is_suspended'])
+
+        # Already resolved reports are left alone
+        queries = self.run_action('userreport', 'resolve_as_termination', self.reports)
+        self.assertFalse(UserProfile.objects.filter(is_terminated=True).exists())
+
+
+class VerificationTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin)
+        self.profiles = [create_profile(f"applicant{i}", verification_status=UserProfile.PROCESSING_APPLICATION)
+                         for i in range(20)]
+
+    def test_tracks_loaded_values(self):
+        profile = UserProfile.objects.get(pk=self.profiles[0].pk)
+        self.assertFalse(profile.has_changed('verification_status'))
+        profile.verification_status = UserProfile.VERIFIED
+        self.assertTrue(profile.has_changed('verification_status'))
+        self.assertEqual(profile.loaded_value('verification_status'), UserProfile.PROCESSING_APPLICATION)
+        profile.save()
+        self.assertFalse(profile.has_changed('verification_status'))
+
+        deferred = UserProfile.objects.only('pk').get(pk=profile.pk)
+        self.assertFalse(deferred.has_changed('verification_status'))
+
+    def test_save_model_reads_once_and_emails_after_commit(self):
+        profile = self.profiles[0]
+        url = reverse('admin:user_profile_userprofile_change', args=[profile.pk])
+        form = {
+            'user': profile.user_id, 'birthdate': "2000-01-31", 'address': profile.address,
+            'contact_number': profile.contact_number,
+            'gender': profile.gender, 'verification_status': UserProfile.REJECTED,
+            'verification_remarks': "Blurry ID",
+        }
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(url, form)
+        self.assertEqual(res.status_code, 302)
+        self.assertFalse(OutgoingEmail.objects.exists())
+        for callback in callbacks:
+            callback()
+        # The change form's load, the other read is the form's unique check on user
+        reads = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT "user_profile_userprofile"."id"')]
+        self.assertEqual(len(reads), 1)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.recipients, ["applicant0@example.com"])
+        self.assertIn("Blurry ID", email.body)
+
+        # Saving again with the same status sends nothing
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, form)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+    def test_verify_selected(self):
+        UserProfile.objects.filter(pk=self.profiles[0].pk).update(verification_status=UserProfile.VERIFIED)
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(reverse('admin:user_profile_userprofile_changelist'), {
+                'action': 'verify_selected', '_selected_action': [profile.pk for profile in self.profiles],
+            })
+        self.assertEqual(res.status_code, 302)
+        self.assertLess(len(ctx.captured_queries), 15)
+        self.assertEqual(UserProfile.objects.filter(verification_status=UserProfile.VERIFIED).count(), 20)
+        # Only the 19 that weren't verified yet hear about it
+        self.assertEqual(OutgoingEmail.objects.filter(subject='Registration').count(), 19)
+
+
+def photo_upload(name="photo.jpg", size=(1600, 1200)):
+    # A JPEG with GPS and rotation in its EXIF, like a phone upload
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees
+    exif[0x8825] = {1: 'N', 2: (13.0, 8.0, 20.0)}  # GPSInfo
+    buffer = BytesIO()
+    Image.new("RGB", size, "red").save(buffer, format="JPEG", exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+class MediaPipelineTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        # static.serve streams the files with DEBUG on only
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_ACCEL_REDIRECT='', DEBUG=True)
+        self.settings_override.enable()
+        self.profile = create_profile("me")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, **files):
+        res = self.client.patch(reverse('api:upload-photo', args=[self.profile.pk]), files, format='multipart')
+        self.assertEqual(res.status_code, 200, res.data)
+        self.profile.refresh_from_db()
+        return res
+
+    def test_upload_is_stripped_and_resized(self):
+        self.upload(profile_photo=photo_upload())
+
+        with self.profile.profile_photo.open() as file:
+            original = Image.open(file)
+            # Rotated as EXIF said, then the EXIF is gone
+            self.assertEqual((original.format, original.size), ("JPEG", (1200, 1600)))
+            self.assertEqual(dict(original.getexif()), {})
+
+        variants = self.profile.photo_variants['profile_photo']
+        self.assertEqual(set(variants), {'thumb', 'small', 'medium'})
+        with self.profile.profile_photo.storage.open(variants['small']) as file:
+            small = Image.open(file)
+            self.assertEqual((small.format, small.size), ("WEBP", (240, 320)))
+
+    def test_lists_get_the_small_variant(self):
+        self.upload(profile_photo=photo_upload())
+        data = TaskProfileSerializer(self.profile).data
+        self.assertTrue(data['profile_photo'].endswith('_small.webp'), data['profile_photo'])
+        self.assertNotIn('photo_variants', data)
+
+    def test_replaced_variants_are_deleted(self):
+        storage = self.profile.profile_photo.storage
+        self.upload(profile_photo=photo_upload())
+        old = self.profile.photo_variants['profile_photo']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(profile_photo=photo_upload("other.jpg"))
+        self.assertFalse(any(storage.exists(name) for name in old.values()))
+        self.assertTrue(all(storage.exists(name) for name in self.profile.photo_variants['profile_photo'].values()))
+
+    def test_media_is_served_with_cache_headers(self):
+        self.upload(profile_photo=photo_upload())
+        url = self.profile.photo_url('profile_photo', 'thumb')
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('max-age=', res['Cache-Control'])
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+    def test_nginx_sends_the_file(self):
+        with override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            res = self.client.get('/media/images/profiles/me_small.webp')
+        self.assertEqual(res['X-Accel-Redirect'], '/protected-media/images/profiles/me_small.webp')
+        self.assertEqual(res['Content-Type'], 'image/webp')
+        self.assertEqual(res.content, b'')
+
+    def test_media_is_not_streamed_without_debug(self):
+        self.upload(profile_photo=photo_upload())
+        with override_settings(DEBUG=False):
+            res = self.client.get(self.profile.photo_url('profile_photo', 'thumb'))
+        self.assertEqual(res.status_code, 404)
+
+    def test_id_photos_are_private_to_their_owner(self):
+        self.upload(id_photo=photo_upload(), face_photo=photo_upload("face.jpg"))
+        urls = [self.profile.id_photo.url, self.profile.face_photo.url, self.profile.photo_url('id_photo', 'thumb')]
+        for url in urls:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, 200, url)
+            self.assertIn('private', res['Cache-Control'])
+            self.assertNotIn('public', res['Cache-Control'])
+
+        other = APIClient()
+        other.force_authenticate(create_profile("other").user)
+        staff = APIClient()
+        staff.force_authenticate(User.objects.create(username="staff", is_staff=True))
+        for url in urls:
+            self.assertIn(APIClient().get(url).status_code, (401, 403), url)
+            self.assertEqual(other.get(url).status_code, 404, url)
+            self.assertEqual(staff.get(url).status_code, 200, url)
+        # Not reachable through the public prefix either
+        climbed = '/media/images/profiles/../ids/' + self.profile.id_photo.name.rsplit('/', 1)[-1]
+        self.assertIn(APIClient().get(climbed).status_code, (401, 403))
+        self.assertEqual(other.get(climbed).status_code, 404)
+
+    def test_variants_are_built_for_old_uploads(self):
+        self.upload(profile_photo=photo_upload())
+        UserProfile.objects.filter(pk=self.profile.pk).update(photo_variants={})
+        out = StringIO()
+        call_command('build_photo_variants', stdout=out)
+        self.profile.refresh_from_db()
+        self.assertIn("Built variants for 1 profile(s).", out.getvalue())
+        self.assertEqual(set(self.profile.photo_variants['profile_photo']), {'thumb', 'small', 'medium'})
+
+
+class StreamingUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.reporter = create_profile("reporter").user
+        self.reported = create_profile("reported").user
+        application = Application.objects.create(
+            name="App", user=self.reporter, client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD,
+        )
+        self.token = AccessToken.objects.create(
+            user=self.reporter, application=application, token="upload-token",
+            expires=timezone.now() + timedelta(hours=1), scope="read write",
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token.token}")
+        self.url = reverse('api:user-report-create')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def report(self, *images):
+        data = {'reported_user': self.reported.pk, 'reason': "Spam", 'images': list(images)}
+        return self.client.post(self.url, data, format='multipart')
+
+    def test_duplicates_are_stored_once(self):
+        first, again, other = photo_upload("a.jpg"), photo_upload("b.jpg"), photo_upload("c.jpg", size=(10, 10))
+        self.assertEqual(self.report(first, again, other).status_code, 201)
+        report = UserReport.objects.get()
+        names = sorted(image.image.name for image in report.images.all())
+        self.assertEqual(len(names), 2)
+        self.assertTrue(all(name.startswith('report_images/') and name.endswith('.jpg') for name in names))
+
+        # Another report of the same picture points at the same file
+        self.assertEqual(self.report(photo_upload("d.jpg")).status_code, 201)
+        self.assertEqual(ReportImage.objects.values('image').distinct().count(), 2)
+
+    def test_large_files_are_spooled_to_disk(self):
+        with override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1024, DATA_UPLOAD_MAX_MEMORY_SIZE=1024):
+            res = self.report(photo_upload())
+        self.assertEqual(res.status_code, 201, res.data)
+        image = ReportImage.objects.get()
+        with image.image.open() as file:
+            self.assertEqual(Image.open(file).size, (1600, 1200))
+
+    def test_non_images_are_rejected(self):
+        fake = SimpleUploadedFile("notes.jpg", b"#!/bin/sh\necho hello\n", content_type="image/jpeg")
+        res = self.report(photo_upload(), fake)
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("notes.jpg", res.data['error_message'][0])
+        self.assertFalse(UserReport.objects.exists())
+
+    def test_oversized_images_are_rejected(self):
+        with override_settings(MAX_IMAGE_UPLOAD_SIZE=1024):
+            res = self.report(photo_upload())
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.data['error_message'][0], "photo.jpg: larger than 1.0\xa0KB")
+
+    def test_too_many_images(self):
+        res = self.report(*[photo_upload(f"{i}.jpg", size=(10 + i, 10)) for i in range(ReportImage.MAX_PER_REPORT + 1)])
+        self.assertEqual(res.status_code, 400)
+
+    def test_rows_are_created_in_one_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.report(*[photo_upload(f"{i}.jpg", size=(10 + i, 10)) for i in range(5)])
+        inserts = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('INSERT INTO "user_profile_reportimage"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ReportImage.objects.count(), 5)
+
+    def test_verification_photos_are_checked(self):
+        profile = UserProfile.objects.get(user=self.reporter)
+        fake = SimpleUploadedFile("face.jpg", b"GIF89a" + b"\0" * 3, content_type="image/jpeg")
+        res = self.client.patch(reverse('api:upload-photo', args=[profile.pk]), {'face_photo': fake}, format='multipart')
+        self.assertEqual(res.status_code, 400)
+
+    def test_benchmark_reports_peak_memory(self):
+        body = f"{self.media_root}/body"
+        write_body(body, self.reported.pk, images=3, size=64 * 1024, duplicates=1)
+        out = StringIO()
+        BenchmarkUploads(stdout=out).run_upload(body, self.token.token)
+        self.assertIn("Peak RSS growth:", out.getvalue())
+        self.assertIn("Stored images:   2", out.getvalue())
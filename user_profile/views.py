@@ -16,7 +16,9 @@ from datetime import (
 )
 from django.utils.crypto import get_random_string
 from django.conf import settings
+from core.uploads import StreamingUploadMixin
 from user_profile.models import UserProfile, UserReport
+from user_profile.payload import build_profile_payload, cache_profile_payload, get_profile_payload, profile_response
 from .serializers import (ChangePasswordSerializer, ProfileSerializer, RegisterSerializer,
                           UploadPhotoSerializer, ResetPasswordEmailRequestSerializer, UserReportSerializer)
 from django.utils.http import urlsafe_base64_encode
@@ -105,34 +107,15 @@ class RegisterView(generics.CreateAPIView):
         user.set_password(password)
         user.save()
         
-        birthdate = datetime.strptime(birthdate_str, "%m/%d/%Y")
+        birthdate = datetime.strptime(birthdate_str, "%m/%d/%Y").date()
 
         user_profile = UserProfile.objects.create(user=user, birthdate=birthdate, gender=gender, address=address, contact_number=contact_number)
         oauth_token, refresh_token = self.create_access_token(
             user)
-        data = {
-                "pk": str(user.pk),
-                "profilePk": str(user_profile.pk),
-                "username": user.username,
-                "firstName": user.first_name,
-                "lastName": user.last_name,
-                "email": user.email,
-                "contactNumber": user_profile.contact_number,
-                "birthdate": user_profile.birthdate,
-                "profilePhoto": request.build_absolute_uri(user_profile.profile_photo.url) if user_profile.profile_photo else None,
-                "idPhoto": request.build_absolute_uri(user_profile.id_photo.url) if user_profile.id_photo else None,
-                "address": user_profile.address,
-                "gender": user_profile.gender,
-                "verificationStatus": user_profile.verification_status,
-                "verificationRemarks": user_profile.verification_remarks,
-                "access_token": oauth_token.token,
-                "refresh_token": refresh_token.token,
-                "is_suspended": user_profile.is_suspended,
-                "suspension_reason": user_profile.suspension_reason,
-                "suspended_until": user_profile.suspended_until.isoformat() if user_profile.suspended_until else None,
-                "is_terminated": user_profile.is_terminated,
-                "termination_reason": user_profile.termination_reason,
-            }
+        data = profile_response(
+            request, build_profile_payload(user_profile),
+            access_token=oauth_token.token, refresh_token=refresh_token.token,
+        )
 
         return response.Response(
             data=data,
@@ -145,53 +128,28 @@ class ProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = ProfileSerializer
 
     def get(self, request, *args, **kwargs):
-        user = self.request.user
         user_profile_id = request.query_params.get('user_profile_id', None)
 
         if user_profile_id:
-            # Fetch the profile using the provided user_profile_id and override the user
+            # Fetch the profile using the provided user_profile_id
             try:
-                user_profile = UserProfile.objects.get(pk=user_profile_id)
-                user = user_profile.user  # Override user with the owner of the profile
-            except UserProfile.DoesNotExist:
+                payload = get_profile_payload(profile_pk=user_profile_id)
+            except (UserProfile.DoesNotExist, ValueError):
                 return response.Response(
                     {"error_message": "Profile not found."},
                     status=status.HTTP_404_NOT_FOUND
                 )
         else:
             # Default to using the current user's profile
-            user_profiles = UserProfile.objects.filter(user=user)
-            if user_profiles.exists():
-                user_profile = user_profiles.first()
-            else:
+            try:
+                payload = get_profile_payload(user_id=request.user.pk)
+            except UserProfile.DoesNotExist:
                 return response.Response(
                     {"error_message": "Please setup your profile."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-        # Prepare the response data
-        data = {
-            "pk": str(user.pk),
-            "profilePk": str(user_profile.pk),
-            "username": user.username,
-            "firstName": user.first_name,
-            "lastName": user.last_name,
-            "email": user.email,
-            "contactNumber": user_profile.contact_number,
-            "birthdate": user_profile.birthdate,
-            "profilePhoto": request.build_absolute_uri(user_profile.profile_photo.url) if user_profile.profile_photo else None,
-            "idPhoto": request.build_absolute_uri(user_profile.id_photo.url) if user_profile.id_photo else None,
-            "address": user_profile.address,
-            "gender": user_profile.gender,
-            "verificationStatus": user_profile.verification_status,
-            "verificationRemarks": user_profile.verification_remarks,
-            "is_suspended": user_profile.is_suspended,
-            "suspension_reason": user_profile.suspension_reason,
-            "suspended_until": user_profile.suspended_until.isoformat() if user_profile.suspended_until else None,
-            "is_terminated": user_profile.is_terminated,
-            "termination_reason": user_profile.termination_reason,
-        }
-
+        data = profile_response(request, payload)
         return response.Response(data, status=status.HTTP_200_OK)
 
     def patch(self, request, *args, **kwargs):
@@ -213,36 +171,17 @@ class ProfileView(generics.RetrieveUpdateAPIView):
         user.last_name = user_details['last_name']
         user.username = user_details['email']
         user.save()
-        birthdate = datetime.strptime(user_details['birthdate'], "%m/%d/%Y")
+        birthdate = datetime.strptime(user_details['birthdate'], "%m/%d/%Y").date()
 
         user_profile.birthdate = birthdate
         user_profile.address = user_details['address']
         user_profile.contact_number = user_details['contact_number']
         user_profile.gender = user_details['gender']
 
-        user_profile.save()
-
-        data = {
-            "pk": str(user.pk),
-            "profilePk": str(user_profile.pk),
-            "username": user.username,
-            "firstName": user.first_name,
-            "lastName": user.last_name,
-            "email": user.email,
-            "contactNumber": user_profile.contact_number,
-            "birthdate": user_profile.birthdate,
-            "profilePhoto": request.build_absolute_uri(user_profile.profile_photo.url) if user_profile.profile_photo else None,
-            "idPhoto": request.build_absolute_uri(user_profile.id_photo.url) if user_profile.id_photo else None,
-            "address": user_profile.address,
-            "gender": user_profile.gender,
-            "verificationStatus": user_profile.verification_status,
-            "verificationRemarks": user_profile.verification_remarks,
-            "is_suspended": user_profile.is_suspended,
-            "suspension_reason": user_profile.suspension_reason,
-            "suspended_until": user_profile.suspended_until.isoformat() if user_profile.suspended_until else None,
-            "is_terminated": user_profile.is_terminated,
-            "termination_reason": user_profile.termination_reason,
-        }
+        # Only the edited columns, the ratings are written by task.ratings alone
+        user_profile.save(update_fields=['birthdate', 'address', 'contact_number', 'gender'])
+
+        data = profile_response(request, cache_profile_payload(build_profile_payload(user_profile)))
         return response.Response(data, status=status.HTTP_200_OK)
 
     def get_serializer_context(self):
@@ -298,7 +237,7 @@ class ChangePasswordView(generics.UpdateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UploadPhotoView(generics.UpdateAPIView):
+class UploadPhotoView(StreamingUploadMixin, generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = UploadPhotoSerializer
     queryset = UserProfile.objects.all()
@@ -349,7 +288,7 @@ class RequestPasswordResetEmail(generics.CreateAPIView):
             status=status.HTTP_200_OK
         )
 
-class UserReportCreateView(generics.CreateAPIView):
+class UserReportCreateView(StreamingUploadMixin, generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     queryset = UserReport.objects.all()
     serializer_class = UserReportSerializer